@@ -30,11 +30,9 @@ fi
 ensure_dirs
 
 NEW_FILE="${DIR_QUEUED}/$(basename "$TASK_FILE")"
-mv "$TASK_FILE" "$NEW_FILE"
 
-# Update status and priority
-sed -i '' 's/^status: planned/status: queued/' "$NEW_FILE"
-sed -i '' "s/^priority: .*/priority: $PRIORITY/" "$NEW_FILE"
+# Move and update status and priority (atomic rewrite, see task_store.py)
+python3 "$SCRIPT_DIR/task_store.py" move "$TASK_ID" queued "priority=$PRIORITY" >/dev/null || exit 1
 
 echo "Task $TASK_ID approved and QUEUED with priority $PRIORITY."
 echo "File: $NEW_FILE"
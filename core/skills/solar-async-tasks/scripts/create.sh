@@ -1,12 +1,10 @@
 #!/bin/bash
 
-# Create a new draft task
+# Create a new draft task (file format and naming live in task_store.py)
 
 SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 source "$SCRIPT_DIR/task_lib.sh"
 
-ensure_dirs
-
 TITLE="$1"
 DESCRIPTION="$2"
 
@@ -15,23 +13,4 @@ if [ -z "$TITLE" ]; then
     exit 1
 fi
 
-ID=$(generate_id)
-FILENAME="$(build_task_filename "$DIR_DRAFTS" "$TITLE")"
-
-cat > "$FILENAME" <<EOF
----
-id: "$ID"
-title: "$TITLE"
-created: "$(date -Iseconds)"
-status: draft
-priority: normal
----
-
-# $TITLE
-
-$DESCRIPTION
-
-EOF
-
-echo "Task created: $FILENAME"
-echo "ID: $ID"
+exec python3 "$SCRIPT_DIR/task_store.py" create "$TITLE" "$DESCRIPTION"
@@ -5,9 +5,13 @@ execute_active.py — Python executor for solar-async-tasks.
 Handles I/O JSON with solar-router v3. Called by execute_active.sh.
 - Reads task file path and task metadata from arguments/env
 - Builds router v3 request (channel=async-task, mode=direct_only)
+- Calls the router in-process via RouterService (SOLAR_ROUTER_IN_PROCESS=false
+  falls back to spawning run_router.py)
 - Passes provider from task frontmatter if set (strict mode)
 - Parses router v3 JSON response
-- Writes structured log and returns exit code for lifecycle management
+- Writes structured log and returns exit code for lifecycle management; a large
+  result spilled by the router (reply_ref) is moved next to the log, not copied
+- Reads and moves the task file through task_store.TaskStore
 
 Usage:
     python3 execute_active.py <task_file> <router_script> <task_id> <title>
@@ -15,12 +19,20 @@ Usage:
 import json
 import os
 import pathlib
-import re
+import shutil
 import subprocess
 import sys
+import threading
 from datetime import datetime, timezone
 from typing import Any, Dict, Optional
 
+# Sibling modules must resolve when this file is loaded by path (importlib).
+_SCRIPTS_DIR = str(pathlib.Path(__file__).resolve().parent)
+if _SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, _SCRIPTS_DIR)
+
+from task_store import TaskStore, TaskStoreError, split_frontmatter  # noqa: E402
+
 
 def utc_now() -> str:
     return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
@@ -28,41 +40,14 @@ def utc_now() -> str:
 
 def read_frontmatter_key(task_file: pathlib.Path, key: str) -> str:
     """Extract a single frontmatter key value from a markdown file."""
-    in_fm = False
-    for line in task_file.read_text(encoding="utf-8").splitlines():
-        if line.strip() == "---":
-            if not in_fm:
-                in_fm = True
-                continue
-            else:
-                break
-        if in_fm and line.startswith(f"{key}:"):
-            value = line[len(f"{key}:"):].strip().strip('"')
-            return value
-    return ""
+    meta, _ = split_frontmatter(task_file.read_text(encoding="utf-8"))
+    return meta.get(key, "")
 
 
 def strip_frontmatter(task_file: pathlib.Path) -> str:
     """Return task body with frontmatter removed."""
-    lines = task_file.read_text(encoding="utf-8").splitlines()
-    in_fm = False
-    fm_done = False
-    body_lines = []
-    for line in lines:
-        if not fm_done:
-            if line.strip() == "---":
-                if not in_fm:
-                    in_fm = True
-                    continue
-                else:
-                    fm_done = True
-                    continue
-            elif not in_fm:
-                fm_done = True
-                body_lines.append(line)
-        else:
-            body_lines.append(line)
-    return "\n".join(body_lines).strip()
+    _, body = split_frontmatter(task_file.read_text(encoding="utf-8"))
+    return body.strip()
 
 
 def build_prompt(task_id: str, title: str, body: str) -> str:
@@ -76,6 +61,29 @@ def build_prompt(task_id: str, title: str, body: str) -> str:
     )
 
 
+def router_in_process() -> bool:
+    raw = os.getenv("SOLAR_ROUTER_IN_PROCESS", "true").strip().lower()
+    return raw not in {"0", "false", "no", "off"}
+
+
+def router_timeout_sec() -> int:
+    return int(
+        os.getenv("SOLAR_ROUTER_TIMEOUT_SEC")
+        or os.getenv("SOLAR_AI_ROUTER_TIMEOUT_SEC")
+        or "310"
+    )
+
+
+def load_router_service(router_script: pathlib.Path) -> Any:
+    """Import run_router.py from its own directory and build a RouterService."""
+    router_dir = str(router_script.resolve().parent)
+    if router_dir not in sys.path:
+        sys.path.insert(0, router_dir)
+    import run_router
+
+    return run_router.RouterService()
+
+
 def call_router(
     router_script: pathlib.Path,
     task_id: str,
@@ -86,13 +94,6 @@ def call_router(
     Call solar-router v3 with channel=async-task, mode=direct_only.
     Returns parsed router v3 response dict.
     """
-    router_python = os.getenv("SOLAR_AI_ROUTER_PYTHON", "python3")
-    timeout_sec = int(
-        os.getenv("SOLAR_ROUTER_TIMEOUT_SEC")
-        or os.getenv("SOLAR_AI_ROUTER_TIMEOUT_SEC")
-        or "310"
-    )
-
     payload: Dict[str, Any] = {
         "request_id": f"task_{task_id}",
         "session_id": f"task_{task_id}",
@@ -104,6 +105,29 @@ def call_router(
     if provider:
         payload["provider"] = provider
 
+    timeout_sec = router_timeout_sec()
+    if router_in_process():
+        service = load_router_service(router_script)
+        from provider_runner import Cancellation  # router dir is on sys.path now
+
+        # Same overall bound as the subprocess call: cancel the request (kills the provider) when it expires.
+        cancellation = Cancellation()
+        timer = threading.Timer(timeout_sec, cancellation.cancel)
+        timer.daemon = True
+        timer.start()
+        try:
+            response = service.handle(payload, cancellation=cancellation)
+        finally:
+            timer.cancel()
+        if cancellation.cancelled and response.get("error_code") == "cancelled":
+            response = {
+                **response,
+                "error_code": "router_timeout",
+                "error": f"router call timed out after {timeout_sec}s",
+            }
+        return response
+
+    router_python = os.getenv("SOLAR_AI_ROUTER_PYTHON", "python3")
     proc = subprocess.run(
         [router_python, str(router_script)],
         input=json.dumps(payload),
@@ -144,8 +168,23 @@ def write_log(
     result_text: str,
     error_text: Optional[str],
     error_code: Optional[str],
-) -> None:
+    result_ref: Optional[str] = None,
+) -> Optional[pathlib.Path]:
+    """
+    Write the execution log. `result_ref` is the router's spilled full output
+    (reply_ref path): it is moved to <log stem>.result instead of being
+    rewritten into the log, and the new path is returned.
+    """
     log_file.parent.mkdir(parents=True, exist_ok=True)
+    result_file: Optional[pathlib.Path] = None
+    if result_ref:
+        target = log_file.with_suffix(".result")
+        try:
+            shutil.move(result_ref, target)  # a rename unless the runtime is on another filesystem
+            result_file = target
+            result_text = result_text.replace(result_ref, str(target))
+        except OSError as exc:
+            result_text += f"\n\n[full output unavailable: {exc}]"
     lines = [
         "# Async Task Execution",
         "",
@@ -158,6 +197,8 @@ def write_log(
     ]
     if outcome == "success":
         lines += ["## Result", "", result_text]
+        if result_file is not None:
+            lines += ["", f"- result_file: {result_file}"]
     else:
         lines += [
             "## Error",
@@ -166,6 +207,7 @@ def write_log(
             f"- error: {error_text or 'unknown'}",
         ]
     log_file.write_text("\n".join(lines), encoding="utf-8")
+    return result_file
 
 
 def mark_task_error(
@@ -178,25 +220,31 @@ def mark_task_error(
     log_file: pathlib.Path,
 ) -> None:
     """Update task frontmatter status to error and move to error/ dir."""
-    content = task_file.read_text(encoding="utf-8")
-    content = re.sub(r"^status:.*$", "status: error", content, flags=re.MULTILINE)
     err_ts = utc_now()
-    content += (
-        f"\n\n## Execution Error\n"
-        f"- time: {err_ts}\n"
-        f"- provider_attempted: {provider_used or 'unknown'}\n"
-        f"- error_code: {error_code or 'unknown'}\n"
-        f"- error: {error_text}\n"
-    )
-    task_file.write_text(content, encoding="utf-8")
+    try:
+        # By path: the frontmatter id may be empty or shared with another task.
+        TaskStore(task_file.parent.parent).move_path(
+            task_file,
+            "error",
+            append=(
+                f"\n\n## Execution Error\n"
+                f"- time: {err_ts}\n"
+                f"- provider_attempted: {provider_used or 'unknown'}\n"
+                f"- error_code: {error_code or 'unknown'}\n"
+                f"- error: {error_text}\n"
+            ),
+        )
+        moved = True
+    except (TaskStoreError, OSError) as exc:
+        print(f"Error: could not move task to error/: {exc}", file=sys.stderr, flush=True)
+        moved = False
 
     write_log(log_file, task_id, title, "error", provider_used, "", error_text, error_code)
 
-    error_dir = task_file.parent.parent / "error"
-    error_dir.mkdir(parents=True, exist_ok=True)
-    dest = error_dir / task_file.name
-    task_file.rename(dest)
-    print(f"❌ Task execution failed and moved to error/: {task_id}", flush=True)
+    if moved:
+        print(f"❌ Task execution failed and moved to error/: {task_id}", flush=True)
+    else:
+        print(f"❌ Task execution failed (task left in place): {task_id}", flush=True)
     print(f"   Log: {log_file}", flush=True)
 
 
@@ -264,8 +312,14 @@ def main() -> int:
         )
         return 1
 
-    # Success: write log
-    write_log(log_file, task_id, title, "success", provider_used, reply_text, None, None)
+    # Success: write log (a spilled full result is moved into logs/)
+    reply_ref = response.get("reply_ref") or {}
+    result_file = write_log(
+        log_file, task_id, title, "success", provider_used, reply_text, None, None,
+        result_ref=reply_ref.get("path"),
+    )
+    if result_file is not None:
+        reply_text = reply_text.replace(reply_ref["path"], str(result_file))
     print(f"  → provider_used: {provider_used}", flush=True)
     # Output reply_text to stdout for execute_active.sh to capture if needed
     print(reply_text, flush=True)
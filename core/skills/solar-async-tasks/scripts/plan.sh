@@ -29,10 +29,9 @@ fi
 ensure_dirs
 
 NEW_FILE="${DIR_PLANNED}/$(basename "$TASK_FILE")"
-mv "$TASK_FILE" "$NEW_FILE"
 
-# Update status in frontmatter
-sed -i '' 's/^status: draft/status: planned/' "$NEW_FILE"
+# Move and update status in frontmatter (atomic rewrite, see task_store.py)
+python3 "$SCRIPT_DIR/task_store.py" move "$TASK_ID" planned >/dev/null || exit 1
 
 # Append planning template if not exists
 if ! grep -q "# Implementation Plan" "$NEW_FILE"; then
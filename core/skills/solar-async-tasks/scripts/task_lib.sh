@@ -3,6 +3,8 @@
 # Shared library for solar-async-tasks
 # Sourced by other scripts
 
+TASK_LIB_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+
 # Default Root: prefer (pwd)/sun/... when run from repo (e.g. LaunchAgent); else $HOME path
 if [[ -z "${SOLAR_TASK_ROOT:-}" ]]; then
   if [[ -d "$(pwd)/sun/runtime/async-tasks" ]]; then
@@ -40,7 +42,7 @@ setup_logging() {
 cleanup_old_logs() {
     [[ ! -d "$SOLAR_TASK_ROOT/logs" ]] && return 0
     local removed
-    removed=$(find "$SOLAR_TASK_ROOT/logs" -maxdepth 1 -type f -name '*.log' -mtime +7 -print -delete 2>/dev/null | wc -l | tr -d ' ')
+    removed=$(find "$SOLAR_TASK_ROOT/logs" -maxdepth 1 -type f \( -name '*.log' -o -name '*.result' \) -mtime +7 -print -delete 2>/dev/null | wc -l | tr -d ' ')
     if [[ -n "$removed" && "$removed" -gt 0 ]]; then
         log_msg "Cleaned $removed log(s) older than 7 days"
     fi
@@ -106,19 +108,11 @@ log_msg() {
     echo "[$(date +'%Y-%m-%d %H:%M:%S')] $1" >&2
 }
 
-# Find a task file by ID in all directories
+# Find a task file by ID in all directories (one python3 process instead of
+# grep/sed per task file; see task_store.py)
 find_task() {
     local task_id="$1"
-    local f id
-    for f in "$DIR_DRAFTS"/*.md "$DIR_PLANNED"/*.md "$DIR_QUEUED"/*.md "$DIR_ACTIVE"/*.md "$DIR_COMPLETED"/*.md "$DIR_ERROR"/*.md "$DIR_ARCHIVE"/*.md; do
-        [[ -e "$f" ]] || continue
-        id="$(extract_meta "$f" "id")"
-        if [[ "$id" == "$task_id" ]]; then
-            echo "$f"
-            break
-        fi
-    done
-    return 0
+    python3 "$TASK_LIB_DIR/task_store.py" path "$task_id" 2>/dev/null || true
 }
 
 # Get task status from file path
@@ -138,7 +132,16 @@ get_status() {
 extract_meta() {
     local file="$1"
     local key="$2"
-    ( grep "^$key:" "$file" 2>/dev/null || true ) | sed "s/^$key: //" | tr -d '"' | head -n1
+    local value
+    value="$( ( grep "^$key:" "$file" 2>/dev/null || true ) | head -n1 | sed "s/^$key: //")"
+    if [[ ${#value} -ge 2 && "$value" == \"*\" ]]; then
+        # Quoted value (task_store.quote_value): drop the quotes, undo \" and \\ escapes.
+        value="${value:1:${#value}-2}"
+        printf '%s\n' "$value" | sed -E 's/\\(["\\])/\1/g'
+    elif [[ -n "$value" ]]; then
+        printf '%s\n' "$value" | tr -d '"'
+    fi
+    return 0
 }
 
 # Extract created timestamp as epoch for sorting
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+task_store — in-process access to the solar-async-tasks filesystem queue.
+
+Tasks are markdown files with a YAML-like frontmatter block, one directory per
+state under SOLAR_TASK_ROOT (same layout and file format as task_lib.sh):
+
+    drafts/ planned/ queued/ active/ completed/ error/ archive/
+
+TaskStore.create/get/move/list return Task records instead of printed text.
+Every write goes through a temp file in the target directory followed by a
+rename, so readers never see a half-written task and new files never clobber
+an existing one.
+
+CLI (used by the shell scripts; JSON on stdout unless noted):
+    task_store.py create <title> [description]   "Task created: <path>" / "ID: <id>" (create.sh output)
+    task_store.py get <task_id>
+    task_store.py path <task_id>                 task file path, empty if not found (find_task)
+    task_store.py move <task_id> <status> [key=value ...]   also sets frontmatter keys
+    task_store.py list [status ...]
+"""
+import contextlib
+import json
+import os
+import pathlib
+import re
+import sys
+import tempfile
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional
+
+
+# status -> directory, in find_task search order
+STATUS_DIRS = {
+    "draft": "drafts",
+    "planned": "planned",
+    "queued": "queued",
+    "active": "active",
+    "completed": "completed",
+    "error": "error",
+    "archived": "archive",
+}
+
+
+class TaskStoreError(RuntimeError):
+    """Task not found, or not in the state an operation requires."""
+
+
+@dataclass
+class Task:
+    id: str
+    title: str
+    status: str
+    path: pathlib.Path
+    meta: Dict[str, str] = field(default_factory=dict)
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "id": self.id,
+            "title": self.title,
+            "status": self.status,
+            "path": str(self.path),
+            "meta": dict(self.meta),
+        }
+
+
+def task_root(cwd: Optional[pathlib.Path] = None) -> pathlib.Path:
+    """SOLAR_TASK_ROOT, else <cwd>/sun/runtime/async-tasks if present, else the $HOME default."""
+    raw = os.getenv("SOLAR_TASK_ROOT")
+    if raw:
+        return pathlib.Path(raw)
+    local = (cwd or pathlib.Path.cwd()) / "sun/runtime/async-tasks"
+    if local.is_dir():
+        return local
+    return pathlib.Path(os.getenv("HOME", "")) / "Sites/solar.ai/sun/runtime/async-tasks"
+
+
+def slugify(title: str) -> str:
+    slug = re.sub(r"[^a-z0-9]+", "-", title.lower()).strip("-")
+    return slug or "task"
+
+
+def _single_line(value: str) -> str:
+    # Frontmatter is line-oriented.
+    return " ".join(value.split())
+
+
+def quote_value(value: str) -> str:
+    """Frontmatter value as a JSON string: `"` and `\\` are escaped, so it round-trips."""
+    return json.dumps(value, ensure_ascii=False)
+
+
+def unquote_value(value: str) -> str:
+    """Inverse of quote_value; unquoted (or hand-written) values only lose their `"`."""
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            pass
+    return value.replace('"', "")
+
+
+def split_frontmatter(content: str) -> tuple[Dict[str, str], str]:
+    """(meta, body) for a task file; keys keep their first value, unquoted."""
+    lines = content.splitlines(keepends=True)
+    if not lines or lines[0].strip() != "---":
+        return {}, content
+    meta: Dict[str, str] = {}
+    for index in range(1, len(lines)):
+        line = lines[index].rstrip("\n")
+        if line.strip() == "---":
+            return meta, "".join(lines[index + 1:])
+        key, sep, value = line.partition(":")
+        if sep and key and key not in meta:
+            meta[key] = unquote_value(value.strip())
+    return meta, ""
+
+
+def update_frontmatter(content: str, updates: Dict[str, str]) -> str:
+    """Set `key: value` for each update: replace the existing line or add it before the closing `---`."""
+    lines = content.splitlines(keepends=True)
+    if not lines or lines[0].strip() != "---":
+        raise TaskStoreError("task file has no frontmatter")
+    pending = dict(updates)
+    for index in range(1, len(lines)):
+        line = lines[index]
+        if line.strip() == "---":
+            lines[index:index] = [f"{key}: {value}\n" for key, value in pending.items()]
+            return "".join(lines)
+        key = line.partition(":")[0]
+        if key in pending:
+            lines[index] = f"{key}: {pending.pop(key)}\n"
+    raise TaskStoreError("task file frontmatter is not closed")
+
+
+def _write_temp(directory: pathlib.Path, content: str) -> str:
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".task.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            fh.write(content)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp)
+        raise
+    return tmp
+
+
+class TaskStore:
+    """create/get/move/list over one SOLAR_TASK_ROOT."""
+
+    def __init__(self, root: Optional[pathlib.Path] = None) -> None:
+        self.root = task_root() if root is None else pathlib.Path(root)
+
+    def directory(self, status: str) -> pathlib.Path:
+        if status not in STATUS_DIRS:
+            raise TaskStoreError(f"unknown task status: {status}")
+        return self.root / STATUS_DIRS[status]
+
+    def ensure_dirs(self) -> None:
+        for name in (*STATUS_DIRS.values(), ".locks"):
+            (self.root / name).mkdir(parents=True, exist_ok=True)
+
+    def _basename_taken(self, base: str) -> bool:
+        if any((self.root / name / f"{base}.md").exists() for name in STATUS_DIRS.values()):
+            return True
+        return (self.root / "logs" / f"{base}.log").exists()
+
+    def _load(self, path: pathlib.Path, status: str) -> Task:
+        meta, _ = split_frontmatter(path.read_text(encoding="utf-8"))
+        return Task(
+            id=meta.get("id", ""),
+            title=meta.get("title", ""),
+            status=status,
+            path=path,
+            meta=meta,
+        )
+
+    def _iter(self, statuses: Iterable[str]) -> Iterator[Task]:
+        for status in statuses:
+            for path in sorted(self.directory(status).glob("*.md")):
+                try:
+                    yield self._load(path, status)
+                except OSError:
+                    continue  # moved by another process while listing
+
+    # -- operations ---------------------------------------------------------
+
+    def create(self, title: str, description: str = "", priority: str = "normal") -> Task:
+        """Write a new draft (create.sh format) under a unique slug of `title`."""
+        title = _single_line(title)
+        if not title:
+            raise TaskStoreError("task title is required")
+        self.ensure_dirs()
+        task_id = str(uuid.uuid4())
+        content = (
+            "---\n"
+            f'id: "{task_id}"\n'
+            f"title: {quote_value(title)}\n"
+            f'created: "{datetime.now().astimezone().isoformat(timespec="seconds")}"\n'
+            "status: draft\n"
+            f"priority: {priority}\n"
+            "---\n"
+            "\n"
+            f"# {title}\n"
+            "\n"
+            f"{description}\n"
+            "\n"
+        )
+        drafts = self.directory("draft")
+        tmp = _write_temp(drafts, content)
+        try:
+            slug = slugify(title)
+            n = 1
+            while True:
+                base = slug if n == 1 else f"{slug}-{n}"
+                n += 1
+                if self._basename_taken(base):
+                    continue
+                path = drafts / f"{base}.md"
+                try:
+                    os.link(tmp, path)  # atomic and never overwrites a concurrent create
+                except FileExistsError:
+                    continue
+                break
+        finally:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp)
+        return self._load(path, "draft")
+
+    def get(self, task_id: str) -> Optional[Task]:
+        for task in self._iter(STATUS_DIRS):
+            if task.id == task_id:
+                return task
+        return None
+
+    def list(self, statuses: Optional[Iterable[str]] = None) -> List[Task]:
+        return list(self._iter(STATUS_DIRS if statuses is None else statuses))
+
+    def move(
+        self,
+        task_id: str,
+        status: str,
+        expected: Optional[Iterable[str]] = None,
+        meta: Optional[Dict[str, str]] = None,
+        append: str = "",
+    ) -> Task:
+        """
+        Move a task to `status`, rewriting `status:` plus any `meta` keys and
+        appending `append` to the body. `expected` restricts the source states.
+        """
+        task = self.get(task_id)
+        if task is None:
+            raise TaskStoreError(f"task {task_id} not found")
+        return self._move(task, status, expected, meta, append)
+
+    def move_path(
+        self,
+        path: pathlib.Path,
+        status: str,
+        expected: Optional[Iterable[str]] = None,
+        meta: Optional[Dict[str, str]] = None,
+        append: str = "",
+    ) -> Task:
+        """move() for the task file at `path`, whatever (or however unique) its frontmatter id."""
+        path = pathlib.Path(path)
+        current = next(
+            (name for name, dirname in STATUS_DIRS.items() if path.parent == self.root / dirname),
+            None,
+        )
+        if current is None:
+            raise TaskStoreError(f"{path} is not in a task state directory under {self.root}")
+        try:
+            task = self._load(path, current)
+        except OSError as exc:
+            raise TaskStoreError(f"task file {path} not readable: {exc}") from exc
+        return self._move(task, status, expected, meta, append)
+
+    def _move(
+        self,
+        task: Task,
+        status: str,
+        expected: Optional[Iterable[str]],
+        meta: Optional[Dict[str, str]],
+        append: str,
+    ) -> Task:
+        if expected is not None and task.status not in set(expected):
+            raise TaskStoreError(
+                f"task {task.id or task.path.name} is in '{task.status}' state (expected: {', '.join(expected)})"
+            )
+        target_dir = self.directory(status)
+        target_dir.mkdir(parents=True, exist_ok=True)
+        content = update_frontmatter(
+            task.path.read_text(encoding="utf-8"),
+            {"status": status, **(meta or {})},
+        )
+        if append:
+            content += append
+        target = target_dir / task.path.name
+        tmp = _write_temp(target_dir, content)
+        try:
+            # The directory is the source of truth for state (get_status): move
+            # first, then swap in the rewritten content.
+            os.rename(task.path, target)
+            os.replace(tmp, target)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp)
+            raise
+        return self._load(target, status)
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+def main(argv: List[str]) -> int:
+    usage = "Usage: task_store.py create|get|path|move|list ..."
+    if not argv:
+        print(usage, file=sys.stderr)
+        return 1
+    command, args = argv[0], argv[1:]
+    store = TaskStore()
+    try:
+        if command == "create" and args:
+            task = store.create(args[0], args[1] if len(args) > 1 else "")
+            print(f"Task created: {task.path}")
+            print(f"ID: {task.id}")
+            return 0
+        if command in {"get", "path"} and len(args) == 1:
+            task = store.get(args[0])
+            if command == "path":
+                print(task.path if task else "")
+                return 0
+            if task is None:
+                print(f"Error: Task {args[0]} not found.", file=sys.stderr)
+                return 1
+            print(json.dumps(task.as_dict(), ensure_ascii=False))
+            return 0
+        if command == "move" and len(args) >= 2:
+            updates = dict(arg.split("=", 1) for arg in args[2:] if "=" in arg)
+            task = store.move(args[0], args[1], meta=updates)
+            print(json.dumps(task.as_dict(), ensure_ascii=False))
+            return 0
+        if command == "list":
+            tasks = store.list(args or None)
+            print(json.dumps([task.as_dict() for task in tasks], ensure_ascii=False))
+            return 0
+    except TaskStoreError as exc:
+        print(f"Error: {exc}", file=sys.stderr)
+        return 1
+    print(usage, file=sys.stderr)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -32,6 +32,17 @@ fi
 echo "Listing drafts..."
 bash core/skills/solar-async-tasks/scripts/list.sh | grep "$TASK_ID"
 
+# Titles with quotes and backslashes round-trip unchanged
+echo "Checking quoted title..."
+QUOTED_TITLE='Say "hi" \ again'
+QUOTED_OUT=$(bash core/skills/solar-async-tasks/scripts/create.sh "$QUOTED_TITLE" "Description")
+QUOTED_FILE=$(echo "$QUOTED_OUT" | sed -n 's/^Task created: //p')
+source core/skills/solar-async-tasks/scripts/task_lib.sh
+if [ "$(extract_meta "$QUOTED_FILE" title)" != "$QUOTED_TITLE" ]; then
+    echo "Failed: title did not round-trip: $(extract_meta "$QUOTED_FILE" title)"
+    exit 1
+fi
+
 # Plan
 echo "Planning task..."
 bash core/skills/solar-async-tasks/scripts/plan.sh "$TASK_ID"
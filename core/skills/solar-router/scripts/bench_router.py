@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+bench_router — latency / memory benchmarks for solar-router with fake providers.
+
+Usage:
+    python3 bench_router.py [--scenarios a,b,...] [--iterations N] [--quick] [--output FILE]
+    python3 bench_router.py --list
+
+Every scenario runs in a fresh Python process with its own runtime dir, so
+cold/warm state and peak RSS are measured per scenario. Provider CLIs are
+replaced through SOLAR_ROUTER_<PROVIDER>_CMD by this script in
+`fake-provider` mode, configured per provider with:
+
+    SOLAR_BENCH_<PROVIDER>_LATENCY_SEC   sleep before answering (default: 0)
+    SOLAR_BENCH_<PROVIDER>_OUTPUT_BYTES  size of reply_text (default: 200)
+    SOLAR_BENCH_<PROVIDER>_FAIL_RATE     probability of exit 1 (default: 0)
+    SOLAR_BENCH_<PROVIDER>_FORMAT        json (decision envelope) | text (default: json)
+
+Output is one JSON document: latency p50/p95/p99/mean/max in ms plus peak RSS
+(KiB) of the scenario process and of its children (fake providers, routers).
+Fake provider latency is 0 by default, so numbers are router overhead plus
+one fake process spawn.
+"""
+import json
+import os
+import pathlib
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+SCRIPT = pathlib.Path(__file__).resolve()
+SCRIPTS_DIR = SCRIPT.parent
+PROVIDERS = ("codex", "claude", "gemini")
+
+HISTORY_SIZES = (0, 1000, 10000, 50000)
+QUICK_HISTORY_SIZES = (0, 1000, 10000)
+LARGE_OUTPUT_BYTES = 1024 * 1024
+
+
+# ---------------------------------------------------------------------------
+# Fake provider CLI
+# ---------------------------------------------------------------------------
+
+def _fake_setting(provider: str, name: str, default: str) -> str:
+    return os.getenv(f"SOLAR_BENCH_{provider.upper()}_{name}") or default
+
+
+def fake_provider(provider: str) -> int:
+    """Stand-in for a provider CLI: consume the prompt, wait, answer or fail."""
+    if not sys.stdin.isatty():
+        sys.stdin.read()  # prompt delivered via stdin (argv delivery gets /dev/null)
+    latency = float(_fake_setting(provider, "LATENCY_SEC", "0"))
+    size = int(_fake_setting(provider, "OUTPUT_BYTES", "200"))
+    fail_rate = float(_fake_setting(provider, "FAIL_RATE", "0"))
+    fmt = _fake_setting(provider, "FORMAT", "json")
+    if latency > 0:
+        time.sleep(latency)
+    if fail_rate > 0 and random.random() < fail_rate:
+        print(f"{provider}: simulated failure", file=sys.stderr)
+        return 1
+    body = ("lorem ipsum \"dolor\" sit {amet}\n" * (size // 32 + 1))[:size]
+    if fmt == "json":
+        envelope = {"decision": {"kind": "direct_reply"}, "reply_text": body}
+        sys.stdout.write(json.dumps(envelope) + "\n")
+    else:
+        sys.stdout.write(body + "\n")
+    return 0
+
+
+def fake_cmd(provider: str) -> str:
+    # -S skips site initialisation: faster start-up, stdlib only.
+    return f"{sys.executable} -S {SCRIPT} fake-provider {provider}"
+
+
+# ---------------------------------------------------------------------------
+# Measurement helpers
+# ---------------------------------------------------------------------------
+
+def percentile(ordered: List[float], pct: float) -> float:
+    index = min(int(round(pct / 100.0 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def latency_stats(samples_sec: List[float]) -> Dict[str, float]:
+    ordered = sorted(s * 1000.0 for s in samples_sec)
+    return {
+        "p50": round(percentile(ordered, 50), 3),
+        "p95": round(percentile(ordered, 95), 3),
+        "p99": round(percentile(ordered, 99), 3),
+        "mean": round(sum(ordered) / len(ordered), 3),
+        "max": round(ordered[-1], 3),
+    }
+
+
+def measure(fn: Callable[[int], Any], iterations: int) -> List[float]:
+    samples = []
+    for i in range(iterations):
+        started = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def write_history(path: pathlib.Path, turns: int, text_bytes: int = 120) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    user = json.dumps({"role": "user", "text": "question " + "q" * text_bytes})
+    assistant = json.dumps({"role": "assistant", "text": "answer " + "a" * text_bytes})
+    with path.open("w", encoding="utf-8") as fh:
+        for _ in range(turns):
+            fh.write(user + "\n")
+            fh.write(assistant + "\n")
+
+
+# ---------------------------------------------------------------------------
+# Scenarios (each runs inside its own process, see run_scenario)
+# ---------------------------------------------------------------------------
+
+def _request(user_id: str, i: int, mode: str = "direct_only") -> Dict[str, Any]:
+    return {
+        "request_id": f"bench-{i}",
+        "user_id": user_id,
+        "text": f"benchmark message {i}",
+        "channel": "other",
+        "mode": mode,
+    }
+
+
+def _service():
+    import run_router  # noqa: E402 - env must be prepared before import
+
+    return run_router, run_router.RouterService()
+
+
+def _check(response: Dict[str, Any]) -> None:
+    if response.get("status") != "success":
+        raise RuntimeError(f"router failed: {response.get('error_code')}: {response.get('error')}")
+
+
+def scenario_cold_start(iterations: int, quick: bool) -> Dict[str, Any]:
+    """One `run_router.py` process per request (interpreter + import + provider)."""
+    router = str(SCRIPTS_DIR / "run_router.py")
+
+    def call(i: int) -> None:
+        proc = subprocess.run(
+            [sys.executable, router],
+            input=json.dumps(_request("cold", i)),
+            capture_output=True,
+            text=True,
+        )
+        _check(json.loads(proc.stdout))
+
+    return {"samples": measure(call, iterations)}
+
+
+def scenario_warm(iterations: int, quick: bool) -> Dict[str, Any]:
+    """In-process RouterService.handle with warm state."""
+    _, service = _service()
+    service.handle(_request("warm", -1))  # warm-up: resolve commands, start runner loop
+    return {"samples": measure(lambda i: _check(service.handle(_request("warm", i))), iterations)}
+
+
+def _scenario_history(turns: int) -> Callable[[int, bool], Dict[str, Any]]:
+    def scenario(iterations: int, quick: bool) -> Dict[str, Any]:
+        os.environ["SOLAR_ROUTER_SEGMENT_MAX_BYTES"] = "0"
+        _, service = _service()
+        user_id = f"history-{turns}"
+        write_history(service.conversation_file(user_id), turns)
+        samples = measure(lambda i: _check(service.handle(_request(user_id, i))), iterations)
+        return {"samples": samples, "params": {"history_turns": turns}}
+
+    scenario.__doc__ = f"In-process request on a conversation with {turns} turns of history (no rotation)."
+    return scenario
+
+
+def scenario_fallback_chain(iterations: int, quick: bool) -> Dict[str, Any]:
+    """codex and claude always fail, gemini answers; circuit breaker disabled."""
+    os.environ["SOLAR_ROUTER_CIRCUIT_FAILURES"] = "0"
+    os.environ["SOLAR_BENCH_CODEX_FAIL_RATE"] = "1"
+    os.environ["SOLAR_BENCH_CLAUDE_FAIL_RATE"] = "1"
+    _, service = _service()
+    samples = measure(lambda i: _check(service.handle(_request("fallback", i))), iterations)
+    return {"samples": samples, "params": {"failing": ["codex", "claude"]}}
+
+
+def scenario_fallback_breaker(iterations: int, quick: bool) -> Dict[str, Any]:
+    """As fallback_chain with the default circuit breaker: broken providers get skipped."""
+    os.environ["SOLAR_BENCH_CODEX_FAIL_RATE"] = "1"
+    os.environ["SOLAR_BENCH_CLAUDE_FAIL_RATE"] = "1"
+    _, service = _service()
+    samples = measure(lambda i: _check(service.handle(_request("breaker", i))), iterations)
+    return {"samples": samples, "params": {"failing": ["codex", "claude"]}}
+
+
+def scenario_auto_large_output(iterations: int, quick: bool) -> Dict[str, Any]:
+    """mode=auto with a 1 MiB JSON decision envelope from the provider."""
+    os.environ["SOLAR_BENCH_CODEX_OUTPUT_BYTES"] = str(LARGE_OUTPUT_BYTES)
+    _, service = _service()
+    samples = measure(lambda i: _check(service.handle(_request("auto", i, mode="auto"))), iterations)
+    return {"samples": samples, "params": {"output_bytes": LARGE_OUTPUT_BYTES}}
+
+
+def scenario_components(iterations: int, quick: bool) -> Dict[str, Any]:
+    """Direct timings of load_recent_messages, build_prompt and parse_ai_decision_output."""
+    run_router, service = _service()
+    from conversation_store import load_recent_messages  # noqa: E402
+
+    components: Dict[str, Any] = {}
+    for turns in QUICK_HISTORY_SIZES if quick else HISTORY_SIZES:
+        path = service.conversation_file(f"components-{turns}")
+        write_history(path, turns)
+        recent = load_recent_messages(path, service.context_turns) if turns else []
+        components[f"load_recent_messages[{turns}]"] = latency_stats(measure(
+            lambda i: load_recent_messages(path, service.context_turns), iterations
+        ))
+        components[f"build_prompt[{turns}]"] = latency_stats(measure(
+            lambda i: run_router.build_prompt(
+                service.system_prompt(), recent, "hello", "bench", "auto", "other"
+            ),
+            iterations,
+        ))
+    body = ("lorem ipsum \"dolor\" sit {amet}\n" * (LARGE_OUTPUT_BYTES // 32))
+    envelope = json.dumps({"decision": {"kind": "direct_reply"}, "reply_text": body})
+    outputs = {
+        "bare": envelope,
+        "fenced": f"```json\n{envelope}\n```",
+        "prose": f"Here you go {{draft}}:\n{envelope}\nLet me know {{more}}.",
+        "plain_text": body,
+    }
+    for label, output in outputs.items():
+        components[f"parse_ai_decision_output[{label},1MiB]"] = latency_stats(measure(
+            lambda i: run_router.parse_ai_decision_output(output), iterations
+        ))
+    return {"components": components}
+
+
+SCENARIOS: Dict[str, Callable[[int, bool], Dict[str, Any]]] = {
+    "cold_start": scenario_cold_start,
+    "warm": scenario_warm,
+    **{f"history_{turns}": _scenario_history(turns) for turns in HISTORY_SIZES},
+    "fallback_chain": scenario_fallback_chain,
+    "fallback_breaker": scenario_fallback_breaker,
+    "auto_large_output": scenario_auto_large_output,
+    "components": scenario_components,
+}
+
+
+def run_scenario(name: str, iterations: int, quick: bool) -> Dict[str, Any]:
+    """Scenario body in the child process: isolated runtime dir and fake providers."""
+    with tempfile.TemporaryDirectory(prefix="solar-bench-") as runtime:
+        os.environ["SOLAR_ROUTER_RUNTIME_DIR"] = runtime
+        os.environ["SOLAR_ROUTER_PROVIDER_PRIORITY"] = ",".join(PROVIDERS)
+        for provider in PROVIDERS:
+            os.environ[f"SOLAR_ROUTER_{provider.upper()}_CMD"] = fake_cmd(provider)
+        if str(SCRIPTS_DIR) not in sys.path:
+            sys.path.insert(0, str(SCRIPTS_DIR))
+        result = SCENARIOS[name](iterations, quick)
+    samples = result.pop("samples", None)
+    if samples:
+        result["iterations"] = len(samples)
+        result["latency_ms"] = latency_stats(samples)
+    result["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result["children_peak_rss_kb"] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Driver
+# ---------------------------------------------------------------------------
+
+def _arg_value(args: List[str], flag: str) -> Optional[str]:
+    if flag in args and args.index(flag) + 1 < len(args):
+        return args[args.index(flag) + 1]
+    return None
+
+
+def main() -> int:
+    args = sys.argv[1:]
+    if args[:1] == ["fake-provider"]:
+        return fake_provider(args[1])
+    if args[:1] == ["run-scenario"]:
+        result = run_scenario(args[1], int(args[2]), args[3:4] == ["quick"])
+        print(json.dumps(result))
+        return 0
+    if "--list" in args:
+        for name, fn in SCENARIOS.items():
+            print(f"{name:20} {(fn.__doc__ or '').strip()}")
+        return 0
+
+    quick = "--quick" in args
+    iterations = int(_arg_value(args, "--iterations") or ("5" if quick else "20"))
+    selected = (_arg_value(args, "--scenarios") or "").split(",") if "--scenarios" in args else [
+        name for name in SCENARIOS if not (quick and name == "history_50000")
+    ]
+    unknown = [name for name in selected if name not in SCENARIOS]
+    if unknown:
+        print(f"unknown scenario(s): {', '.join(unknown)}; see --list", file=sys.stderr)
+        return 2
+
+    report: Dict[str, Any] = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "iterations": iterations,
+            "quick": quick,
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "scenarios": {},
+    }
+    failed = False
+    for name in selected:
+        print(f"[bench] {name} ...", file=sys.stderr)
+        proc = subprocess.run(
+            [sys.executable, str(SCRIPT), "run-scenario", name, str(iterations)]
+            + (["quick"] if quick else []),
+            capture_output=True,
+            text=True,
+        )
+        if proc.returncode != 0:
+            failed = True
+            report["scenarios"][name] = {"error": proc.stderr.strip()[-2000:]}
+            continue
+        report["scenarios"][name] = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    output = json.dumps(report, indent=2)
+    target = _arg_value(args, "--output")
+    if target:
+        pathlib.Path(target).write_text(output + "\n", encoding="utf-8")
+    print(output)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,6 @@
 #!/bin/bash
 # check_router.sh — solar-router v3 smoke tests
-# Validates router contract v3, bridge delegation, and execute_active.py JSON parsing.
+# Validates router contract v3, bridge delegation, WS bridge cancellation, and execute_active.py JSON parsing.
 # Run from repo root: bash core/skills/solar-router/scripts/check_router.sh
 
 set -euo pipefail
@@ -216,6 +216,173 @@ else
     fail "parse_ai_decision_output valid JSON" "$parse_result"
 fi
 
+# ---------------------------------------------------------------------------
+# Test 11: WS bridge reads cancel frames while every connection slot is busy
+# ---------------------------------------------------------------------------
+echo ""
+echo "── Test 11: WS bridge cancels with every connection slot busy"
+BRIDGE_PY="$REPO_ROOT/core/skills/solar-transport-gateway/scripts/run_websocket_bridge.py"
+if ! $PYTHON -c "import websockets" 2>/dev/null; then
+    skip "WS bridge cancel with full slots" "websockets not installed"
+else
+    cancel_result="$(SOLAR_WS_CONNECTION_MAX_INFLIGHT=2 SOLAR_ROUTER_IN_PROCESS=true $PYTHON -c "
+import asyncio, importlib.util, json, time
+spec = importlib.util.spec_from_file_location('run_websocket_bridge', '$BRIDGE_PY')
+bridge = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(bridge)
+from websockets.client import connect
+from websockets.server import serve
+
+def call_router(payload, on_partial=None, cancellation=None):
+    # Stands in for a slow provider: runs until cancelled.
+    deadline = time.monotonic() + 10
+    while not cancellation.cancelled and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return bridge.failed_response(payload['request_id'], 'cancelled' if cancellation.cancelled else 'stuck', 'done')
+
+bridge.call_router = call_router
+
+def request(rid):
+    return json.dumps({'type': 'request', 'request_id': rid, 'session_id': rid, 'user_id': rid, 'text': 'hi'})
+
+async def main():
+    async with serve(bridge.handle_connection, '127.0.0.1', 0) as server:
+        port = server.sockets[0].getsockname()[1]
+        async with connect(f'ws://127.0.0.1:{port}{bridge.PATH}') as ws:
+            for rid in ('r0', 'r1', 'r2'):  # r0, r1 fill both slots; r2 queues
+                await ws.send(request(rid))
+            await asyncio.sleep(0.2)
+            for rid in ('r0', 'r2', 'r1'):
+                await ws.send(json.dumps({'type': 'cancel', 'request_id': rid}))
+            codes = {}
+            for _ in range(3):
+                frame = json.loads(await asyncio.wait_for(ws.recv(), 3))
+                codes[frame['request_id']] = frame['error_code']
+    assert codes == {'r0': 'cancelled', 'r1': 'cancelled', 'r2': 'cancelled'}, codes
+    print('ok')
+
+asyncio.run(main())
+" 2>&1 || echo "error")"
+    if [[ "$cancel_result" == "ok" ]]; then
+        pass "WS bridge: cancel frames reach running and queued requests with all slots busy"
+    else
+        fail "WS bridge cancel with full slots" "$cancel_result"
+    fi
+fi
+
+# ---------------------------------------------------------------------------
+# Test 12: WS bridge coalesces duplicate frames into one router call
+# ---------------------------------------------------------------------------
+echo ""
+echo "── Test 12: WS bridge coalesces identical in-flight frames"
+if ! $PYTHON -c "import websockets" 2>/dev/null; then
+    skip "WS bridge coalescing" "websockets not installed"
+else
+    coalesce_result="$(SOLAR_ROUTER_COALESCE=true SOLAR_ROUTER_IN_PROCESS=true $PYTHON -c "
+import asyncio, importlib.util, json, time
+spec = importlib.util.spec_from_file_location('run_websocket_bridge', '$BRIDGE_PY')
+bridge = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(bridge)
+from websockets.client import connect
+from websockets.server import serve
+
+calls = []
+
+def call_router(payload, on_partial=None, cancellation=None):
+    # Stands in for a provider call that takes a while.
+    calls.append(payload['request_id'])
+    time.sleep(0.3)
+    response = bridge.failed_response(payload['request_id'], None, None)
+    response.update(status='success', reply_text='hello')
+    return response
+
+bridge.call_router = call_router
+frame = json.dumps({'type': 'request', 'request_id': 'dup', 'session_id': 's', 'user_id': 'u', 'text': 'hi'})
+
+async def main():
+    async with serve(bridge.handle_connection, '127.0.0.1', 0) as server:
+        port = server.sockets[0].getsockname()[1]
+        async with connect(f'ws://127.0.0.1:{port}{bridge.PATH}') as ws:
+            await ws.send(frame)
+            await ws.send(frame)
+            frames = [json.loads(await asyncio.wait_for(ws.recv(), 3)) for _ in range(2)]
+    assert len(calls) == 1, calls
+    assert sorted(bool(f.get('coalesced')) for f in frames) == [False, True], frames
+    assert all(f['status'] == 'success' and f['request_id'] == 'dup' for f in frames), frames
+    print('ok')
+
+asyncio.run(main())
+" 2>&1 || echo "error")"
+    if [[ "$coalesce_result" == "ok" ]]; then
+        pass "WS bridge: two identical frames make one router call, the second coalesced"
+    else
+        fail "WS bridge coalescing" "$coalesce_result"
+    fi
+fi
+
+# ---------------------------------------------------------------------------
+# Test 13: WS bridge bounds in-process router calls by SOLAR_ROUTER_TIMEOUT_SEC
+# ---------------------------------------------------------------------------
+echo ""
+echo "── Test 13: WS bridge in-process router call times out"
+if ! $PYTHON -c "import websockets" 2>/dev/null; then
+    skip "WS bridge router timeout" "websockets not installed"
+else
+    timeout_result="$(SOLAR_ROUTER_TIMEOUT_SEC=1 SOLAR_ROUTER_IN_PROCESS=true $PYTHON -c "
+import importlib.util, time
+spec = importlib.util.spec_from_file_location('run_websocket_bridge', '$BRIDGE_PY')
+bridge = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(bridge)
+
+class SlowService:
+    # Stands in for RouterService with a provider that outlives the timeout.
+    def handle(self, payload, on_partial=None, cancellation=None):
+        deadline = time.monotonic() + 6
+        while not cancellation.cancelled and time.monotonic() < deadline:
+            time.sleep(0.01)
+        if cancellation.cancelled:
+            return bridge.failed_response(payload['request_id'], 'cancelled', 'request cancelled')
+        return {'status': 'success', 'request_id': payload['request_id'], 'error_code': None}
+
+bridge.get_router_service = SlowService
+started = time.monotonic()
+response = bridge.call_router({'request_id': 't13', 'session_id': 's', 'user_id': 'u', 'text': 'hi'})
+elapsed = time.monotonic() - started
+assert response['error_code'] == 'router_timeout', response
+assert elapsed < 3, elapsed
+print('ok')
+" 2>&1 || echo "error")"
+    if [[ "$timeout_result" == "ok" ]]; then
+        pass "WS bridge: in-process router call answers router_timeout after SOLAR_ROUTER_TIMEOUT_SEC"
+    else
+        fail "WS bridge router timeout" "$timeout_result"
+    fi
+fi
+
+# ---------------------------------------------------------------------------
+# Test 14: prompt mode=file needs {prompt_file}; stdin otherwise
+# ---------------------------------------------------------------------------
+echo ""
+echo "── Test 14: prompt_delivery file mode without placeholder falls back to stdin"
+delivery_result="$($PYTHON -c "
+import importlib.util
+spec = importlib.util.spec_from_file_location('run_router', '$ROUTER_SCRIPT')
+mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mod)
+
+with mod.prompt_delivery('codex', ['codex', 'exec', '--'], 'hello', mode='file') as (argv, stdin_data):
+    assert argv == ['codex', 'exec', '--', '-'], argv
+    assert stdin_data == b'hello', stdin_data
+with mod.prompt_delivery('codex', ['wrap', '--prompt-file', '{prompt_file}'], 'hello', mode='file') as (argv, stdin_data):
+    assert stdin_data is None and open(argv[2]).read() == 'hello', argv
+print('ok')
+" 2>/dev/null || echo "error")"
+if [[ "$delivery_result" == "ok" ]]; then
+    pass "prompt_delivery: file mode uses {prompt_file}, stdin without it"
+else
+    fail "prompt_delivery file mode" "$delivery_result"
+fi
+
 # ---------------------------------------------------------------------------
 # Summary
 # ---------------------------------------------------------------------------
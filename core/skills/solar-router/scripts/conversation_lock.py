@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+conversation_lock — per-conversation ordering for concurrent router requests.
+
+A turn reads the recent history, calls a provider and appends to the same
+segment, so turns of one conversation must run one at a time. Two layers:
+
+- threads of one process (WS bridge, `--batch`, async executor) queue FIFO
+  per conversation, so turns keep their arrival order;
+- the thread at the head then takes an advisory flock on
+  <runtime>/locks/<conversation_id>.lock, which orders separate router
+  processes (CLI calls, SOLAR_ROUTER_IN_PROCESS=false).
+
+Different conversations never wait on each other.
+
+A waiter never gives up while the turns ahead of it make progress: the
+timeout bounds how long one holder may keep the conversation, and restarts
+whenever the lock changes hands (the flock holder stamps the lock file with
+its pid and start time). A crashed holder releases its flock with the
+process, so only a stuck turn makes waiters fail with ConversationBusyError.
+
+Keys:
+    SOLAR_ROUTER_CONVERSATION_LOCK_TIMEOUT_SEC  max time one turn may hold a conversation before waiters
+                                                give up; 0 = no limit (default: the request's worst-case
+                                                provider budget, see RouterService)
+"""
+import os
+import pathlib
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX
+    fcntl = None  # type: ignore[assignment]
+
+
+FLOCK_POLL_SEC = 0.05
+HOLD_MARGIN_SEC = 60  # slack on top of the provider budget for context building and conversation writes
+
+
+def conversation_lock_timeout_sec(default: float) -> float:
+    return float(os.getenv("SOLAR_ROUTER_CONVERSATION_LOCK_TIMEOUT_SEC") or default)
+
+
+class ConversationBusyError(RuntimeError):
+    """One turn held the conversation for longer than the lock timeout."""
+
+
+class HeldConversation:
+    """One acquired conversation lock; release() exactly once."""
+
+    def __init__(self, locks: "ConversationLocks", key: str, turn: threading.Event, fd: Optional[int]) -> None:
+        self._locks = locks
+        self._key = key
+        self._turn = turn
+        self._fd = fd
+
+    def release(self) -> None:
+        if self._fd is not None:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            finally:
+                os.close(self._fd)
+                self._fd = None
+        self._locks._leave(self._key, self._turn)
+
+    def __enter__(self) -> "HeldConversation":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.release()
+
+
+class ConversationLocks:
+    """FIFO in-process queue plus cross-process flock, keyed by conversation id."""
+
+    def __init__(self, runtime_root: pathlib.Path, timeout_sec: float = 600) -> None:
+        """`timeout_sec` is the default hold limit; SOLAR_ROUTER_CONVERSATION_LOCK_TIMEOUT_SEC overrides it."""
+        self.directory = runtime_root / "locks"
+        self.timeout_sec = conversation_lock_timeout_sec(timeout_sec)
+        self._mutex = threading.Lock()
+        self._queues: Dict[str, Deque[threading.Event]] = {}
+        self._granted_at: Dict[str, float] = {}  # key -> when the current in-process holder got its turn
+
+    def acquire(self, key: str) -> HeldConversation:
+        """
+        Wait for `key` (a sanitized conversation id). Raises ConversationBusyError
+        when a single holder keeps it for longer than the timeout.
+        """
+        turn = threading.Event()
+        with self._mutex:
+            queue = self._queues.setdefault(key, deque())
+            queue.append(turn)
+            if len(queue) == 1:
+                self._granted_at[key] = time.monotonic()
+                turn.set()
+        while not turn.is_set():
+            if self.timeout_sec <= 0:
+                turn.wait()
+                continue
+            with self._mutex:
+                held_until = self._granted_at[key] + self.timeout_sec
+            if turn.wait(max(held_until - time.monotonic(), 0)):
+                break
+            with self._mutex:
+                stuck = not turn.is_set() and time.monotonic() >= self._granted_at[key] + self.timeout_sec
+                if stuck:
+                    queue.remove(turn)
+            if stuck:
+                raise ConversationBusyError(
+                    f"conversation {key} is held by one turn for over {self.timeout_sec:g}s in this process"
+                )
+        try:
+            fd = self._flock(key)
+        except BaseException:
+            self._leave(key, turn)
+            raise
+        return HeldConversation(self, key, turn, fd)
+
+    def _flock(self, key: str) -> Optional[int]:
+        if fcntl is None:
+            return None
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.directory / f"{key}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if self.timeout_sec <= 0:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                self._flock_while_progressing(fd, key)
+            # Stamp the holder so waiters in other processes can tell it from the previous one.
+            stamp = f"{os.getpid()} {time.time():.3f}\n".encode("ascii")
+            os.ftruncate(fd, 0)
+            os.pwrite(fd, stamp, 0)
+            return fd
+        except BaseException:
+            os.close(fd)
+            raise
+
+    def _flock_while_progressing(self, fd: int, key: str) -> None:
+        holder = None
+        holder_since = time.monotonic()
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                pass
+            stamp = os.pread(fd, 64, 0)
+            if stamp != holder:
+                # A different process (or turn) holds it now: the previous one finished.
+                holder, holder_since = stamp, time.monotonic()
+            if time.monotonic() - holder_since >= self.timeout_sec:
+                raise ConversationBusyError(
+                    f"conversation {key} is held by another router process for over {self.timeout_sec:g}s"
+                )
+            time.sleep(FLOCK_POLL_SEC)
+
+    def _leave(self, key: str, turn: threading.Event) -> None:
+        with self._mutex:
+            queue = self._queues[key]
+            queue.remove(turn)
+            if queue:
+                self._granted_at[key] = time.monotonic()
+                queue[0].set()
+            else:
+                del self._queues[key]
+                del self._granted_at[key]
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+conversation_store — segmented JSONL conversation storage for solar-router.
+
+Layout under <runtime>/conversations:
+    <id>.jsonl                      active (hot) segment, append-only
+    <id>.jsonl.rotate-at            size to reach before retrying a skipped rotation
+    archive/<id>/000001.jsonl.gz    compressed, read-only archived segments
+
+The active segment rolls over once it reaches SOLAR_ROUTER_SEGMENT_MAX_BYTES
+or SOLAR_ROUTER_SEGMENT_MAX_TURNS. Rotation keeps the most recent context
+window in the active segment, so recent-turn reads only touch the hot file.
+"""
+import gzip
+import json
+import os
+import pathlib
+import stat
+import tempfile
+from typing import Dict, Iterator, List, Optional
+
+from conversation_writer import append_bytes, encode_records
+
+
+HISTORY_READ_BLOCK_SIZE = 64 * 1024
+DEFAULT_CONTEXT_TURNS = 12
+
+SEGMENT_MAX_BYTES = int(os.getenv("SOLAR_ROUTER_SEGMENT_MAX_BYTES") or str(1024 * 1024))
+SEGMENT_MAX_TURNS = int(os.getenv("SOLAR_ROUTER_SEGMENT_MAX_TURNS") or "0")
+
+ARCHIVE_DIRNAME = "archive"
+ARCHIVE_SUFFIX = ".jsonl.gz"
+ROTATION_MARK_SUFFIX = ".rotate-at"
+
+
+# ---------------------------------------------------------------------------
+# Record parsing
+# ---------------------------------------------------------------------------
+
+def _iter_lines_reversed(
+    path: pathlib.Path,
+    block_size: int = HISTORY_READ_BLOCK_SIZE,
+) -> Iterator[bytes]:
+    """Yield raw lines of `path` from last to first, reading fixed-size blocks from the end."""
+    with path.open("rb") as fh:
+        fh.seek(0, os.SEEK_END)
+        pos = fh.tell()
+        head = b""
+        while pos > 0:
+            step = min(block_size, pos)
+            pos -= step
+            fh.seek(pos)
+            lines = (fh.read(step) + head).split(b"\n")
+            # First piece may continue in the previous block: carry it over.
+            head = lines.pop(0)
+            for line in reversed(lines):
+                yield line
+        yield head
+
+
+def _parse_history_line(raw: bytes) -> Optional[Dict[str, str]]:
+    line = raw.strip()
+    if not line:
+        return None
+    try:
+        record = json.loads(line.decode("utf-8"))
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        return None
+    if not isinstance(record, dict):
+        return None
+    role = str(record.get("role", "")).strip().lower()
+    text = str(record.get("text", "")).strip()
+    if role in {"user", "assistant"} and text:
+        return {"role": role, "text": text}
+    return None
+
+
+# ---------------------------------------------------------------------------
+# Segments
+# ---------------------------------------------------------------------------
+
+def archive_dir(path: pathlib.Path) -> pathlib.Path:
+    """Archive directory for the conversation whose active segment is `path`."""
+    return path.parent / ARCHIVE_DIRNAME / path.stem
+
+
+def archive_segments(path: pathlib.Path) -> List[pathlib.Path]:
+    """Archived segments for `path`, oldest first."""
+    directory = archive_dir(path)
+    if not directory.is_dir():
+        return []
+    return sorted(directory.glob(f"*{ARCHIVE_SUFFIX}"))
+
+
+def _next_archive_path(path: pathlib.Path) -> pathlib.Path:
+    segments = archive_segments(path)
+    last = 0
+    if segments:
+        try:
+            last = int(segments[-1].name[: -len(ARCHIVE_SUFFIX)])
+        except ValueError:
+            last = len(segments)
+    return archive_dir(path) / f"{last + 1:06d}{ARCHIVE_SUFFIX}"
+
+
+def _read_archive_lines(segment: pathlib.Path) -> List[bytes]:
+    return gzip.decompress(segment.read_bytes()).split(b"\n")
+
+
+def _atomic_write(path: pathlib.Path, data: bytes, mode: Optional[int] = None) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if mode is None and path.exists():
+        # mkstemp creates 0600 files; keep the permissions of the file being replaced.
+        mode = stat.S_IMODE(path.stat().st_mode)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(data)
+        if mode is not None:
+            os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _write_archive(segment: pathlib.Path, lines: List[bytes], compresslevel: int = 6) -> None:
+    payload = b"".join(line + b"\n" for line in lines)
+    _atomic_write(segment, gzip.compress(payload, compresslevel=compresslevel), mode=0o444)
+
+
+# ---------------------------------------------------------------------------
+# Read / append
+# ---------------------------------------------------------------------------
+
+def load_recent_messages(
+    path: pathlib.Path,
+    max_turns: int = DEFAULT_CONTEXT_TURNS,
+) -> List[Dict[str, str]]:
+    """
+    Return the last `max_turns * 2` valid user/assistant records (oldest first).
+    Reads the active segment backward and stops once enough records are found;
+    archived segments are only opened when the active one is too short.
+    """
+    keep = max_turns * 2
+    items: List[Dict[str, str]] = []
+    if path.exists():
+        for raw in _iter_lines_reversed(path):
+            item = _parse_history_line(raw)
+            if item is None:
+                continue
+            items.append(item)
+            if keep > 0 and len(items) >= keep:
+                break
+    if keep <= 0 or len(items) < keep:
+        for segment in reversed(archive_segments(path)):
+            for raw in reversed(_read_archive_lines(segment)):
+                item = _parse_history_line(raw)
+                if item is None:
+                    continue
+                items.append(item)
+                if keep > 0 and len(items) >= keep:
+                    break
+            if keep > 0 and len(items) >= keep:
+                break
+    items.reverse()
+    return items
+
+
+def append_message(path: pathlib.Path, role: str, text: str) -> None:
+    """Append one record; turns go through conversation_writer.ConversationWriter."""
+    append_bytes(path, encode_records([{"role": role, "text": text}]))
+
+
+# ---------------------------------------------------------------------------
+# Rotation and compaction
+# ---------------------------------------------------------------------------
+
+def rotate_segment(
+    path: pathlib.Path,
+    keep_records: int,
+    min_archive_ratio: float = 0.5,
+) -> Optional[pathlib.Path]:
+    """
+    Move all but the last `keep_records` valid records of the active segment
+    into a new compressed archive segment. Malformed lines are dropped.
+
+    Skips rotation (returns None) when the archivable part is smaller than
+    `min_archive_ratio` of the segment, so a large hot tail does not produce
+    one tiny archive per append. A skip records the size the segment must
+    reach before rotation is tried again, so appends in between do not
+    re-read the whole segment.
+    """
+    if not path.exists():
+        return None
+    data = path.read_bytes()
+    valid = [line.strip() for line in data.split(b"\n") if _parse_history_line(line)]
+    split = max(len(valid) - keep_records, 0) if keep_records > 0 else len(valid)
+    head, tail = valid[:split], valid[split:]
+    if not head:
+        return None
+    head_bytes = sum(len(line) + 1 for line in head)
+    if head_bytes < len(data) * min_archive_ratio:
+        # Once the segment has grown by this much, the new records alone reach the ratio.
+        _write_rotation_mark(path, int(len(data) / max(1 - min_archive_ratio, 0.1)))
+        return None
+    segment = _next_archive_path(path)
+    _write_archive(segment, head)
+    _atomic_write(path, b"".join(line + b"\n" for line in tail))
+    _clear_rotation_mark(path)
+    return segment
+
+
+def _rotation_mark_path(path: pathlib.Path) -> pathlib.Path:
+    return path.with_name(path.name + ROTATION_MARK_SUFFIX)
+
+
+def _read_rotation_mark(path: pathlib.Path) -> int:
+    try:
+        return int(_rotation_mark_path(path).read_text(encoding="ascii"))
+    except (OSError, ValueError):
+        return 0
+
+
+def _write_rotation_mark(path: pathlib.Path, size: int) -> None:
+    _atomic_write(_rotation_mark_path(path), str(size).encode("ascii"))
+
+
+def _clear_rotation_mark(path: pathlib.Path) -> None:
+    try:
+        _rotation_mark_path(path).unlink()
+    except FileNotFoundError:
+        pass
+
+
+def segment_needs_rotation(
+    path: pathlib.Path,
+    max_bytes: int = SEGMENT_MAX_BYTES,
+    max_turns: int = SEGMENT_MAX_TURNS,
+) -> bool:
+    try:
+        size = path.stat().st_size
+    except OSError:
+        return False
+    over_bytes = max_bytes > 0 and size >= max_bytes
+    if not over_bytes and max_turns <= 0:
+        return False
+    if size < _read_rotation_mark(path):
+        # The last rotation was skipped; wait until enough new data has arrived.
+        return False
+    if over_bytes:
+        return True
+    # Active segment is size-bounded, so counting its lines stays cheap.
+    return path.read_bytes().count(b"\n") >= max_turns * 2
+
+
+def rotate_if_needed(
+    path: pathlib.Path,
+    keep_records: int,
+    max_bytes: int = SEGMENT_MAX_BYTES,
+    max_turns: int = SEGMENT_MAX_TURNS,
+) -> Optional[pathlib.Path]:
+    """Roll the active segment over when it exceeds the size or turn limit."""
+    if not segment_needs_rotation(path, max_bytes, max_turns):
+        return None
+    return rotate_segment(path, keep_records)
+
+
+def compact_conversation(
+    path: pathlib.Path,
+    keep_records: int,
+    max_bytes: int = SEGMENT_MAX_BYTES,
+    max_turns: int = SEGMENT_MAX_TURNS,
+) -> Dict[str, int]:
+    """
+    Rewrite archived segments without malformed lines (max compression),
+    remove empty ones, and roll over or clean the active segment.
+    """
+    stats = {"segments": 0, "removed_segments": 0, "dropped_lines": 0, "rotated": 0}
+    for segment in archive_segments(path):
+        lines = [line.strip() for line in _read_archive_lines(segment)]
+        valid = [line for line in lines if _parse_history_line(line)]
+        stats["dropped_lines"] += sum(1 for line in lines if line) - len(valid)
+        if not valid:
+            segment.unlink()
+            stats["removed_segments"] += 1
+            continue
+        _write_archive(segment, valid, compresslevel=9)
+        stats["segments"] += 1
+
+    if not path.exists():
+        return stats
+    if rotate_if_needed(path, keep_records, max_bytes, max_turns) is not None:
+        stats["rotated"] = 1
+        return stats
+    lines = [line.strip() for line in path.read_bytes().split(b"\n")]
+    valid = [line for line in lines if _parse_history_line(line)]
+    dropped = sum(1 for line in lines if line) - len(valid)
+    if dropped:
+        _atomic_write(path, b"".join(line + b"\n" for line in valid))
+        stats["dropped_lines"] += dropped
+    return stats
+
+
+def conversation_paths(conversations_dir: pathlib.Path) -> List[pathlib.Path]:
+    """Active segment paths for every conversation, including archive-only ones."""
+    paths = {p.name: p for p in conversations_dir.glob("*.jsonl")}
+    archive_root = conversations_dir / ARCHIVE_DIRNAME
+    if archive_root.is_dir():
+        for directory in archive_root.iterdir():
+            if directory.is_dir():
+                paths.setdefault(f"{directory.name}.jsonl", conversations_dir / f"{directory.name}.jsonl")
+    return [paths[name] for name in sorted(paths)]
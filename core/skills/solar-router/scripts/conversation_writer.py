@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+conversation_writer — single-write, group-committed conversation appends.
+
+A turn (user + assistant record) is encoded once and appended to the active
+segment with one O_APPEND write, so concurrent routers cannot tear or
+interleave its lines.
+
+Durability (SOLAR_ROUTER_DURABILITY):
+    none    write only, the OS decides when data reaches disk (default)
+    turn    fsync before the turn is acknowledged
+    batch   fsync written files every SOLAR_ROUTER_FSYNC_INTERVAL_MS (default: 200)
+            and on exit
+
+With group_commit=True (long-lived processes: WS bridge, `--batch`) turns are
+handed to one background flusher thread that drains everything pending in a
+round: one open/write/close per conversation file and, under `turn`, one
+fsync per file shared by all turns of the round. Callers still block until
+their turn is written (and synced, under `turn`), so the next request in the
+conversation always reads it.
+"""
+import atexit
+import json
+import os
+import pathlib
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+DURABILITY_MODES = {"none", "turn", "batch"}
+
+
+def durability_mode() -> str:
+    raw = (os.getenv("SOLAR_ROUTER_DURABILITY") or "none").strip().lower()
+    return raw if raw in DURABILITY_MODES else "none"
+
+
+def fsync_interval_ms() -> int:
+    return max(int(os.getenv("SOLAR_ROUTER_FSYNC_INTERVAL_MS") or "200"), 1)
+
+
+def encode_records(records: List[Dict[str, str]]) -> bytes:
+    return b"".join(
+        json.dumps(record, ensure_ascii=True).encode("ascii") + b"\n" for record in records
+    )
+
+
+def _fsync_path(path: pathlib.Path) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def append_bytes(path: pathlib.Path, data: bytes, sync: bool = False) -> bool:
+    """
+    Append `data` to `path` with a single O_APPEND write (fsync'd when `sync`).
+    Returns True when the file was empty before, i.e. its directory entry may
+    not be durable yet.
+    """
+    flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT
+    try:
+        fd = os.open(path, flags, 0o666)
+    except FileNotFoundError:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(path, flags, 0o666)
+    try:
+        created = os.fstat(fd).st_size == 0
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+        if sync:
+            os.fsync(fd)
+    finally:
+        os.close(fd)
+    if sync and created:
+        _fsync_path(path.parent)
+    return created
+
+
+class _PendingWrite:
+    __slots__ = ("data", "done", "error")
+
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+        self.done = threading.Event()
+        self.error: Optional[BaseException] = None
+
+
+class ConversationWriter:
+    """Appends conversation turns under one durability policy."""
+
+    def __init__(
+        self,
+        durability: Optional[str] = None,
+        interval_ms: Optional[int] = None,
+        group_commit: bool = False,
+    ) -> None:
+        self.durability = durability_mode() if durability is None else durability
+        self.interval_sec = (fsync_interval_ms() if interval_ms is None else max(interval_ms, 1)) / 1000
+        self.group_commit = group_commit
+        self.stats = {"turns": 0, "writes": 0, "fsyncs": 0}
+        self._cond = threading.Condition()
+        self._pending: Dict[pathlib.Path, List[_PendingWrite]] = {}
+        self._dirty: Dict[pathlib.Path, bool] = {}  # path -> directory entry needs fsync
+        self._dirty_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    # -- public -------------------------------------------------------------
+
+    def append_turn(self, path: pathlib.Path, user_text: str, reply_text: str) -> None:
+        self.append(path, [
+            {"role": "user", "text": user_text},
+            {"role": "assistant", "text": reply_text},
+        ])
+
+    def append(self, path: pathlib.Path, records: List[Dict[str, str]]) -> None:
+        """Append `records` as one write; returns once written (synced under `turn`)."""
+        data = encode_records(records)
+        with self._cond:
+            self.stats["turns"] += 1
+            queued = self.group_commit and not self._closed
+            if queued:
+                pending = _PendingWrite(data)
+                self._pending.setdefault(path, []).append(pending)
+                self._ensure_flusher()
+                self._cond.notify()
+        if not queued:
+            self._write(path, data)
+            return
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+
+    def sync(self) -> None:
+        """fsync every file written since the last sync (`batch` policy)."""
+        with self._dirty_lock:
+            dirty, self._dirty = self._dirty, {}
+        directories = set()
+        try:
+            while dirty:
+                path, created = next(iter(dirty.items()))
+                try:
+                    _fsync_path(path)
+                except FileNotFoundError:
+                    pass  # rotated or compacted away since the write
+                else:
+                    self.stats["fsyncs"] += 1
+                    if created:
+                        directories.add(path.parent)
+                del dirty[path]
+            for directory in directories:
+                _fsync_path(directory)
+        except OSError:
+            # Keep what is still unsynced for the next round.
+            with self._dirty_lock:
+                for path, created in dirty.items():
+                    self._dirty[path] = self._dirty.get(path, False) or created
+            raise
+
+    def close(self) -> None:
+        """Drain pending turns, run the final `batch` sync and stop the flusher."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        if self.durability == "batch":
+            self.sync()
+
+    # -- internals ----------------------------------------------------------
+
+    def _write(self, path: pathlib.Path, data: bytes) -> None:
+        created = append_bytes(path, data, sync=self.durability == "turn")
+        self.stats["writes"] += 1
+        if self.durability == "turn":
+            self.stats["fsyncs"] += 1
+        elif self.durability == "batch":
+            with self._dirty_lock:
+                self._dirty[path] = self._dirty.get(path, False) or created
+            with self._cond:
+                if not self._closed:
+                    self._ensure_flusher()
+
+    def _ensure_flusher(self) -> None:
+        # Caller holds self._cond.
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="solar-router-conversation-writer", daemon=True
+            )
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _run(self) -> None:
+        next_sync = time.monotonic() + self.interval_sec
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    timeout = None
+                    if self._dirty:
+                        timeout = next_sync - time.monotonic()
+                        if timeout <= 0:
+                            break
+                    self._cond.wait(timeout)
+                batch, self._pending = self._pending, {}
+                closing = self._closed
+            for path, writes in batch.items():
+                try:
+                    self._write(path, b"".join(pending.data for pending in writes))
+                except OSError as exc:
+                    for pending in writes:
+                        pending.error = exc
+                for pending in writes:
+                    pending.done.set()
+            if self.durability == "batch" and (closing or time.monotonic() >= next_sync):
+                try:
+                    self.sync()
+                except OSError:
+                    pass  # retried on the next round; close() raises if it persists
+                next_sync = time.monotonic() + self.interval_sec
+            if closing:
+                return
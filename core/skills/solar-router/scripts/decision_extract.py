@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+decision_extract — single-pass extraction of the mode=auto decision envelope.
+
+Provider output in mode=auto should contain a JSON object such as
+    {"decision": {"kind": "direct_reply"}, "reply_text": "..."}
+possibly wrapped in code fences or surrounded by prose. DecisionExtractor
+scans the output once, incrementally (feed() accepts streamed pieces), and:
+
+- tracks brace depth outside JSON strings, so each top-level object is
+  decoded exactly once with JSONDecoder.raw_decode when it closes;
+- decodes the `decision` member as soon as its own object closes, so
+  `decision.kind` is known before a long `reply_text` has been written;
+- stops scanning at the first complete object that has a `decision` key.
+
+Only unbalanced output (an object still open at the end) falls back to trying
+raw_decode at each remaining `{`. Output spilled to disk is streamed through
+the same scanner by extract_decision_from_file.
+"""
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+
+_STRUCTURAL = re.compile(r'[{}":]')
+# Body of a JSON string up to (not including) its closing quote; a trailing
+# lone backslash is left unconsumed when the string continues in the next piece.
+_STRING_BODY = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*', re.DOTALL)
+_NON_SPACE = re.compile(r"\S")
+_DECODER = json.JSONDecoder()
+
+# Longest top-level string still captured as a possible key.
+_KEY_CAPTURE_CHARS = 32
+# Characters read per feed() when scanning a spilled output file.
+_FILE_CHUNK_CHARS = 1 << 16
+
+
+class DecisionExtractor:
+    """Incremental scanner for the first JSON object with a `decision` key."""
+
+    def __init__(self) -> None:
+        self.result: Optional[Dict[str, Any]] = None
+        self.decision: Optional[Dict[str, Any]] = None
+        self._reset_span()
+
+    def _reset_span(self) -> None:
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._parts: List[str] = []  # text of the current top-level object
+        self._span_len = 0
+        self._key: Optional[List[str]] = None  # capture of the current depth-1 string
+        self._last_key: Optional[str] = None
+        self._after_colon = False
+        self._decision_start: Optional[int] = None
+
+    @property
+    def done(self) -> bool:
+        return self.result is not None
+
+    @property
+    def kind(self) -> Optional[str]:
+        kind = self.decision.get("kind") if self.decision else None
+        return kind if isinstance(kind, str) else None
+
+    def _span_text(self, text: str, seg_start: int, end: int) -> str:
+        return "".join(self._parts) + text[seg_start:end]
+
+    def feed(self, text: str) -> bool:
+        """Scan the next piece of output. Returns True once the envelope is complete."""
+        if self.result is not None:
+            return True
+        pos = 0
+        n = len(text)
+        seg_start = 0  # where the current object's text starts within `text`
+        while pos < n:
+            if self._depth == 0:
+                start = text.find("{", pos)
+                if start < 0:
+                    return False
+                first = _NON_SPACE.search(text, start + 1)
+                if first is not None and first.group() not in '"}':
+                    # A JSON object opens with a key or closes at once: prose brace, skip it.
+                    pos = start + 1
+                    continue
+                self._reset_span()
+                self._depth = 1
+                seg_start = start
+                pos = start + 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    pos += 1
+                    continue
+                end = _STRING_BODY.match(text, pos).end()
+                if self._key is not None:
+                    self._key.append(text[pos:end])
+                    if sum(len(piece) for piece in self._key) > _KEY_CAPTURE_CHARS:
+                        self._key = None
+                if end >= n:
+                    break
+                if text[end] == "\\":
+                    # Escape split across pieces: skip the escaped char in the next one.
+                    self._escape = True
+                    pos = n
+                    continue
+                self._in_string = False
+                pos = end + 1
+                continue
+
+            match = _STRUCTURAL.search(text, pos)
+            if match is None:
+                break
+            char = match.group()
+            offset = self._span_len + match.start() - seg_start
+            pos = match.end()
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    self._key = []
+                    self._after_colon = False
+                else:
+                    self._key = None
+                continue
+            if char == ":":
+                if self._depth == 1:
+                    self._last_key = "".join(self._key) if self._key is not None else None
+                    self._key = None
+                    self._after_colon = True
+                continue
+            if char == "{":
+                if self._depth == 1 and self._after_colon and self._last_key == "decision":
+                    self._decision_start = offset
+                self._after_colon = False
+                self._depth += 1
+                continue
+            # char == "}"
+            self._depth -= 1
+            if self._depth == 1 and self._decision_start is not None:
+                span = self._span_text(text, seg_start, match.end())
+                try:
+                    decision = json.loads(span[self._decision_start:])
+                except ValueError:
+                    decision = None
+                if isinstance(decision, dict) and self.decision is None:
+                    self.decision = decision
+                self._decision_start = None
+            elif self._depth == 0:
+                span = self._span_text(text, seg_start, match.end())
+                self._reset_span()
+                if self._accept(span):
+                    return True
+                self.decision = None
+        if self._depth > 0:
+            self._parts.append(text[seg_start:])
+            self._span_len += n - seg_start
+        return False
+
+    def _accept(self, candidate: str) -> bool:
+        try:
+            parsed, _ = _DECODER.raw_decode(candidate)
+        except ValueError:
+            return False
+        if isinstance(parsed, dict) and "decision" in parsed:
+            self.result = parsed
+            if isinstance(parsed["decision"], dict):
+                self.decision = parsed["decision"]
+            return True
+        return False
+
+    def finish(self) -> Optional[Dict[str, Any]]:
+        """End of output: return the envelope, retrying an unbalanced tail at each `{`."""
+        if self.result is None and self._depth > 0:
+            tail = "".join(self._parts)
+            self._reset_span()
+            pos = 0
+            while self.result is None:
+                pos = tail.find("{", pos)
+                if pos < 0:
+                    break
+                try:
+                    parsed, end = _DECODER.raw_decode(tail, pos)
+                except ValueError:
+                    pos += 1
+                    continue
+                if isinstance(parsed, dict) and "decision" in parsed:
+                    self.result = parsed
+                    if isinstance(parsed["decision"], dict):
+                        self.decision = parsed["decision"]
+                pos = end
+        return self.result
+
+
+def extract_decision_object(text: str) -> Optional[Dict[str, Any]]:
+    """First JSON object in `text` that has a `decision` key, or None."""
+    extractor = DecisionExtractor()
+    extractor.feed(text)
+    return extractor.finish()
+
+
+def extract_decision_from_file(path: str) -> Optional[Dict[str, Any]]:
+    """Like extract_decision_object, reading `path` in chunks; stops at the envelope's end."""
+    extractor = DecisionExtractor()
+    with open(path, encoding="utf-8", errors="replace") as handle:
+        for chunk in iter(lambda: handle.read(_FILE_CHUNK_CHARS), ""):
+            if extractor.feed(chunk):
+                break
+    return extractor.finish()
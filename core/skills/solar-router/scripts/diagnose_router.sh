@@ -10,15 +10,17 @@ PROMPT_DEFAULT="Respond with OK"
 
 dry_run="false"
 verbose="false"
+scoreboard="false"
 prompt="$PROMPT_DEFAULT"
 
 usage() {
   cat <<'EOF'
 Usage:
-  bash core/skills/solar-router/scripts/diagnose_router.sh [--dry-run] [--verbose] [--prompt "text"]
+  bash core/skills/solar-router/scripts/diagnose_router.sh [--dry-run] [--verbose] [--scoreboard] [--prompt "text"]
 
 Options:
   --dry-run        Validate configured provider list and client binaries only (no API calls).
+  --scoreboard     Print the provider health scoreboard (circuit state, failures, latency) and exit.
   --verbose       On provider failure, print full error output (for diagnostics). Default: first 220 chars.
   --prompt TEXT    Prompt used for provider test calls.
 EOF
@@ -34,6 +36,10 @@ while [[ $# -gt 0 ]]; do
       verbose="true"
       shift
       ;;
+    --scoreboard)
+      scoreboard="true"
+      shift
+      ;;
     --prompt)
       shift
       if [[ $# -eq 0 ]]; then
@@ -96,6 +102,12 @@ if [[ ! -f "$ROUTER_SCRIPT" ]]; then
   exit 1
 fi
 
+if [[ "$scoreboard" == "true" ]]; then
+  echo "Provider health scoreboard:"
+  python3 "$ROUTER_SCRIPT" health
+  exit 0
+fi
+
 echo "AI provider preflight:"
 echo "  priority: $unique_providers"
 echo "  dry_run:  $dry_run"
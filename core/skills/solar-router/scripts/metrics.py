@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+metrics — per-request stage timings and a metrics sink for solar-router.
+
+StageTimings collects monotonic durations for one request (stages plus every
+provider attempt, fallback and hedged ones included). MetricsSink writes
+them under <runtime>/metrics:
+
+    router-YYYY-MM-DD.jsonl   one record per request (jsonl)
+    solar_router.prom         Prometheus textfile with cumulative histograms (prometheus)
+
+Keys:
+    SOLAR_ROUTER_TIMINGS                  add `timings` to responses (default: true)
+    SOLAR_ROUTER_METRICS                  jsonl | prometheus | both | off (default: jsonl)
+    SOLAR_ROUTER_METRICS_RETENTION_DAYS   daily JSONL files kept (default: 14)
+"""
+import contextlib
+import datetime
+import json
+import os
+import pathlib
+import tempfile
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX
+    fcntl = None  # type: ignore[assignment]
+
+
+METRICS_MODES = {"jsonl", "prometheus", "both", "off"}
+HISTOGRAM_BUCKETS_SEC = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def timings_enabled() -> bool:
+    return (os.getenv("SOLAR_ROUTER_TIMINGS") or "true").strip().lower() not in {"0", "false", "no", "off"}
+
+
+def metrics_mode() -> str:
+    raw = (os.getenv("SOLAR_ROUTER_METRICS") or "jsonl").strip().lower()
+    return raw if raw in METRICS_MODES else "jsonl"
+
+
+def metrics_retention_days() -> int:
+    return int(os.getenv("SOLAR_ROUTER_METRICS_RETENTION_DAYS") or "14")
+
+
+# ---------------------------------------------------------------------------
+# Timings
+# ---------------------------------------------------------------------------
+
+class StageTimings:
+    """Monotonic stage and provider-attempt durations for one request."""
+
+    def __init__(self) -> None:
+        self._started = time.monotonic()
+        self.stages: Dict[str, float] = {}
+        self.attempts: List[Dict[str, Any]] = []
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.monotonic() - started
+
+    def _attempt(self, provider: str, started: float, ok: bool) -> None:
+        # list.append is atomic: hedged attempts report from the runner loop thread.
+        self.attempts.append({
+            "provider": provider,
+            "sec": round(time.monotonic() - started, 4),
+            "ok": ok,
+        })
+
+    def provider_call(self, run: Callable[..., str]) -> Callable[..., str]:
+        """Wrap a blocking provider call so each attempt is recorded."""
+        def timed_run(provider: str, prompt: str, **kwargs: Any) -> str:
+            started = time.monotonic()
+            try:
+                output = run(provider, prompt, **kwargs)
+            except Exception:
+                self._attempt(provider, started, False)
+                raise
+            self._attempt(provider, started, True)
+            return output
+
+        return timed_run
+
+    def provider_call_async(
+        self,
+        run: Callable[..., Awaitable[str]],
+    ) -> Callable[..., Awaitable[str]]:
+        """Awaitable variant of provider_call (hedged races)."""
+        async def timed_run(provider: str, prompt: str, **kwargs: Any) -> str:
+            started = time.monotonic()
+            try:
+                output = await run(provider, prompt, **kwargs)
+            except BaseException:
+                # Cancelled hedge losers count as failed attempts too.
+                self._attempt(provider, started, False)
+                raise
+            self._attempt(provider, started, True)
+            return output
+
+        return timed_run
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "total_sec": round(time.monotonic() - self._started, 4),
+            "stages": {name: round(sec, 4) for name, sec in self.stages.items()},
+            "provider_attempts": list(self.attempts),
+        }
+
+
+# ---------------------------------------------------------------------------
+# Sink
+# ---------------------------------------------------------------------------
+
+def _empty_histogram() -> Dict[str, Any]:
+    return {"buckets": [0] * len(HISTOGRAM_BUCKETS_SEC), "count": 0, "sum": 0.0}
+
+
+def _observe(histogram: Dict[str, Any], value: float) -> None:
+    for index, bound in enumerate(HISTOGRAM_BUCKETS_SEC):
+        if value <= bound:
+            histogram["buckets"][index] += 1
+    histogram["count"] += 1
+    histogram["sum"] += value
+
+
+def _label_str(labels: Dict[str, str]) -> str:
+    return ",".join(f'{key}="{value}"' for key, value in sorted(labels.items()))
+
+
+class MetricsSink:
+    """Appends request records (JSONL) and/or maintains a Prometheus textfile."""
+
+    def __init__(self, runtime_root: pathlib.Path, mode: Optional[str] = None) -> None:
+        self.directory = runtime_root / "metrics"
+        self.mode = metrics_mode() if mode is None else mode
+        self.retention_days = metrics_retention_days()
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def record(self, record: Dict[str, Any]) -> None:
+        """`record`: request_id, channel, mode, status, provider_used, error_code, cache, coalesced, timings."""
+        if not self.enabled:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if self.mode in {"jsonl", "both"}:
+            self._append_jsonl(record)
+        if self.mode in {"prometheus", "both"}:
+            self._update_prometheus(record)
+
+    # -- jsonl --------------------------------------------------------------
+
+    def _append_jsonl(self, record: Dict[str, Any]) -> None:
+        today = datetime.date.today()
+        path = self.directory / f"router-{today.isoformat()}.jsonl"
+        new_file = not path.exists()
+        row = {"ts": round(time.time(), 3), **record}
+        with path.open("a", encoding="utf-8") as fh:
+            fh.write(json.dumps(row, ensure_ascii=False) + "\n")
+        if new_file and self.retention_days > 0:
+            cutoff = (today - datetime.timedelta(days=self.retention_days)).isoformat()
+            for old in self.directory.glob("router-*.jsonl"):
+                if old.name[len("router-"):-len(".jsonl")] < cutoff:
+                    with contextlib.suppress(OSError):
+                        old.unlink()
+
+    # -- prometheus ---------------------------------------------------------
+
+    def _update_prometheus(self, record: Dict[str, Any]) -> None:
+        state_path = self.directory / "prometheus-state.json"
+        with (self.directory / "prometheus.lock").open("a") as lock_fh:
+            if fcntl is not None:
+                fcntl.flock(lock_fh.fileno(), fcntl.LOCK_EX)
+            try:
+                try:
+                    state = json.loads(state_path.read_text(encoding="utf-8"))
+                except (OSError, json.JSONDecodeError):
+                    state = {}
+                requests = state.setdefault("requests", {})
+                stages = state.setdefault("stages", {})
+                providers = state.setdefault("providers", {})
+
+                key = _label_str({
+                    "channel": str(record.get("channel")),
+                    "status": str(record.get("status")),
+                })
+                requests[key] = requests.get(key, 0) + 1
+                if record.get("coalesced"):
+                    coalesced = state.setdefault("coalesced", {})
+                    key = _label_str({"channel": str(record.get("channel"))})
+                    coalesced[key] = coalesced.get(key, 0) + 1
+                timings = record.get("timings") or {}
+                total = timings.get("total_sec")
+                if total is not None:
+                    _observe(stages.setdefault('stage="total"', _empty_histogram()), total)
+                for name, sec in (timings.get("stages") or {}).items():
+                    _observe(stages.setdefault(_label_str({"stage": name}), _empty_histogram()), sec)
+                for attempt in timings.get("provider_attempts") or []:
+                    label = _label_str({
+                        "provider": attempt["provider"],
+                        "outcome": "ok" if attempt["ok"] else "error",
+                    })
+                    _observe(providers.setdefault(label, _empty_histogram()), attempt["sec"])
+
+                self._write_atomic(state_path, json.dumps(state))
+                self._write_atomic(self.directory / "solar_router.prom", self._render(state))
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_fh.fileno(), fcntl.LOCK_UN)
+
+    @staticmethod
+    def _render(state: Dict[str, Any]) -> str:
+        lines = [
+            "# HELP solar_router_requests_total Router requests by channel and status.",
+            "# TYPE solar_router_requests_total counter",
+        ]
+        for labels, count in sorted(state["requests"].items()):
+            lines.append(f"solar_router_requests_total{{{labels}}} {count}")
+        lines += [
+            "# HELP solar_router_coalesced_total Duplicate requests that shared an in-flight generation (provider calls saved).",
+            "# TYPE solar_router_coalesced_total counter",
+        ]
+        for labels, count in sorted(state.get("coalesced", {}).items()):
+            lines.append(f"solar_router_coalesced_total{{{labels}}} {count}")
+        for metric, key, help_text in (
+            ("solar_router_stage_seconds", "stages", "Router request stage durations."),
+            ("solar_router_provider_seconds", "providers", "Provider CLI call durations per attempt."),
+        ):
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} histogram")
+            for labels, histogram in sorted(state[key].items()):
+                for bound, count in zip(HISTOGRAM_BUCKETS_SEC, histogram["buckets"]):
+                    lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {histogram["count"]}')
+                lines.append(f"{metric}_sum{{{labels}}} {round(histogram['sum'], 6)}")
+                lines.append(f"{metric}_count{{{labels}}} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _write_atomic(path: pathlib.Path, data: str) -> None:
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                fh.write(data)
+            os.chmod(tmp, 0o644)  # textfile collectors run as another user
+            os.replace(tmp, path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp)
+            raise
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+prompt_context — character-budgeted conversation context for solar-router.
+
+Recent turns are included newest-first while they fit in
+SOLAR_ROUTER_CONTEXT_CHARS. Older turns are not dropped silently: they are
+folded into a rolling extractive summary per conversation, cached in
+<runtime>/summaries/<id>.json and refreshed every
+SOLAR_ROUTER_SUMMARY_EVERY_TURNS turns with only the turns that left the
+context window since the last refresh.
+
+Keys:
+    SOLAR_ROUTER_CONTEXT_CHARS        budget for recent turns; 0 = turn limit only (default: 24000, ~6k tokens)
+    SOLAR_ROUTER_SUMMARY_CHARS        max size of the rolling summary; 0 disables it (default: 2000)
+    SOLAR_ROUTER_SUMMARY_EVERY_TURNS  refresh interval in turns (default: 4)
+
+The summary is a clipped digest of each turn (no provider call), so keeping
+it current never adds provider latency.
+"""
+import contextlib
+import json
+import os
+import pathlib
+import tempfile
+from typing import Any, Dict, List, Optional, Tuple
+
+from conversation_store import load_recent_messages
+
+
+SUMMARY_LINE_CHARS = 200
+ROLE_LABELS = {"user": "USER", "assistant": "ASSISTANT"}
+
+
+def context_chars() -> int:
+    return int(os.getenv("SOLAR_ROUTER_CONTEXT_CHARS") or "24000")
+
+
+def summary_chars() -> int:
+    return int(os.getenv("SOLAR_ROUTER_SUMMARY_CHARS") or "2000")
+
+
+def summary_every_turns() -> int:
+    return max(int(os.getenv("SOLAR_ROUTER_SUMMARY_EVERY_TURNS") or "4"), 1)
+
+
+def format_turn(item: Dict[str, str]) -> str:
+    return f"{ROLE_LABELS.get(item['role'], item['role'].upper())}: {item['text']}"
+
+
+def fit_recent(
+    recent: List[Dict[str, str]],
+    budget_chars: int,
+) -> Tuple[List[Dict[str, str]], List[Dict[str, str]]]:
+    """
+    Split `recent` (oldest first) into (overflow, kept): `kept` is the longest
+    newest suffix whose formatted lines fit in `budget_chars`.
+    """
+    if budget_chars <= 0:
+        return [], recent
+    used = 0
+    split = len(recent)
+    while split > 0:
+        cost = len(format_turn(recent[split - 1])) + 1
+        if used + cost > budget_chars:
+            break
+        used += cost
+        split -= 1
+    return recent[:split], recent[split:]
+
+
+def digest(items: List[Dict[str, str]], line_chars: int = SUMMARY_LINE_CHARS) -> List[str]:
+    """One clipped, single-line entry per record."""
+    lines = []
+    for item in items:
+        text = " ".join(item["text"].split())
+        if len(text) > line_chars:
+            text = text[: line_chars - 1].rstrip() + "…"
+        lines.append(format_turn({"role": item["role"], "text": text}))
+    return lines
+
+
+def clip_lines(lines: List[str], max_chars: int) -> List[str]:
+    """Keep the newest lines that fit in `max_chars`."""
+    kept: List[str] = []
+    used = 0
+    for line in reversed(lines):
+        used += len(line) + 1
+        if used > max_chars:
+            break
+        kept.append(line)
+    kept.reverse()
+    return kept
+
+
+class SummaryStore:
+    """Rolling per-conversation summaries under <runtime>/summaries."""
+
+    def __init__(
+        self,
+        runtime_root: pathlib.Path,
+        max_chars: Optional[int] = None,
+        every_turns: Optional[int] = None,
+    ) -> None:
+        self.directory = runtime_root / "summaries"
+        self.max_chars = summary_chars() if max_chars is None else max_chars
+        self.every_turns = max(summary_every_turns() if every_turns is None else every_turns, 1)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_chars > 0
+
+    def _path(self, conversation_id: str) -> pathlib.Path:
+        return self.directory / f"{conversation_id}.json"
+
+    def load(self, conversation_id: str) -> Dict[str, Any]:
+        try:
+            state = json.loads(self._path(conversation_id).read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            state = None
+        if not isinstance(state, dict):
+            state = {}
+        state.setdefault("lines", [])
+        state.setdefault("pending_turns", 0)
+        return state
+
+    def _save(self, conversation_id: str, state: Dict[str, Any]) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".summary.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                json.dump(state, fh, ensure_ascii=False)
+            os.replace(tmp, self._path(conversation_id))
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp)
+            raise
+
+    def context(
+        self,
+        conv_path: pathlib.Path,
+        window_turns: int,
+        budget_chars: int,
+    ) -> Tuple[str, List[Dict[str, str]]]:
+        """
+        (summary, recent) for the next prompt. The summary is the cached one plus
+        a digest of turns not folded in yet (left the window since the last
+        refresh, or in the window but over the char budget).
+        """
+        state = self.load(conv_path.stem) if self.enabled else {"lines": [], "pending_turns": 0}
+        lag = state["pending_turns"] if window_turns > 0 else 0
+        items = load_recent_messages(conv_path, window_turns + lag)
+        stale = items[: max(len(items) - window_turns * 2, 0)] if window_turns > 0 else []
+        overflow, recent = fit_recent(items[len(stale):], budget_chars)
+        if not self.enabled:
+            return "", recent
+        lines = clip_lines(state["lines"] + digest(stale + overflow), self.max_chars)
+        return "\n".join(lines), recent
+
+    def note_turn(self, conv_path: pathlib.Path, window_turns: int) -> bool:
+        """
+        Count one persisted turn; every `every_turns` turns, fold the turns that
+        fell out of the `window_turns` context window since the last refresh into
+        the summary. Returns True when the summary was refreshed.
+        """
+        if not self.enabled or window_turns <= 0:
+            # window_turns <= 0 means the full history is sent: nothing falls out.
+            return False
+        conversation_id = conv_path.stem
+        state = self.load(conversation_id)
+        state["pending_turns"] += 1
+        refreshed = False
+        if state["pending_turns"] >= self.every_turns:
+            items = load_recent_messages(conv_path, window_turns + state["pending_turns"])
+            fell_out = items[: max(len(items) - window_turns * 2, 0)]
+            if fell_out:
+                state["lines"] = clip_lines(state["lines"] + digest(fell_out), self.max_chars)
+                refreshed = True
+            state["pending_turns"] = 0
+        self._save(conversation_id, state)
+        return refreshed
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+provider_health — persistent circuit breaker and health scoreboard for providers.
+
+State lives in <runtime>/health/providers.json and is shared by every router
+process (file lock + atomic replace), so a provider that broke once is skipped
+by the next callers instead of each paying the full failure cost again.
+
+Circuit states per provider:
+    closed     normal; consecutive failures are counted
+    open       skipped until SOLAR_ROUTER_CIRCUIT_COOLDOWN_SEC has elapsed
+    half_open  cooldown over; a single probe call is let through
+
+Successful call latencies are also kept per prompt-size bucket (plus the
+timeout of calls that timed out) for adaptive timeouts (provider_timeouts).
+
+Keys:
+    SOLAR_ROUTER_CIRCUIT_FAILURES      consecutive failures that open the circuit (default: 3, 0 = disabled)
+    SOLAR_ROUTER_CIRCUIT_COOLDOWN_SEC  seconds an open circuit stays open (default: 300)
+"""
+import contextlib
+import json
+import os
+import pathlib
+import tempfile
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX
+    fcntl = None  # type: ignore[assignment]
+
+
+LATENCY_WINDOW = 50
+BUCKET_LATENCY_WINDOW = 100
+
+# Failures that will not fix themselves between two calls: open at once.
+HARD_FAILURE_MARKERS = (
+    "client binary not found",
+    "OAuth prompt in headless mode",
+)
+
+
+def circuit_failure_threshold() -> int:
+    return int(os.getenv("SOLAR_ROUTER_CIRCUIT_FAILURES") or "3")
+
+
+def circuit_cooldown_sec() -> float:
+    return float(os.getenv("SOLAR_ROUTER_CIRCUIT_COOLDOWN_SEC") or "300")
+
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(int(round(pct / 100.0 * (len(ordered) - 1))), len(ordered) - 1)
+    return round(ordered[index], 3)
+
+
+def _new_entry() -> Dict[str, Any]:
+    return {
+        "state": "closed",
+        "consecutive_failures": 0,
+        "successes": 0,
+        "failures": 0,
+        "opened_at": None,
+        "probe_started_at": None,
+        "last_success_at": None,
+        "last_failure_at": None,
+        "last_error": None,
+        "latencies_sec": [],
+        "bucket_latencies_sec": {},
+    }
+
+
+def _add_bucket_sample(entry: Dict[str, Any], bucket: str, latency_sec: float) -> None:
+    buckets = entry.get("bucket_latencies_sec") or {}
+    samples = buckets.get(bucket) or []
+    samples.append(round(latency_sec, 3))
+    buckets[bucket] = samples[-BUCKET_LATENCY_WINDOW:]
+    entry["bucket_latencies_sec"] = buckets
+
+
+class CircuitOpenError(RuntimeError):
+    """Provider skipped because its circuit is open."""
+
+
+class ProviderHealth:
+    """Circuit breaker + scoreboard backed by a small JSON file."""
+
+    def __init__(
+        self,
+        runtime_root: pathlib.Path,
+        failure_threshold: Optional[int] = None,
+        cooldown_sec: Optional[float] = None,
+        probe_timeout_sec: float = 300.0,
+    ) -> None:
+        self.path = runtime_root / "health" / "providers.json"
+        self.failure_threshold = (
+            circuit_failure_threshold() if failure_threshold is None else failure_threshold
+        )
+        self.cooldown_sec = circuit_cooldown_sec() if cooldown_sec is None else cooldown_sec
+        # A probe that never reported back (crashed process) stops blocking after this.
+        self.probe_timeout_sec = probe_timeout_sec
+
+    # -- storage ------------------------------------------------------------
+
+    @contextlib.contextmanager
+    def _locked(self) -> Iterator[Dict[str, Dict[str, Any]]]:
+        """Read-modify-write the state file under an exclusive lock."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        lock_path = self.path.with_suffix(".lock")
+        with lock_path.open("a") as lock_fh:
+            if fcntl is not None:
+                fcntl.flock(lock_fh.fileno(), fcntl.LOCK_EX)
+            try:
+                state = self._read()
+                yield state
+                self._write(state)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_fh.fileno(), fcntl.LOCK_UN)
+
+    def _read(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def _write(self, state: Dict[str, Dict[str, Any]]) -> None:
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, prefix=".providers.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                json.dump(state, fh, indent=2, sort_keys=True)
+            os.replace(tmp, self.path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp)
+            raise
+
+    # -- circuit ------------------------------------------------------------
+
+    def allow(self, provider: str) -> bool:
+        """True if `provider` may be called now. Moves open -> half_open after cooldown."""
+        if self.failure_threshold <= 0:
+            return True
+        entry = self._read().get(provider)
+        if not entry or entry.get("state") == "closed":
+            # Fast path: no lock, no write for healthy providers.
+            return True
+        now = time.time()
+        with self._locked() as state:
+            entry = state.setdefault(provider, _new_entry())
+            if entry["state"] == "closed":
+                return True
+            if entry["state"] == "open":
+                if now - (entry["opened_at"] or 0) < self.cooldown_sec:
+                    return False
+                entry["state"] = "half_open"
+                entry["probe_started_at"] = now
+                return True
+            # half_open: one probe at a time
+            probe_started = entry.get("probe_started_at") or 0
+            if now - probe_started > self.probe_timeout_sec:
+                entry["probe_started_at"] = now
+                return True
+            return False
+
+    def blocked(self, provider: str) -> bool:
+        """Read-only check: circuit open within cooldown, or a half-open probe in flight."""
+        if self.failure_threshold <= 0:
+            return False
+        entry = self._read().get(provider)
+        if not entry or entry.get("state") == "closed":
+            return False
+        now = time.time()
+        if entry.get("state") == "open":
+            return now - (entry.get("opened_at") or 0) < self.cooldown_sec
+        return now - (entry.get("probe_started_at") or 0) <= self.probe_timeout_sec
+
+    def record_success(self, provider: str, latency_sec: float, bucket: Optional[str] = None) -> None:
+        with self._locked() as state:
+            entry = state.setdefault(provider, _new_entry())
+            entry["state"] = "closed"
+            entry["consecutive_failures"] = 0
+            entry["opened_at"] = None
+            entry["probe_started_at"] = None
+            entry["successes"] += 1
+            entry["last_success_at"] = time.time()
+            latencies = entry.get("latencies_sec") or []
+            latencies.append(round(latency_sec, 3))
+            entry["latencies_sec"] = latencies[-LATENCY_WINDOW:]
+            if bucket:
+                _add_bucket_sample(entry, bucket, latency_sec)
+
+    def record_failure(
+        self,
+        provider: str,
+        error: str,
+        bucket: Optional[str] = None,
+        timed_out_sec: Optional[float] = None,
+    ) -> None:
+        """`timed_out_sec`: the call hit this timeout; kept as a bucket sample so the
+        derived timeout grows when a provider gets slower instead of timing out forever."""
+        now = time.time()
+        with self._locked() as state:
+            entry = state.setdefault(provider, _new_entry())
+            entry["consecutive_failures"] += 1
+            entry["failures"] += 1
+            entry["last_failure_at"] = now
+            entry["last_error"] = error[:500]
+            if bucket and timed_out_sec is not None:
+                _add_bucket_sample(entry, bucket, timed_out_sec)
+            hard = any(marker in error for marker in HARD_FAILURE_MARKERS)
+            if self.failure_threshold > 0 and (
+                hard
+                or entry["state"] == "half_open"
+                or entry["consecutive_failures"] >= self.failure_threshold
+            ):
+                entry["state"] = "open"
+                entry["opened_at"] = now
+                entry["probe_started_at"] = None
+
+    def reset(self, providers: Optional[List[str]] = None) -> None:
+        with self._locked() as state:
+            for name in providers or list(state):
+                state.pop(name, None)
+
+    # -- reporting ----------------------------------------------------------
+
+    def latency_percentile(
+        self,
+        provider: str,
+        pct: float,
+        bucket: Optional[str] = None,
+        min_samples: int = 1,
+    ) -> Optional[float]:
+        """
+        `pct` percentile of the `bucket` samples, or of all successful calls
+        when the bucket has fewer than `min_samples`; None when neither has.
+        """
+        entry = self._read().get(provider) or {}
+        samples = (entry.get("bucket_latencies_sec") or {}).get(bucket) or [] if bucket else []
+        if len(samples) < min_samples:
+            samples = entry.get("latencies_sec") or []
+        if len(samples) < max(min_samples, 1):
+            return None
+        return _percentile(samples, pct)
+
+    def scoreboard(self) -> Dict[str, Dict[str, Any]]:
+        now = time.time()
+        board: Dict[str, Dict[str, Any]] = {}
+        for name, entry in sorted(self._read().items()):
+            latencies = entry.get("latencies_sec") or []
+            row = {
+                "state": entry.get("state", "closed"),
+                "consecutive_failures": entry.get("consecutive_failures", 0),
+                "successes": entry.get("successes", 0),
+                "failures": entry.get("failures", 0),
+                "latency_p50_sec": _percentile(latencies, 50),
+                "latency_p95_sec": _percentile(latencies, 95),
+                "latency_p99_sec": _percentile(latencies, 99),
+                "bucket_latency_p99_sec": {
+                    bucket: _percentile(samples, 99)
+                    for bucket, samples in sorted((entry.get("bucket_latencies_sec") or {}).items())
+                },
+                "last_error": entry.get("last_error"),
+            }
+            if row["state"] == "open" and entry.get("opened_at"):
+                row["reopens_in_sec"] = max(
+                    round(self.cooldown_sec - (now - entry["opened_at"]), 1), 0.0
+                )
+            board[name] = row
+        return board
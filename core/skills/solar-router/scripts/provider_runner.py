@@ -0,0 +1,528 @@
+#!/usr/bin/env python3
+"""
+provider_runner — asyncio subprocess execution for solar-router providers.
+
+One background event loop per process owns every provider child process, so a
+per-provider concurrency limit holds no matter which thread or loop submits
+the call. Callers use `run()` from async code or `run_sync()` from threads;
+`on_stdout` receives stdout incrementally for streaming consumers, and
+`stdin_data` is fed to the child's stdin (closed otherwise).
+
+Output capture is bounded: stderr keeps its last STDERR_TAIL_BYTES, and with
+a SpillPolicy stdout past the threshold goes to a file in the spill
+directory instead of memory; the result's stdout is then a SpilledOutput
+(preview string plus file path).
+
+Concurrency (per provider, 0 = unlimited):
+    SOLAR_ROUTER_<PROVIDER>_MAX_CONCURRENCY, default SOLAR_ROUTER_PROVIDER_MAX_CONCURRENCY (4)
+
+On timeout or cancellation the whole child process group is killed, so
+provider CLIs that fork helpers do not leak. A Cancellation lets another
+thread cancel the calls of one request (`run_sync` / `run_coroutine` then
+raise ProviderCancelled once the child is dead).
+"""
+import asyncio
+import codecs
+import contextlib
+import os
+import pathlib
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Callable, Coroutine, Dict, Iterator, List, Optional
+
+
+DEFAULT_MAX_CONCURRENCY = 4
+STREAM_READ_SIZE = 4096
+STDERR_TAIL_BYTES = 64 * 1024
+SPILL_PREVIEW_BYTES = 4096
+
+# Called on the runner loop with each decoded stdout piece; must not block.
+OutputCallback = Callable[[str], None]
+
+
+class ProviderTimeout(RuntimeError):
+    """Provider did not finish (or could not start) within its deadline."""
+
+
+class ProviderCancelled(RuntimeError):
+    """The request was cancelled; its provider process was killed or never started."""
+
+
+class Cancellation:
+    """Cancel flag for one request; `cancel()` from any thread runs the registered callbacks."""
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()  # cancel() may run in a signal handler
+        self._event = threading.Event()
+        self._callbacks: Dict[int, Callable[[], Any]] = {}
+        self._next_id = 0
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = list(self._callbacks.values()), {}
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass  # best effort: the target may have finished meanwhile
+
+    @contextlib.contextmanager
+    def on_cancel(self, callback: Callable[[], Any]) -> Iterator[None]:
+        """Run `callback` if the request is cancelled while the block runs (at once if it already was)."""
+        with self._lock:
+            if not self._event.is_set():
+                key = self._next_id
+                self._next_id += 1
+                self._callbacks[key] = callback
+            else:
+                key = None
+        if key is None:
+            callback()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._callbacks.pop(key, None)
+
+
+@dataclass
+class SpillPolicy:
+    """Stdout beyond `threshold_bytes` is written to `directory` instead of memory."""
+    directory: pathlib.Path
+    threshold_bytes: int
+    retention_sec: float = 86400.0
+
+
+class SpilledOutput(str):
+    """
+    Provider stdout that exceeded the spill threshold. The string value is a
+    preview (its first SPILL_PREVIEW_BYTES); `path` holds the raw output and
+    `size` its length in bytes.
+    """
+
+    path: str
+    size: int
+
+    def __new__(cls, preview: str, path: str, size: int) -> "SpilledOutput":
+        output = super().__new__(cls, preview)
+        output.path = path
+        output.size = size
+        return output
+
+
+def discard_output(output: str) -> None:
+    """Delete the spill file behind `output`, if any (failed or unused attempts)."""
+    if isinstance(output, SpilledOutput):
+        with contextlib.suppress(OSError):
+            os.unlink(output.path)
+
+
+@dataclass
+class ProcessResult:
+    returncode: int
+    stdout: str  # SpilledOutput when spilled
+    stderr: str
+    queue_wait_sec: float
+    run_sec: float
+
+
+def max_concurrency(provider: str) -> int:
+    raw = (
+        os.getenv(f"SOLAR_ROUTER_{provider.upper()}_MAX_CONCURRENCY")
+        or os.getenv("SOLAR_ROUTER_PROVIDER_MAX_CONCURRENCY")
+        or str(DEFAULT_MAX_CONCURRENCY)
+    )
+    try:
+        return max(int(raw), 0)
+    except ValueError:
+        return DEFAULT_MAX_CONCURRENCY
+
+
+def kill_process_tree(proc: "asyncio.subprocess.Process") -> None:
+    """
+    SIGKILL the child's process group (it was started in its own session),
+    even when the lead process already exited: grandchildren may still hold
+    its stdout/stderr pipes open.
+    """
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(proc.pid, signal.SIGKILL)
+        elif proc.returncode is None:  # pragma: no cover - non-POSIX
+            proc.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def sweep_spilled_outputs(directory: pathlib.Path, max_age_sec: float) -> None:
+    """Delete spill files older than `max_age_sec` that nobody moved away."""
+    cutoff = time.time() - max_age_sec
+    for path in directory.glob("*.out"):
+        with contextlib.suppress(OSError):
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+
+
+class _Capture:
+    """
+    Bytes from one child stream: in memory, keeping only the last `tail_bytes`
+    when set, or moved to a spill file once `spill.threshold_bytes` is passed.
+    """
+
+    def __init__(self, spill: Optional[SpillPolicy] = None, tail_bytes: int = 0, label: str = "") -> None:
+        self.spill = spill if spill is not None and spill.threshold_bytes > 0 else None
+        self.tail_bytes = tail_bytes
+        self.label = label
+        self.buffer = bytearray()
+        self.size = 0
+        self.preview = b""
+        self.path: Optional[str] = None
+        self._file: Optional[Any] = None
+
+    def write(self, data: bytes) -> None:
+        self.size += len(data)
+        if self._file is not None:
+            self._file.write(data)
+            return
+        self.buffer += data
+        if self.tail_bytes and len(self.buffer) > 2 * self.tail_bytes:
+            del self.buffer[:-self.tail_bytes]
+        elif self.spill is not None and len(self.buffer) > self.spill.threshold_bytes:
+            self._open_spill(self.spill)
+
+    def _open_spill(self, spill: SpillPolicy) -> None:
+        spill.directory.mkdir(parents=True, exist_ok=True)
+        sweep_spilled_outputs(spill.directory, spill.retention_sec)
+        fd, self.path = tempfile.mkstemp(dir=spill.directory, prefix=f"{self.label}-", suffix=".out")
+        self._file = os.fdopen(fd, "wb")
+        self._file.write(self.buffer)
+        self.preview = bytes(self.buffer[:SPILL_PREVIEW_BYTES])
+        self.buffer = bytearray()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def discard(self) -> None:
+        self.close()
+        if self.path is not None:
+            with contextlib.suppress(OSError):
+                os.unlink(self.path)
+            self.path = None
+
+    def text(self) -> str:
+        if self.path is None:
+            data = self.buffer[-self.tail_bytes:] if self.tail_bytes else self.buffer
+            return data.decode("utf-8", errors="replace")
+        # Not final: a character cut at the preview edge is dropped, not replaced.
+        preview = codecs.getincrementaldecoder("utf-8")(errors="replace").decode(self.preview)
+        return SpilledOutput(preview, self.path, self.size)
+
+
+async def _drain(
+    stream: Optional[asyncio.StreamReader],
+    sink: _Capture,
+    on_text: Optional[OutputCallback],
+) -> None:
+    """Read `stream` to EOF into `sink`, forwarding decoded text to `on_text` as it arrives."""
+    if stream is None:
+        return
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    while True:
+        data = await stream.read(STREAM_READ_SIZE)
+        if not data:
+            break
+        sink.write(data)
+        if on_text is not None:
+            text = decoder.decode(data)
+            if text:
+                try:
+                    on_text(text)
+                except Exception:
+                    # A broken consumer must not abort the provider call.
+                    on_text = None
+    tail = decoder.decode(b"", final=True)
+    if on_text is not None and tail:
+        try:
+            on_text(tail)
+        except Exception:
+            pass
+
+
+async def _feed(stream: Optional[asyncio.StreamWriter], data: bytes) -> None:
+    """Write `data` to the child's stdin and close it; a child that exits early is not an error."""
+    if stream is None:
+        return
+    try:
+        stream.write(data)
+        await stream.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        pass
+    finally:
+        try:
+            stream.close()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class _ProviderSlot:
+    """Semaphore plus queue-wait counters for one provider."""
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.semaphore = asyncio.Semaphore(limit) if limit > 0 else None
+        self.waiting = 0
+        self.in_flight = 0
+        self.calls = 0
+        self.wait_total_sec = 0.0
+        self.wait_max_sec = 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.limit,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "calls": self.calls,
+            "queue_wait_avg_sec": round(self.wait_total_sec / self.calls, 4) if self.calls else 0.0,
+            "queue_wait_max_sec": round(self.wait_max_sec, 4),
+        }
+
+
+class ProviderRunner:
+    """Runs provider CLIs on a dedicated background event loop."""
+
+    def __init__(self) -> None:
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._slots: Dict[str, _ProviderSlot] = {}
+
+    # -- loop management ----------------------------------------------------
+
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._start_lock:
+            if self._loop is None:
+                ready = threading.Event()
+
+                def _serve() -> None:
+                    self._loop = asyncio.new_event_loop()
+                    asyncio.set_event_loop(self._loop)
+                    ready.set()
+                    self._loop.run_forever()
+
+                self._thread = threading.Thread(
+                    target=_serve, name="solar-provider-runner", daemon=True
+                )
+                self._thread.start()
+                ready.wait()
+            assert self._loop is not None
+            return self._loop
+
+    def submit(self, coro: Coroutine[Any, Any, Any]) -> "Future[Any]":
+        """Schedule a coroutine on the runner loop; returns a concurrent Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop())
+
+    def run_coroutine(
+        self,
+        coro: Coroutine[Any, Any, Any],
+        cancellation: Optional[Cancellation] = None,
+    ) -> Any:
+        """
+        Run `coro` on the runner loop and block until it has completely
+        finished. A cancelled call returns only after the coroutine unwound
+        (child process groups killed), then raises ProviderCancelled.
+        """
+        loop = self.loop()
+        finished = threading.Event()
+        tasks: List["asyncio.Task[Any]"] = []
+
+        def start() -> None:
+            task = loop.create_task(coro)
+            task.add_done_callback(lambda _: finished.set())
+            tasks.append(task)
+
+        def cancel() -> None:
+            # Queued after start(): the task exists when this runs.
+            loop.call_soon_threadsafe(lambda: tasks[0].cancel())
+
+        loop.call_soon_threadsafe(start)
+        try:
+            if cancellation is None:
+                finished.wait()
+            else:
+                with cancellation.on_cancel(cancel):
+                    finished.wait()
+        except BaseException:
+            cancel()
+            raise
+        task = tasks[0]
+        if task.cancelled():
+            raise ProviderCancelled("request cancelled")
+        return task.result()
+
+    def _slot(self, provider: str) -> _ProviderSlot:
+        slot = self._slots.get(provider)
+        if slot is None:
+            slot = _ProviderSlot(max_concurrency(provider))
+            self._slots[provider] = slot
+        return slot
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: slot.snapshot() for name, slot in sorted(self._slots.items())}
+
+    # -- execution ----------------------------------------------------------
+
+    async def _execute(
+        self,
+        provider: str,
+        cmd: List[str],
+        timeout_sec: float,
+        cwd: Optional[str],
+        env: Optional[Dict[str, str]],
+        on_stdout: Optional[OutputCallback] = None,
+        stdin_data: Optional[bytes] = None,
+        spill: Optional[SpillPolicy] = None,
+    ) -> ProcessResult:
+        slot = self._slot(provider)
+        queued_at = time.monotonic()
+        # One deadline for the whole call: the slot wait eats into the run time.
+        deadline = queued_at + timeout_sec
+        slot.waiting += 1
+        try:
+            if slot.semaphore is not None:
+                try:
+                    await asyncio.wait_for(slot.semaphore.acquire(), timeout=timeout_sec)
+                except asyncio.TimeoutError:
+                    raise ProviderTimeout(
+                        f"{provider} waited {timeout_sec}s for a free slot "
+                        f"(max_concurrency={slot.limit})"
+                    ) from None
+        finally:
+            slot.waiting -= 1
+        wait_sec = time.monotonic() - queued_at
+        slot.calls += 1
+        slot.wait_total_sec += wait_sec
+        slot.wait_max_sec = max(slot.wait_max_sec, wait_sec)
+        slot.in_flight += 1
+        started_at = time.monotonic()
+        stdout = _Capture(spill, label=provider)
+        stderr = _Capture(tail_bytes=STDERR_TAIL_BYTES)
+        try:
+            run_timeout_sec = deadline - started_at
+            if run_timeout_sec <= 0:
+                raise ProviderTimeout(f"{provider} timed out after {timeout_sec}s waiting for a free slot")
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=subprocess.DEVNULL if stdin_data is None else subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                cwd=cwd,
+                env=env,
+                start_new_session=True,
+            )
+            io = asyncio.gather(
+                _feed(proc.stdin, stdin_data or b""),
+                _drain(proc.stdout, stdout, on_stdout),
+                _drain(proc.stderr, stderr, None),
+                proc.wait(),
+            )
+            # A cancelled call (hedge loser) may leave the gather to finish after
+            # nobody awaits it; consume its outcome so asyncio does not log it.
+            io.add_done_callback(lambda fut: fut.cancelled() or fut.exception())
+            try:
+                await asyncio.wait_for(io, timeout=run_timeout_sec)
+            except asyncio.TimeoutError:
+                kill_process_tree(proc)
+                await proc.wait()
+                raise ProviderTimeout(f"{provider} timed out after {timeout_sec}s") from None
+            except asyncio.CancelledError:
+                kill_process_tree(proc)
+                raise
+            stdout.close()
+            return ProcessResult(
+                returncode=proc.returncode if proc.returncode is not None else -1,
+                stdout=stdout.text(),
+                stderr=stderr.text(),
+                queue_wait_sec=wait_sec,
+                run_sec=time.monotonic() - started_at,
+            )
+        except BaseException:
+            stdout.discard()
+            raise
+        finally:
+            slot.in_flight -= 1
+            if slot.semaphore is not None:
+                slot.semaphore.release()
+
+    async def run(
+        self,
+        provider: str,
+        cmd: List[str],
+        timeout_sec: float,
+        cwd: Optional[str] = None,
+        env: Optional[Dict[str, str]] = None,
+        on_stdout: Optional[OutputCallback] = None,
+        stdin_data: Optional[bytes] = None,
+        spill: Optional[SpillPolicy] = None,
+    ) -> ProcessResult:
+        """Await a provider call from any event loop."""
+        try:
+            on_runner_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            on_runner_loop = False
+        if on_runner_loop:
+            # Already on the runner loop (e.g. hedged races): cancellation propagates directly.
+            return await self._execute(provider, cmd, timeout_sec, cwd, env, on_stdout, stdin_data, spill)
+        future = self.submit(self._execute(provider, cmd, timeout_sec, cwd, env, on_stdout, stdin_data, spill))
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # Propagate cancellation into the runner loop so the child is killed.
+            future.cancel()
+            raise
+
+    def run_sync(
+        self,
+        provider: str,
+        cmd: List[str],
+        timeout_sec: float,
+        cwd: Optional[str] = None,
+        env: Optional[Dict[str, str]] = None,
+        on_stdout: Optional[OutputCallback] = None,
+        stdin_data: Optional[bytes] = None,
+        spill: Optional[SpillPolicy] = None,
+        cancellation: Optional[Cancellation] = None,
+    ) -> ProcessResult:
+        """Blocking provider call for threads outside the runner loop."""
+        try:
+            return self.run_coroutine(
+                self._execute(provider, cmd, timeout_sec, cwd, env, on_stdout, stdin_data, spill),
+                cancellation,
+            )
+        except ProviderCancelled:
+            raise ProviderCancelled(f"{provider} cancelled") from None
+
+
+_default_runner: Optional[ProviderRunner] = None
+_default_runner_lock = threading.Lock()
+
+
+def default_runner() -> ProviderRunner:
+    """Process-wide runner shared by every RouterService in this process."""
+    global _default_runner
+    with _default_runner_lock:
+        if _default_runner is None:
+            _default_runner = ProviderRunner()
+        return _default_runner
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+provider_timeouts — adaptive per-attempt provider timeouts and channel budgets.
+
+A single static timeout makes a hung provider burn the whole limit before
+fallback. The timeout of each attempt is instead derived from the latencies
+ProviderHealth keeps per provider and prompt-size bucket:
+
+    clamp(p<PERCENTILE> x FACTOR, FLOOR, ceiling)
+
+falling back to all of the provider's successful calls when the bucket is
+thin, and to the ceiling when there are fewer than MIN_SAMPLES of those. The
+ceiling is the channel budget when one is set, else
+SOLAR_ROUTER_PROVIDER_TIMEOUT_SEC. A channel budget also bounds the whole
+request: fallback and hedged attempts only get what is left of it. A
+cancelled request starts no further attempts.
+
+Keys:
+    SOLAR_ROUTER_ADAPTIVE_TIMEOUT        derive timeouts from observed latency (default: true)
+    SOLAR_ROUTER_TIMEOUT_PERCENTILE      latency percentile used (default: 99)
+    SOLAR_ROUTER_TIMEOUT_FACTOR          multiplier on that percentile (default: 3)
+    SOLAR_ROUTER_TIMEOUT_FLOOR_SEC       lowest derived timeout (default: 30)
+    SOLAR_ROUTER_TIMEOUT_MIN_SAMPLES     samples needed before deriving (default: 20)
+    SOLAR_ROUTER_CHANNEL_BUDGETS_SEC     per-channel request budgets, e.g. "telegram=90,async-task=1800" (default: none)
+"""
+import os
+import time
+from typing import Dict, Optional
+
+from provider_health import ProviderHealth
+from provider_runner import Cancellation, ProviderCancelled, ProviderTimeout
+
+
+# (upper bound in prompt chars, bucket name); larger prompts are "xl"
+PROMPT_SIZE_BUCKETS = ((2_000, "s"), (8_000, "m"), (32_000, "l"))
+
+# Below this, starting another provider call cannot produce a reply.
+MIN_ATTEMPT_SEC = 1.0
+
+
+def adaptive_timeout_enabled() -> bool:
+    return (os.getenv("SOLAR_ROUTER_ADAPTIVE_TIMEOUT") or "true").strip().lower() not in {"0", "false", "no", "off"}
+
+
+def timeout_percentile() -> float:
+    return float(os.getenv("SOLAR_ROUTER_TIMEOUT_PERCENTILE") or "99")
+
+
+def timeout_factor() -> float:
+    return float(os.getenv("SOLAR_ROUTER_TIMEOUT_FACTOR") or "3")
+
+
+def timeout_floor_sec() -> float:
+    return float(os.getenv("SOLAR_ROUTER_TIMEOUT_FLOOR_SEC") or "30")
+
+
+def timeout_min_samples() -> int:
+    return int(os.getenv("SOLAR_ROUTER_TIMEOUT_MIN_SAMPLES") or "20")
+
+
+def channel_budgets_sec() -> Dict[str, float]:
+    """`channel=seconds` pairs, comma separated; malformed entries are ignored."""
+    budgets: Dict[str, float] = {}
+    for item in (os.getenv("SOLAR_ROUTER_CHANNEL_BUDGETS_SEC") or "").split(","):
+        channel, sep, value = item.partition("=")
+        try:
+            seconds = float(value)
+        except ValueError:
+            continue
+        if sep and channel.strip() and seconds > 0:
+            budgets[channel.strip().lower()] = seconds
+    return budgets
+
+
+def prompt_size_bucket(prompt: str) -> str:
+    size = len(prompt)
+    for bound, name in PROMPT_SIZE_BUCKETS:
+        if size < bound:
+            return name
+    return "xl"
+
+
+class ProviderDeadline:
+    """Timeouts for the provider attempts of one request."""
+
+    def __init__(
+        self,
+        policy: "TimeoutPolicy",
+        channel: str,
+        bucket: str,
+        ceiling_sec: float,
+        budget_sec: Optional[float],
+        cancellation: Optional[Cancellation] = None,
+    ) -> None:
+        self.policy = policy
+        self.channel = channel
+        self.bucket = bucket
+        self.ceiling_sec = ceiling_sec
+        self.budget_sec = budget_sec
+        self.cancellation = cancellation
+        self._ends_at = time.monotonic() + budget_sec if budget_sec else None
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancellation is not None and self.cancellation.cancelled
+
+    def remaining_sec(self) -> Optional[float]:
+        return None if self._ends_at is None else self._ends_at - time.monotonic()
+
+    def timeout_for(self, provider: str) -> float:
+        """
+        Timeout for the next `provider` attempt. Raises ProviderTimeout when the
+        budget is spent, ProviderCancelled when the request was cancelled.
+        """
+        if self.cancelled:
+            raise ProviderCancelled(f"request cancelled; {provider} not started")
+        timeout = self.policy.attempt_timeout(provider, self.bucket, self.ceiling_sec)
+        remaining = self.remaining_sec()
+        if remaining is not None:
+            if remaining < MIN_ATTEMPT_SEC:
+                raise ProviderTimeout(
+                    f"{self.channel} budget of {self.budget_sec:g}s exhausted; {provider} not started"
+                )
+            timeout = min(timeout, remaining)
+        return round(timeout, 3)
+
+
+class TimeoutPolicy:
+    """Derives attempt timeouts from ProviderHealth latency samples."""
+
+    def __init__(self, health: ProviderHealth, static_timeout_sec: float) -> None:
+        self.health = health
+        self.static_timeout_sec = float(static_timeout_sec)
+        self.enabled = adaptive_timeout_enabled()
+        self.percentile = timeout_percentile()
+        self.factor = timeout_factor()
+        self.floor_sec = timeout_floor_sec()
+        self.min_samples = timeout_min_samples()
+        self.channel_budgets = channel_budgets_sec()
+
+    def deadline(
+        self,
+        channel: str,
+        prompt: str,
+        cancellation: Optional[Cancellation] = None,
+    ) -> ProviderDeadline:
+        budget = self.channel_budgets.get(channel)
+        return ProviderDeadline(
+            self,
+            channel,
+            prompt_size_bucket(prompt),
+            ceiling_sec=budget or self.static_timeout_sec,
+            budget_sec=budget,
+            cancellation=cancellation,
+        )
+
+    def turn_budget_sec(self, attempts: int) -> float:
+        """Worst case for one request: a full fallback chain, or the longest channel budget."""
+        return max(self.static_timeout_sec * max(attempts, 1), *self.channel_budgets.values(), 0.0)
+
+    def attempt_timeout(self, provider: str, bucket: str, ceiling_sec: float) -> float:
+        if not self.enabled:
+            return ceiling_sec
+        observed = self.health.latency_percentile(provider, self.percentile, bucket, self.min_samples)
+        if observed is None:
+            return ceiling_sec
+        return min(max(observed * self.factor, self.floor_sec), ceiling_sec)
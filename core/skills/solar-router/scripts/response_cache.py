@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+response_cache — opt-in, disk-backed cache of provider output for solar-router.
+
+Entries live in <runtime>/cache/<sha256>.json and are keyed on the fully built
+prompt plus mode, channel and provider selection, so a hit only happens when
+the provider would have seen exactly the same input.
+
+Keys:
+    SOLAR_ROUTER_CACHE_TTL_SEC      entry lifetime; 0 disables the cache (default: 0)
+    SOLAR_ROUTER_CACHE_MAX_ENTRIES  LRU bound on entry count (default: 500)
+    SOLAR_ROUTER_CACHE_MAX_BYTES    LRU bound on total size (default: 67108864)
+
+Recency is tracked with file mtimes (touched on every hit), so the LRU order is
+shared by all router processes without an index file.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+import time
+from typing import Any, Dict, Optional
+
+
+def cache_ttl_sec() -> float:
+    return float(os.getenv("SOLAR_ROUTER_CACHE_TTL_SEC") or "0")
+
+
+def cache_max_entries() -> int:
+    return int(os.getenv("SOLAR_ROUTER_CACHE_MAX_ENTRIES") or "500")
+
+
+def cache_max_bytes() -> int:
+    return int(os.getenv("SOLAR_ROUTER_CACHE_MAX_BYTES") or str(64 * 1024 * 1024))
+
+
+def cache_key(prompt: str, mode: str, channel: str, provider: str) -> str:
+    digest = hashlib.sha256()
+    for part in (mode, channel, provider, prompt):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """TTL + size-bounded LRU cache of provider outputs stored as JSON files."""
+
+    def __init__(
+        self,
+        runtime_root: pathlib.Path,
+        ttl_sec: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+    ) -> None:
+        self.directory = runtime_root / "cache"
+        self.ttl_sec = cache_ttl_sec() if ttl_sec is None else ttl_sec
+        self.max_entries = cache_max_entries() if max_entries is None else max_entries
+        self.max_bytes = cache_max_bytes() if max_bytes is None else max_bytes
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_sec > 0
+
+    def _path(self, key: str) -> pathlib.Path:
+        return self.directory / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return {"output", "provider_used", "age_sec"} for a fresh entry, else None."""
+        path = self._path(key)
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            return None
+        age = time.time() - float(entry.get("created_at", 0))
+        if age > self.ttl_sec or not isinstance(entry.get("output"), str):
+            with contextlib.suppress(OSError):
+                path.unlink()
+            return None
+        with contextlib.suppress(OSError):
+            os.utime(path)  # mark as recently used
+        return {
+            "output": entry["output"],
+            "provider_used": entry.get("provider_used"),
+            "age_sec": round(age, 3),
+        }
+
+    def put(self, key: str, output: str, provider_used: Optional[str]) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        entry = {"created_at": time.time(), "provider_used": provider_used, "output": output}
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".entry.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                json.dump(entry, fh, ensure_ascii=False)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp)
+            raise
+        self.evict()
+
+    def evict(self) -> int:
+        """Drop expired entries, then least recently used ones beyond the bounds."""
+        now = time.time()
+        entries = []
+        for path in self.directory.glob("*.json"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        entries.sort()
+        total_bytes = sum(size for _, size, _ in entries)
+        removed = 0
+        for index, (mtime, size, path) in enumerate(entries):
+            remaining = len(entries) - index
+            expired = now - mtime > self.ttl_sec
+            over_bounds = remaining > self.max_entries or total_bytes > self.max_bytes
+            if not (expired or over_bounds):
+                # mtime is >= creation time, so later entries cannot be expired either.
+                break
+            with contextlib.suppress(OSError):
+                path.unlink()
+                removed += 1
+            total_bytes -= size
+        return removed
@@ -4,17 +4,71 @@ solar-router v3 — single source of truth for AI execution and routing policy.
 
 Input  (stdin): JSON matching RouterRequest contract v3
 Output (stdout): JSON matching RouterResponse contract v3
+         (`--stream`: JSONL `partial` frames followed by the final response)
+
+Maintenance: `run_router.py compact [conversation_id ...]` compacts conversation segments;
+`run_router.py health [reset [provider ...]]` prints (or resets) the provider scoreboard.
 """
+import asyncio
+import contextlib
+import functools
+import hashlib
 import json
 import os
 import pathlib
 import re
 import shlex
 import shutil
-import subprocess
+import signal
 import sys
-from typing import Any, Dict, List, Optional
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterable, Iterator, List, Optional
+
+# Sibling modules must resolve when this file is loaded by path (importlib, bridges).
+_SCRIPTS_DIR = str(pathlib.Path(__file__).resolve().parent)
+if _SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, _SCRIPTS_DIR)
+_ASYNC_TASKS_SCRIPTS_DIR = str(
+    pathlib.Path(__file__).resolve().parents[2] / "solar-async-tasks" / "scripts"
+)
+if _ASYNC_TASKS_SCRIPTS_DIR not in sys.path:
+    sys.path.append(_ASYNC_TASKS_SCRIPTS_DIR)
 
+from conversation_store import (  # noqa: E402
+    compact_conversation,
+    conversation_paths,
+    rotate_if_needed,
+)
+from conversation_lock import HOLD_MARGIN_SEC, ConversationBusyError, ConversationLocks  # noqa: E402
+from conversation_writer import ConversationWriter  # noqa: E402
+from decision_extract import (  # noqa: E402
+    DecisionExtractor,
+    extract_decision_from_file,
+    extract_decision_object,
+)
+from metrics import MetricsSink, StageTimings, timings_enabled  # noqa: E402
+from prompt_context import SummaryStore, context_chars, format_turn  # noqa: E402
+from provider_health import CircuitOpenError, ProviderHealth  # noqa: E402
+from provider_runner import (  # noqa: E402
+    Cancellation,
+    OutputCallback,
+    ProcessResult,
+    ProviderCancelled,
+    ProviderRunner,
+    ProviderTimeout,
+    SpillPolicy,
+    SpilledOutput,
+    default_runner,
+    discard_output,
+)
+from provider_timeouts import ProviderDeadline, TimeoutPolicy  # noqa: E402
+from response_cache import ResponseCache, cache_key  # noqa: E402
+from singleflight import SingleFlight, coalesce_enabled  # noqa: E402
+from task_store import TaskStore, task_root  # noqa: E402
 
 SUPPORTED_PROVIDERS = {"codex", "claude", "gemini"}
 CODEX_STATE_DIR = pathlib.Path.home() / ".codex"
@@ -54,8 +108,6 @@ SYSTEM_PROMPT_FILE = (
     _system_prompt_path if _system_prompt_path.is_absolute() else REPO_ROOT / _system_prompt_path
 )
 
-ASYNC_TASKS_CREATE_SCRIPT = REPO_ROOT / "core/skills/solar-async-tasks/scripts/create.sh"
-
 VALID_MODES = {"auto", "direct_only", "async_only"}
 VALID_CHANNELS = {"telegram", "n8n", "async-task", "other"}
 VALID_DECISION_KINDS = {
@@ -92,40 +144,16 @@ def conversation_file(conversation_id: str) -> pathlib.Path:
     return RUNTIME_ROOT / "conversations" / f"{sanitize_id(conversation_id)}.jsonl"
 
 
-def read_system_prompt() -> str:
-    if not SYSTEM_PROMPT_FILE.exists():
-        return (
-            "You are Solar, a practical AI assistant. Keep continuity with previous"
-            " conversation turns and answer with clear, useful output."
-        )
-    return SYSTEM_PROMPT_FILE.read_text(encoding="utf-8").strip()
+DEFAULT_SYSTEM_PROMPT = (
+    "You are Solar, a practical AI assistant. Keep continuity with previous"
+    " conversation turns and answer with clear, useful output."
+)
 
 
-def load_recent_messages(path: pathlib.Path) -> List[Dict[str, str]]:
+def read_system_prompt(path: pathlib.Path = SYSTEM_PROMPT_FILE) -> str:
     if not path.exists():
-        return []
-    items: List[Dict[str, str]] = []
-    for line in path.read_text(encoding="utf-8").splitlines():
-        line = line.strip()
-        if not line:
-            continue
-        try:
-            record = json.loads(line)
-        except json.JSONDecodeError:
-            continue
-        role = str(record.get("role", "")).strip().lower()
-        text = str(record.get("text", "")).strip()
-        if role in {"user", "assistant"} and text:
-            items.append({"role": role, "text": text})
-    keep = MAX_CONTEXT_TURNS * 2
-    return items[-keep:] if keep > 0 else items
-
-
-def append_message(path: pathlib.Path, role: str, text: str) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    row = {"role": role, "text": text}
-    with path.open("a", encoding="utf-8") as fh:
-        fh.write(json.dumps(row, ensure_ascii=True) + "\n")
+        return DEFAULT_SYSTEM_PROMPT
+    return path.read_text(encoding="utf-8").strip()
 
 
 # ---------------------------------------------------------------------------
@@ -139,6 +167,7 @@ def build_prompt(
     conversation_id: str,
     mode: str,
     channel: str,
+    summary: str = "",
 ) -> str:
     lines: List[str] = []
     lines.append(system_prompt)
@@ -148,11 +177,14 @@ def build_prompt(
     lines.append(f"- channel: {channel}")
     lines.append(f"- mode: {mode}")
     lines.append("")
+    if summary:
+        lines.append("Earlier turns (abridged, oldest -> newest):")
+        lines.append(summary)
+        lines.append("")
     if recent:
         lines.append("Recent turns (oldest -> newest):")
         for item in recent:
-            label = "USER" if item["role"] == "user" else "ASSISTANT"
-            lines.append(f"{label}: {item['text']}")
+            lines.append(format_turn(item))
         lines.append("")
     lines.append("Current user message:")
     lines.append(user_text)
@@ -197,30 +229,123 @@ def get_cmd(provider: str) -> List[str]:
     return cmd
 
 
-def run_provider(provider: str, prompt: str) -> str:
-    timeout_sec = int(
+def provider_timeout_sec() -> int:
+    return int(
         os.getenv("SOLAR_ROUTER_PROVIDER_TIMEOUT_SEC")
         or os.getenv("SOLAR_AI_PROVIDER_TIMEOUT_SEC")
         or "300"
     )
-    cmd = get_cmd(provider) + [prompt]
+
+
+def output_spill_bytes() -> int:
+    return int(os.getenv("SOLAR_ROUTER_OUTPUT_SPILL_BYTES") or "1048576")
+
+
+def output_retention_hours() -> float:
+    return float(os.getenv("SOLAR_ROUTER_OUTPUT_RETENTION_HOURS") or "24")
+
+
+def provider_env(provider: str) -> Dict[str, str]:
     env = os.environ.copy()
     if provider == "gemini":
         env.setdefault("GEMINI_CLI_HOME", str(pathlib.Path.home()))
         env.setdefault("GEMINI_FORCE_ENCRYPTED_FILE_STORAGE", "false")
+    return env
 
-    proc = subprocess.run(
-        cmd,
-        text=True,
-        capture_output=True,
-        timeout=timeout_sec,
-        cwd=REPO_ROOT,
-        env=env,
-    )
-    if proc.returncode != 0:
-        error = proc.stderr.strip() or proc.stdout.strip() or "provider returned non-zero"
+
+PROMPT_MODES = {"auto", "argv", "stdin", "file"}
+PROMPT_FILE_PLACEHOLDER = "{prompt_file}"
+_file_mode_warned: set = set()  # providers already warned about file mode without a placeholder
+
+# Trailing args that make each CLI read its prompt from stdin.
+# gemini appends its -p value to piped stdin, so it gets a short pointer instead.
+STDIN_PROMPT_ARGS = {
+    "codex": ["-"],
+    "claude": [],
+    "gemini": ["Respond to the request above."],
+}
+
+
+def prompt_mode(provider: str) -> str:
+    raw = (
+        os.getenv(f"SOLAR_ROUTER_{provider.upper()}_PROMPT_MODE")
+        or os.getenv("SOLAR_ROUTER_PROMPT_MODE")
+        or "auto"
+    ).strip().lower()
+    return raw if raw in PROMPT_MODES else "auto"
+
+
+def prompt_argv_max_bytes() -> int:
+    return int(os.getenv("SOLAR_ROUTER_PROMPT_ARGV_MAX_BYTES") or "32768")
+
+
+@contextlib.contextmanager
+def prompt_delivery(
+    provider: str,
+    base_cmd: List[str],
+    prompt: str,
+    mode: Optional[str] = None,
+) -> Iterator[tuple[List[str], Optional[bytes]]]:
+    """
+    Yield (argv, stdin_data) for one provider call.
+
+    argv   prompt is the last argument (visible in ps, bounded by ARG_MAX)
+    stdin  prompt is piped to the child; STDIN_PROMPT_ARGS are appended
+    file   prompt is written to a 0600 temp file whose path replaces
+           {prompt_file} in the command; removed afterwards
+    auto   argv up to SOLAR_ROUTER_PROMPT_ARGV_MAX_BYTES, stdin above
+
+    A command template containing {prompt_file} always uses file delivery.
+    Without one, file mode falls back to stdin: the CLI would otherwise take
+    the temp file's path as the prompt text.
+    """
+    mode = mode or prompt_mode(provider)
+    data = prompt.encode("utf-8")
+    if any(PROMPT_FILE_PLACEHOLDER in arg for arg in base_cmd):
+        mode = "file"
+    elif mode == "file":
+        if provider not in _file_mode_warned:
+            _file_mode_warned.add(provider)
+            print(
+                f"[solar-router] {provider}: prompt mode 'file' needs {PROMPT_FILE_PLACEHOLDER} "
+                "in the command; using stdin",
+                file=sys.stderr,
+            )
+        mode = "stdin"
+    elif mode == "auto":
+        mode = "argv" if len(data) <= prompt_argv_max_bytes() else "stdin"
+
+    if mode == "argv":
+        yield list(base_cmd) + [prompt], None
+        return
+    if mode == "stdin":
+        yield list(base_cmd) + STDIN_PROMPT_ARGS.get(provider, []), data
+        return
+
+    fd, path = tempfile.mkstemp(prefix=f"solar-prompt-{provider}-", suffix=".txt")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(data)
+        yield [arg.replace(PROMPT_FILE_PLACEHOLDER, path) for arg in base_cmd], None
+    finally:
+        with contextlib.suppress(OSError):
+            os.unlink(path)
+
+
+def check_provider_output(provider: str, result: ProcessResult) -> str:
+    """
+    Validate a finished provider process and return its stripped stdout
+    (a SpilledOutput, left unstripped on disk, when it was spilled).
+    """
+    if result.returncode != 0:
+        discard_output(result.stdout)
+        error = result.stderr.strip() or result.stdout.strip() or "provider returned non-zero"
         raise RuntimeError(error)
-    output = proc.stdout.strip()
+    if isinstance(result.stdout, SpilledOutput):
+        # Spilled output is large by definition; only the gemini check below applies.
+        output: str = SpilledOutput(result.stdout.strip(), result.stdout.path, result.stdout.size)
+    else:
+        output = result.stdout.strip()
     if not output:
         raise RuntimeError("provider returned empty output")
 
@@ -230,6 +355,7 @@ def run_provider(provider: str, prompt: str) -> str:
             "Please visit the following URL to authorize the application" in cleaned
             or "Enter the authorization code:" in cleaned
         ):
+            discard_output(output)
             raise RuntimeError(
                 "gemini returned OAuth prompt in headless mode; "
                 "credentials are not usable for non-interactive execution"
@@ -237,6 +363,55 @@ def run_provider(provider: str, prompt: str) -> str:
     return output
 
 
+def run_provider(
+    provider: str,
+    prompt: str,
+    base_cmd: Optional[List[str]] = None,
+    timeout_sec: Optional[int] = None,
+    runner: Optional[ProviderRunner] = None,
+    on_output: Optional[OutputCallback] = None,
+    spill: Optional[SpillPolicy] = None,
+    cancellation: Optional[Cancellation] = None,
+) -> str:
+    """
+    Run one provider CLI; the prompt goes in via argv, stdin or a temp file
+    (see prompt_delivery). `base_cmd` and `timeout_sec` let RouterService pass its cached resolution;
+    when omitted they are read from env on every call. Execution goes through
+    the asyncio ProviderRunner, which enforces per-provider concurrency limits.
+    `on_output` receives raw stdout pieces as the provider writes them; with
+    `spill`, large stdout is returned as a SpilledOutput. Cancelling
+    `cancellation` kills the call (ProviderCancelled).
+    """
+    if timeout_sec is None:
+        timeout_sec = provider_timeout_sec()
+    with prompt_delivery(provider, base_cmd or get_cmd(provider), prompt) as (cmd, stdin_data):
+        result = (runner or default_runner()).run_sync(
+            provider, cmd, timeout_sec, cwd=str(REPO_ROOT), env=provider_env(provider),
+            on_stdout=on_output, stdin_data=stdin_data, spill=spill, cancellation=cancellation,
+        )
+    return check_provider_output(provider, result)
+
+
+async def run_provider_async(
+    provider: str,
+    prompt: str,
+    base_cmd: Optional[List[str]] = None,
+    timeout_sec: Optional[int] = None,
+    runner: Optional[ProviderRunner] = None,
+    on_output: Optional[OutputCallback] = None,
+    spill: Optional[SpillPolicy] = None,
+) -> str:
+    """Awaitable variant of run_provider for callers running an event loop."""
+    if timeout_sec is None:
+        timeout_sec = provider_timeout_sec()
+    with prompt_delivery(provider, base_cmd or get_cmd(provider), prompt) as (cmd, stdin_data):
+        result = await (runner or default_runner()).run(
+            provider, cmd, timeout_sec, cwd=str(REPO_ROOT), env=provider_env(provider),
+            on_stdout=on_output, stdin_data=stdin_data, spill=spill,
+        )
+    return check_provider_output(provider, result)
+
+
 # ---------------------------------------------------------------------------
 # Provider selection with fallback
 # ---------------------------------------------------------------------------
@@ -257,13 +432,18 @@ def _provider_priority() -> List[str]:
     return result if result else list(SUPPORTED_PROVIDERS)
 
 
-def run_with_fallback(prompt: str) -> tuple[str, str]:
+def run_with_fallback(
+    prompt: str,
+    providers: Optional[List[str]] = None,
+    run: Callable[[str, str], str] = run_provider,
+) -> tuple[str, str]:
     """Run prompt through providers in priority order. Returns (output, provider_used)."""
-    providers = _provider_priority()
+    if providers is None:
+        providers = _provider_priority()
     last_error: Optional[Exception] = None
     for provider in providers:
         try:
-            output = run_provider(provider, prompt)
+            output = run(provider, prompt)
             return output, provider
         except Exception as exc:
             last_error = exc
@@ -273,82 +453,118 @@ def run_with_fallback(prompt: str) -> tuple[str, str]:
     )
 
 
-def run_strict_provider(provider: str, prompt: str) -> tuple[str, str]:
+def run_strict_provider(
+    provider: str,
+    prompt: str,
+    run: Callable[[str, str], str] = run_provider,
+) -> tuple[str, str]:
     """Run prompt with a specific provider, no fallback. Returns (output, provider_used)."""
-    output = run_provider(provider, prompt)
+    output = run(provider, prompt)
     return output, provider
 
 
+def hedge_channels() -> List[str]:
+    raw = os.getenv("SOLAR_ROUTER_HEDGE_CHANNELS", "")
+    return [c.strip().lower() for c in raw.split(",") if c.strip()]
+
+
+def hedge_delay_sec() -> float:
+    return float(os.getenv("SOLAR_ROUTER_HEDGE_DELAY_SEC") or "15")
+
+
+async def run_hedged(
+    prompt: str,
+    providers: List[str],
+    run: Callable[[str, str], Awaitable[str]],
+    delay_sec: float,
+) -> tuple[str, str, Dict[str, Any]]:
+    """
+    Race providers in priority order. The next provider starts after `delay_sec`
+    without a result (immediately when the running ones have all failed;
+    `delay_sec <= 0` starts all at once). The first successful output wins and
+    the remaining calls are cancelled, which kills their process groups.
+    Returns (output, provider_used, hedge_info).
+    """
+    loop = asyncio.get_running_loop()
+    started_at = loop.time()
+    queue = list(providers)
+    started: List[str] = []
+    running: Dict["asyncio.Task[str]", str] = {}
+    last_error: Optional[BaseException] = None
+
+    def launch() -> None:
+        provider = queue.pop(0)
+        started.append(provider)
+        running[asyncio.ensure_future(run(provider, prompt))] = provider
+
+    try:
+        launch()
+        while delay_sec <= 0 and queue:
+            launch()
+        while running:
+            done, _ = await asyncio.wait(
+                running,
+                timeout=delay_sec if queue else None,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not done:
+                launch()
+                continue
+            for task in done:
+                provider = running.pop(task)
+                exc = task.exception()
+                if exc is None:
+                    return task.result(), provider, {
+                        "providers_started": started,
+                        "winner": provider,
+                        "delay_sec": delay_sec,
+                        "elapsed_sec": round(loop.time() - started_at, 3),
+                    }
+                last_error = exc
+                print(f"[solar-router] provider {provider} failed: {exc}", file=sys.stderr)
+            if not running and queue:
+                launch()
+    finally:
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+    raise RuntimeError(f"all providers failed. last error: {last_error}")
+
+
 # ---------------------------------------------------------------------------
 # Async draft creation
 # ---------------------------------------------------------------------------
 
 def create_async_draft(title: str, description: str) -> Optional[str]:
-    """Invoke solar-async-tasks create.sh and return task_id or None on failure."""
-    if not ASYNC_TASKS_CREATE_SCRIPT.exists():
-        raise RuntimeError(
-            f"async-tasks create script not found: {ASYNC_TASKS_CREATE_SCRIPT}"
-        )
-    proc = subprocess.run(
-        ["bash", str(ASYNC_TASKS_CREATE_SCRIPT), title, description],
-        text=True,
-        capture_output=True,
-        timeout=30,
-        cwd=REPO_ROOT,
-    )
-    if proc.returncode != 0:
-        raise RuntimeError(
-            f"create.sh failed: {proc.stderr.strip() or proc.stdout.strip()}"
-        )
-    # Extract task_id from output (create.sh prints "task_id: <id>" or similar)
-    output = proc.stdout.strip()
-    for line in output.splitlines():
-        if "task_id" in line.lower():
-            parts = line.split(":", 1)
-            if len(parts) == 2:
-                return parts[1].strip()
-    # Fallback: return last non-empty line as task_id
-    lines = [l.strip() for l in output.splitlines() if l.strip()]
-    return lines[-1] if lines else None
+    """Write a solar-async-tasks draft in-process and return its task_id."""
+    # Same root resolution create.sh had when run with cwd=REPO_ROOT.
+    return TaskStore(task_root(REPO_ROOT)).create(title, description).id
 
 
 # ---------------------------------------------------------------------------
 # Output parsing for mode=auto
 # ---------------------------------------------------------------------------
 
-def _strip_code_fences(text: str) -> str:
-    """Remove leading/trailing markdown code fences if present."""
-    text = text.strip()
-    text = re.sub(r"^```[a-zA-Z]*\n?", "", text)
-    text = re.sub(r"\n?```$", "", text)
-    return text.strip()
-
-
 def parse_ai_decision_output(raw_output: str) -> Dict[str, Any]:
     """
     Parse AI output for mode=auto. Expects JSON with decision.kind and reply_text.
     Returns parsed dict. Raises ValueError if unparseable with no useful reply_text.
+    Spilled output is parsed from its file, not from the preview.
     """
-    # Try to find a JSON block in the output
     text = raw_output.strip()
 
-    # Attempt 1: entire output is JSON
-    try:
-        parsed = json.loads(_strip_code_fences(text))
-        if isinstance(parsed, dict) and "decision" in parsed:
-            return parsed
-    except (json.JSONDecodeError, ValueError):
-        pass
-
-    # Attempt 2: find first {...} block
-    match = re.search(r"\{[\s\S]*\}", text)
-    if match:
+    # First JSON object with a `decision` key (bare, fenced or inside prose), one pass
+    parsed = None
+    if isinstance(raw_output, SpilledOutput):
         try:
-            parsed = json.loads(match.group(0))
-            if isinstance(parsed, dict) and "decision" in parsed:
-                return parsed
-        except (json.JSONDecodeError, ValueError):
-            pass
+            parsed = extract_decision_from_file(raw_output.path)
+        except OSError as exc:
+            print(f"[solar-router] spilled output unreadable: {exc}", file=sys.stderr)
+    else:
+        parsed = extract_decision_object(text)
+    if parsed is not None:
+        return parsed
 
     # Degradation: no parseable JSON with decision.kind — use reply_text as direct_reply
     # Per plan: degrade to direct_reply only when there IS useful output
@@ -420,243 +636,915 @@ def decision_engine(
 
 
 # ---------------------------------------------------------------------------
-# Main
+# RouterService
 # ---------------------------------------------------------------------------
 
-def emit(response: Dict[str, Any]) -> None:
-    print(json.dumps(response, ensure_ascii=False))
+# Receives streaming frames; called from the provider runner thread, must not block.
+PartialCallback = Callable[[Dict[str, Any]], None]
 
 
-def main() -> None:
-    raw = sys.stdin.read().strip()
-    if not raw:
-        emit({
-            "status": "failed",
-            "request_id": "unknown",
-            "provider_used": None,
-            "reply_text": "",
-            "decision": {"kind": "direct_reply", "task_id": None, "priority_suggested": None},
-            "error_code": "missing_input",
-            "error": "missing stdin payload",
-        })
-        sys.exit(1)
+def request_conversation_id(payload: Dict[str, Any]) -> str:
+    """Conversation a request belongs to: user_id, then session_id, then "default"."""
+    user_id = str(payload.get("user_id", "")).strip()
+    session_id = str(payload.get("session_id", "")).strip()
+    return user_id or session_id or "default"
 
-    try:
-        payload = json.loads(raw)
-    except json.JSONDecodeError as exc:
-        emit({
-            "status": "failed",
-            "request_id": "unknown",
-            "provider_used": None,
-            "reply_text": "",
-            "decision": {"kind": "direct_reply", "task_id": None, "priority_suggested": None},
-            "error_code": "invalid_json",
-            "error": f"invalid JSON input: {exc}",
-        })
-        sys.exit(1)
 
-    request_id = str(payload.get("request_id", "unknown")).strip()
-    session_id = str(payload.get("session_id", "")).strip()
-    user_id = str(payload.get("user_id", "")).strip()
+def coalesce_keys(payload: Dict[str, Any]) -> List[str]:
+    """
+    Keys under which a request is shared with in-flight duplicates: its
+    request_id, and the conversation plus a hash of mode, channel, provider and text.
+    """
+    keys = []
+    request_id = str(payload.get("request_id") or "").strip()
+    if request_id and request_id not in {"unknown", "n/a"}:
+        keys.append(f"id:{request_id}")
     text = str(payload.get("text", "")).strip()
-    channel = str(payload.get("channel", "other")).strip().lower()
-    mode = str(payload.get("mode", "auto")).strip().lower()
-    provider_override = str(payload.get("provider") or "").strip().lower()
-
-    # Validate required fields
-    if not text:
-        emit({
-            "status": "failed",
-            "request_id": request_id,
-            "provider_used": None,
-            "reply_text": "",
-            "decision": {"kind": "direct_reply", "task_id": None, "priority_suggested": None},
-            "error_code": "missing_text",
-            "error": "missing text field",
-        })
-        sys.exit(1)
+    if text:
+        digest = hashlib.sha256()
+        for part in (
+            request_conversation_id(payload),
+            str(payload.get("mode", "auto")).strip().lower(),
+            str(payload.get("channel", "other")).strip().lower(),
+            str(payload.get("provider") or "").strip().lower(),
+            text,
+        ):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        keys.append(f"turn:{digest.hexdigest()}")
+    return keys
 
-    if mode not in VALID_MODES:
-        emit({
-            "status": "failed",
-            "request_id": request_id,
-            "provider_used": None,
-            "reply_text": "",
-            "decision": {"kind": "direct_reply", "task_id": None, "priority_suggested": None},
-            "error_code": "invalid_mode",
-            "error": f"unsupported mode: {mode}. valid: {sorted(VALID_MODES)}",
-        })
-        sys.exit(1)
 
-    if provider_override and provider_override not in SUPPORTED_PROVIDERS:
-        emit({
-            "status": "failed",
-            "request_id": request_id,
-            "provider_used": None,
-            "reply_text": "",
-            "decision": {"kind": "direct_reply", "task_id": None, "priority_suggested": None},
-            "error_code": "unsupported_provider",
-            "error": f"unsupported provider: {provider_override}",
-        })
-        sys.exit(1)
+def batch_workers() -> int:
+    return int(os.getenv("SOLAR_ROUTER_BATCH_WORKERS") or "4")
 
-    # Normalize channel
-    if channel not in VALID_CHANNELS:
-        channel = "other"
 
-    conversation_id = user_id or session_id or "default"
-    conv_path = conversation_file(conversation_id)
+def failed_response(
+    request_id: str,
+    error_code: str,
+    error: str,
+    provider_used: Optional[str] = None,
+    reply_text: str = "",
+) -> Dict[str, Any]:
+    return {
+        "status": "failed",
+        "request_id": request_id,
+        "provider_used": provider_used,
+        "reply_text": reply_text,
+        "decision": {"kind": "direct_reply", "task_id": None, "priority_suggested": None},
+        "error_code": error_code,
+        "error": error,
+    }
 
-    # --- Fix: async_only bypasses AI execution entirely — policy-driven, no provider needed ---
-    if mode == "async_only":
-        if not async_tasks_enabled():
-            emit({
-                "status": "failed",
+
+class RouterError(RuntimeError):
+    """Request failure that maps to a v3 `error_code`."""
+
+    def __init__(self, error_code: str, message: str, provider_used: Optional[str] = None) -> None:
+        super().__init__(message)
+        self.error_code = error_code
+        self.provider_used = provider_used
+
+
+def _tag_partials(
+    on_partial: Optional[PartialCallback],
+    request_id: str,
+) -> Optional[PartialCallback]:
+    if on_partial is None:
+        return None
+
+    def emit_partial(frame: Dict[str, Any]) -> None:
+        on_partial({"type": "partial", "request_id": request_id, **frame})
+
+    return emit_partial
+
+
+def _announce_decision(
+    on_partial: Optional[PartialCallback],
+    request_id: str,
+) -> Optional[PartialCallback]:
+    """
+    Forward tagged partial frames and, for mode=auto, emit one
+    {"type": "decision", "request_id", "provider", "kind", "priority_suggested"}
+    frame as soon as decision.kind can be read from the streamed output.
+    The final response stays authoritative.
+    """
+    if on_partial is None:
+        return None
+    extractor = DecisionExtractor()
+    announced = False
+
+    def emit(frame: Dict[str, Any]) -> None:
+        nonlocal extractor, announced
+        on_partial(frame)
+        if frame.get("reset"):
+            # Fallback to another provider: its output decides again.
+            extractor = DecisionExtractor()
+            announced = False
+            return
+        if announced:
+            return
+        extractor.feed(frame.get("text", ""))
+        if extractor.kind in VALID_DECISION_KINDS:
+            announced = True
+            on_partial({
+                "type": "decision",
                 "request_id": request_id,
-                "provider_used": None,
-                "reply_text": "",
-                "decision": {"kind": "direct_reply", "task_id": None, "priority_suggested": None},
-                "error_code": "async_tasks_disabled",
-                "error": "mode=async_only requested but async-tasks feature is not enabled in SOLAR_SYSTEM_FEATURES",
+                "provider": frame.get("provider"),
+                "kind": extractor.kind,
+                "priority_suggested": (extractor.decision or {}).get("priority_suggested"),
             })
-            sys.exit(1)
-        # Create draft directly from user text — no AI call required
-        task_id: Optional[str] = None
-        reply_text = f"Creando tarea asíncrona: {text[:80].strip()}"
+
+    return emit
+
+
+class RouterService:
+    """
+    Long-lived, in-process router v3.
+
+    Env config is parsed once at construction; the system prompt (re-read only
+    when its mtime changes) and resolved provider commands stay warm across
+    requests. Consumers in the same process (WS bridge, async executor) call
+    `handle()` directly; `main()` is a thin stdin/stdout wrapper around it.
+
+    `group_commit=True` (long-lived processes) batches conversation appends
+    from concurrent requests on a background writer thread; call `close()`
+    before exit to flush it.
+    """
+
+    def __init__(self, group_commit: bool = False) -> None:
+        self.runtime_root = RUNTIME_ROOT
+        self.system_prompt_file = SYSTEM_PROMPT_FILE
+        self.context_turns = MAX_CONTEXT_TURNS
+        self.context_chars = context_chars()
+        self.provider_timeout_sec = provider_timeout_sec()
+        self.provider_priority = _provider_priority()
+        self.async_tasks_enabled = async_tasks_enabled()
+        self.hedge_channels = set(hedge_channels())
+        self.hedge_delay_sec = hedge_delay_sec()
+        self.cache = ResponseCache(self.runtime_root)
+        self.summaries = SummaryStore(self.runtime_root)
+        # Rotation keeps the records context() and note_turn() read: the context window
+        # plus up to every_turns turns still waiting for the next summary refresh.
+        self.active_segment_records = (self.context_turns + self.summaries.every_turns) * 2
+        self.timings_enabled = timings_enabled()
+        self.metrics = MetricsSink(self.runtime_root)
+        self.writer = ConversationWriter(group_commit=group_commit)
+        self.coalesce_enabled = coalesce_enabled()
+        self.inflight = SingleFlight()
+        self._system_prompt: Optional[str] = None
+        self._system_prompt_mtime: Optional[float] = None
+        self._cmds: Dict[str, List[str]] = {}
+        self.runner = default_runner()
+        self.health = ProviderHealth(
+            self.runtime_root, probe_timeout_sec=float(self.provider_timeout_sec)
+        )
+        self.timeouts = TimeoutPolicy(self.health, self.provider_timeout_sec)
+        # A turn holds its conversation for the whole provider call, so a waiter
+        # only gives up on a holder that outlived the worst-case fallback chain.
+        self.conversation_locks = ConversationLocks(
+            self.runtime_root,
+            timeout_sec=self.timeouts.turn_budget_sec(len(self.provider_priority)) + HOLD_MARGIN_SEC,
+        )
+        spill_bytes = output_spill_bytes()
+        self.output_spill = SpillPolicy(
+            self.runtime_root / "outputs", spill_bytes, output_retention_hours() * 3600
+        ) if spill_bytes > 0 else None
+
+    # -- warm state ---------------------------------------------------------
+
+    def system_prompt(self) -> str:
         try:
-            title = text[:80].strip()
-            task_id = create_async_draft(title, text)
+            mtime: Optional[float] = self.system_prompt_file.stat().st_mtime
+        except OSError:
+            mtime = None
+        if self._system_prompt is None or mtime != self._system_prompt_mtime:
+            self._system_prompt = read_system_prompt(self.system_prompt_file)
+            self._system_prompt_mtime = mtime
+        return self._system_prompt
+
+    def provider_cmd(self, provider: str) -> List[str]:
+        cmd = self._cmds.get(provider)
+        if cmd is None:
+            # Failures are not cached: a binary installed later is picked up on next call.
+            cmd = get_cmd(provider)
+            self._cmds[provider] = cmd
+        return cmd
+
+    def conversation_file(self, conversation_id: str) -> pathlib.Path:
+        return self.runtime_root / "conversations" / f"{sanitize_id(conversation_id)}.jsonl"
+
+    # -- execution ----------------------------------------------------------
+
+    def persist_turn(self, conv_path: pathlib.Path, user_text: str, reply_text: str) -> None:
+        self.writer.append_turn(conv_path, user_text, reply_text)
+        try:
+            self.summaries.note_turn(conv_path, self.context_turns)
+        except OSError as exc:
+            print(f"[solar-router] summary refresh failed for {conv_path.name}: {exc}", file=sys.stderr)
+        try:
+            rotate_if_needed(conv_path, self.active_segment_records)
+        except OSError as exc:
+            print(f"[solar-router] segment rotation failed for {conv_path.name}: {exc}", file=sys.stderr)
+
+    def close(self) -> None:
+        """Flush buffered conversation writes (and the final `batch` fsync)."""
+        self.writer.close()
+
+    def context(self, conv_path: pathlib.Path) -> tuple[str, List[Dict[str, str]]]:
+        """(summary, recent turns) for the next prompt, bounded by the turn and char budgets."""
+        return self.summaries.context(conv_path, self.context_turns, self.context_chars)
+
+    def compact(self, conversation_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Compact archived segments and roll over oversized active segments."""
+        if conversation_ids:
+            paths = [self.conversation_file(cid) for cid in conversation_ids]
+        else:
+            paths = conversation_paths(self.runtime_root / "conversations")
+        result: Dict[str, Any] = {}
+        for path in paths:
+            with self.conversation_locks.acquire(path.stem):
+                result[path.stem] = compact_conversation(path, self.active_segment_records)
+        return result
+
+    def _record_health(
+        self,
+        provider: str,
+        started_at: float,
+        error: Optional[Exception],
+        deadline: Optional[ProviderDeadline] = None,
+    ) -> None:
+        bucket = deadline.bucket if deadline is not None else None
+        try:
+            if error is None:
+                self.health.record_success(provider, time.monotonic() - started_at, bucket)
+            elif not isinstance(error, (CircuitOpenError, ProviderCancelled)):
+                timed_out = time.monotonic() - started_at if isinstance(error, ProviderTimeout) else None
+                self.health.record_failure(provider, str(error), bucket, timed_out)
+        except OSError as exc:
+            print(f"[solar-router] health state update failed: {exc}", file=sys.stderr)
+
+    def attempt_timeout_sec(self, provider: str, deadline: Optional[ProviderDeadline]) -> float:
+        """Adaptive timeout for this attempt (see provider_timeouts); static without a deadline."""
+        if deadline is None:
+            return self.provider_timeout_sec
+        return deadline.timeout_for(provider)
+
+    def run_provider(
+        self,
+        provider: str,
+        prompt: str,
+        on_output: Optional[OutputCallback] = None,
+        deadline: Optional[ProviderDeadline] = None,
+    ) -> str:
+        timeout_sec = self.attempt_timeout_sec(provider, deadline)
+        started_at = time.monotonic()
+        try:
+            output = run_provider(
+                provider,
+                prompt,
+                base_cmd=self.provider_cmd(provider),
+                timeout_sec=timeout_sec,
+                runner=self.runner,
+                on_output=on_output,
+                spill=self.output_spill,
+                cancellation=deadline.cancellation if deadline is not None else None,
+            )
+        except FileNotFoundError as exc:
+            # Cached binary vanished (upgrade, PATH change): resolve again next time.
+            self._cmds.pop(provider, None)
+            error = RuntimeError(f"client binary not found: {exc.filename} (provider={provider})")
+            self._record_health(provider, started_at, error, deadline)
+            raise error from exc
         except Exception as exc:
-            emit({
-                "status": "failed",
-                "request_id": request_id,
-                "provider_used": None,
-                "reply_text": "",
-                "decision": {"kind": "direct_reply", "task_id": None, "priority_suggested": None},
-                "error_code": "async_draft_failed",
-                "error": str(exc),
-            })
-            sys.exit(1)
-        append_message(conv_path, "user", text)
-        append_message(conv_path, "assistant", reply_text)
-        emit({
-            "status": "success",
-            "request_id": request_id,
-            "provider_used": None,
-            "reply_text": reply_text,
-            "decision": {
-                "kind": "async_draft_created",
-                "task_id": task_id,
-                "priority_suggested": "normal",
-            },
-            "error_code": None,
-            "error": None,
-        })
-        return
+            self._record_health(provider, started_at, exc, deadline)
+            raise
+        self._record_health(provider, started_at, None, deadline)
+        return output
+
+    async def run_provider_async(
+        self,
+        provider: str,
+        prompt: str,
+        deadline: Optional[ProviderDeadline] = None,
+    ) -> str:
+        timeout_sec = self.attempt_timeout_sec(provider, deadline)
+        started_at = time.monotonic()
+        try:
+            output = await run_provider_async(
+                provider,
+                prompt,
+                base_cmd=self.provider_cmd(provider),
+                timeout_sec=timeout_sec,
+                runner=self.runner,
+                spill=self.output_spill,
+            )
+        except FileNotFoundError as exc:
+            self._cmds.pop(provider, None)
+            error = RuntimeError(f"client binary not found: {exc.filename} (provider={provider})")
+            self._record_health(provider, started_at, error, deadline)
+            raise error from exc
+        except Exception as exc:
+            self._record_health(provider, started_at, exc, deadline)
+            raise
+        self._record_health(provider, started_at, None, deadline)
+        return output
+
+    def _check_circuit(self, provider: str) -> None:
+        if not self.health.allow(provider):
+            raise CircuitOpenError(f"circuit open for {provider}; skipped")
+
+    def guarded_run_provider(
+        self,
+        provider: str,
+        prompt: str,
+        on_output: Optional[OutputCallback] = None,
+        deadline: Optional[ProviderDeadline] = None,
+    ) -> str:
+        self._check_circuit(provider)
+        return self.run_provider(provider, prompt, on_output, deadline)
+
+    async def guarded_run_provider_async(
+        self,
+        provider: str,
+        prompt: str,
+        deadline: Optional[ProviderDeadline] = None,
+    ) -> str:
+        self._check_circuit(provider)
+        return await self.run_provider_async(provider, prompt, deadline)
+
+    def candidate_providers(self) -> tuple[List[str], bool]:
+        """
+        Priority list without providers whose circuit is open.
+        Returns (providers, guarded); when every circuit is open all providers
+        are tried unguarded rather than failing without a single attempt.
+        """
+        allowed = [p for p in self.provider_priority if not self.health.blocked(p)]
+        if allowed:
+            return allowed, True
+        return list(self.provider_priority), False
+
+    def run_with_fallback(
+        self,
+        prompt: str,
+        on_partial: Optional[PartialCallback] = None,
+        timings: Optional[StageTimings] = None,
+        deadline: Optional[ProviderDeadline] = None,
+    ) -> tuple[str, str]:
+        providers, guarded = self.candidate_providers()
+        run = functools.partial(
+            self.guarded_run_provider if guarded else self.run_provider, deadline=deadline
+        )
+        if timings is not None:
+            run = timings.provider_call(run)
+        return run_with_fallback(prompt, providers, run=self._streaming(run, on_partial))
+
+    @staticmethod
+    def _streaming(
+        run: Callable[..., str],
+        on_partial: Optional[PartialCallback],
+    ) -> Callable[[str, str], str]:
+        """
+        Wrap a provider call so stdout is forwarded as partial frames. If a
+        provider fails after streaming, a `reset` frame tells the consumer to
+        discard what it received before the next provider starts.
+        """
+        if on_partial is None:
+            return run
+
+        def streaming_run(provider: str, prompt: str) -> str:
+            emitted = False
+
+            def on_output(text: str) -> None:
+                nonlocal emitted
+                emitted = True
+                on_partial({"provider": provider, "text": text, "reset": False})
 
-    system_prompt = read_system_prompt()
-    recent = load_recent_messages(conv_path)
-    full_prompt = build_prompt(system_prompt, recent, text, conversation_id, mode, channel)
+            try:
+                return run(provider, prompt, on_output=on_output)
+            except Exception:
+                if emitted:
+                    on_partial({"provider": provider, "text": "", "reset": True})
+                raise
+
+        return streaming_run
+
+    def run_hedged(
+        self,
+        prompt: str,
+        timings: Optional[StageTimings] = None,
+        deadline: Optional[ProviderDeadline] = None,
+    ) -> tuple[str, str, Dict[str, Any]]:
+        """Race providers on the runner loop; blocks the calling thread until a winner."""
+        providers, guarded = self.candidate_providers()
+        run = functools.partial(
+            self.guarded_run_provider_async if guarded else self.run_provider_async,
+            deadline=deadline,
+        )
+        if timings is not None:
+            run = timings.provider_call_async(run)
+        # Cancelling the race cancels every running attempt (killing its process group).
+        return self.runner.run_coroutine(
+            run_hedged(prompt, providers, run, self.hedge_delay_sec),
+            deadline.cancellation if deadline is not None else None,
+        )
 
-    # --- Execute AI ---
-    try:
+    def create_async_draft(self, title: str, description: str) -> Optional[str]:
+        return create_async_draft(title, description)
+
+    def execute(
+        self,
+        prompt: str,
+        channel: str,
+        provider_override: str,
+        on_partial: Optional[PartialCallback] = None,
+        timings: Optional[StageTimings] = None,
+        cancellation: Optional[Cancellation] = None,
+    ) -> tuple[str, str, Dict[str, Any]]:
+        """
+        Run the prompt with the policy for this request: strict provider,
+        hedged race (channels in SOLAR_ROUTER_HEDGE_CHANNELS) or priority fallback.
+        Returns (ai_output, provider_used, extra response fields); raises RouterError
+        (`cancelled` once `cancellation` fires). Provider attempts are recorded in
+        `timings` when given. Attempt timeouts come from the adaptive policy and
+        the channel budget (provider_timeouts).
+        """
+        deadline = self.timeouts.deadline(channel, prompt, cancellation)
         if provider_override:
             # Strict mode: no fallback
+            run = functools.partial(self.run_provider, deadline=deadline)
+            if timings is not None:
+                run = timings.provider_call(run)
             try:
-                ai_output, provider_used = run_strict_provider(provider_override, full_prompt)
+                output, provider_used = run_strict_provider(
+                    provider_override,
+                    prompt,
+                    run=self._streaming(run, on_partial),
+                )
             except Exception as exc:
-                emit({
-                    "status": "failed",
-                    "request_id": request_id,
-                    "provider_used": provider_override,
-                    "reply_text": "",
-                    "decision": {"kind": "direct_reply", "task_id": None, "priority_suggested": None},
-                    "error_code": "provider_locked_failed",
-                    "error": str(exc),
-                })
-                sys.exit(1)
-        else:
-            # Priority fallback mode
-            ai_output, provider_used = run_with_fallback(full_prompt)
-    except Exception as exc:
-        emit({
-            "status": "failed",
-            "request_id": request_id,
-            "provider_used": None,
-            "reply_text": "",
-            "decision": {"kind": "direct_reply", "task_id": None, "priority_suggested": None},
-            "error_code": "all_providers_failed",
-            "error": str(exc),
-        })
-        sys.exit(1)
+                code = "cancelled" if deadline.cancelled else "provider_locked_failed"
+                raise RouterError(code, str(exc), provider_override) from exc
+            return output, provider_used, {}
 
-    # --- DecisionEngine ---
-    try:
-        # For mode=auto with non-async-task channels, pass ai_output for semantic decision
-        ai_output_for_decision = (
-            ai_output
-            if mode == "auto" and channel != "async-task"
-            else None
+        if channel in self.hedge_channels and len(self.candidate_providers()[0]) > 1:
+            # Hedged mode: race providers for latency-sensitive channels
+            try:
+                output, provider_used, hedge = self.run_hedged(prompt, timings, deadline)
+            except Exception as exc:
+                code = "cancelled" if deadline.cancelled else "all_providers_failed"
+                raise RouterError(code, str(exc)) from exc
+            return output, provider_used, {"hedge": hedge}
+
+        # Priority fallback mode
+        try:
+            output, provider_used = self.run_with_fallback(prompt, on_partial, timings, deadline)
+        except Exception as exc:
+            code = "cancelled" if deadline.cancelled else "all_providers_failed"
+            raise RouterError(code, str(exc)) from exc
+        return output, provider_used, {}
+
+    # -- request handling ---------------------------------------------------
+
+    def handle(
+        self,
+        payload: Dict[str, Any],
+        on_partial: Optional[PartialCallback] = None,
+        cancellation: Optional[Cancellation] = None,
+    ) -> Dict[str, Any]:
+        """
+        Process one RouterRequest v3 dict and return a RouterResponse v3 dict.
+        With `on_partial`, provider stdout is streamed as
+        {"type": "partial", "request_id", "provider", "text", "reset"} frames
+        before the final response (not in hedged mode); in mode=auto one
+        {"type": "decision", ...} frame follows as soon as decision.kind is known.
+        Stage timings are added as `timings` and sent to the metrics sink.
+
+        A duplicate of a request still in flight (same request_id, or same
+        conversation and text) waits for it and returns a copy of its response
+        with `"coalesced": true` (no partial frames) instead of calling a provider.
+
+        `cancellation.cancel()` from another thread kills the provider call and
+        stops fallback; the response fails with error_code `cancelled`. It has
+        no effect on a coalesced duplicate, which shares the first call.
+        """
+        timings = StageTimings()
+        keys = coalesce_keys(payload) if self.coalesce_enabled and isinstance(payload, dict) else []
+        shared_response, coalesced = self.inflight.do(
+            keys, lambda: self._handle(payload, on_partial, timings, cancellation)
         )
-        decision = decision_engine(mode, channel, ai_output_for_decision, request_id, text)
-    except ValueError as exc:
-        emit({
-            "status": "failed",
-            "request_id": request_id,
-            "provider_used": provider_used,
-            "reply_text": ai_output,
-            "decision": {"kind": "direct_reply", "task_id": None, "priority_suggested": None},
-            "error_code": "decision_engine_failed",
-            "error": str(exc),
-        })
-        sys.exit(1)
+        # Callers each get their own dict: the shared one is never mutated.
+        response = dict(shared_response)
+        if coalesced:
+            response["request_id"] = str(payload.get("request_id", "unknown")).strip()
+            response["coalesced"] = True
+        timing_data = timings.as_dict()
+        if self.timings_enabled:
+            response["timings"] = timing_data
+        if self.metrics.enabled:
+            request = payload if isinstance(payload, dict) else {}
+            try:
+                self.metrics.record({
+                    "request_id": response.get("request_id"),
+                    "channel": str(request.get("channel") or "other"),
+                    "mode": str(request.get("mode") or "auto"),
+                    "status": response.get("status"),
+                    "provider_used": response.get("provider_used"),
+                    "error_code": response.get("error_code"),
+                    "cache": (response.get("cache") or {}).get("status"),
+                    "coalesced": coalesced,
+                    "timings": timing_data,
+                })
+            except OSError as exc:
+                print(f"[solar-router] metrics write failed: {exc}", file=sys.stderr)
+        return response
+
+    def _handle(
+        self,
+        payload: Dict[str, Any],
+        on_partial: Optional[PartialCallback],
+        timings: StageTimings,
+        cancellation: Optional[Cancellation] = None,
+    ) -> Dict[str, Any]:
+        if not isinstance(payload, dict):
+            return failed_response("unknown", "invalid_json", "request must be a JSON object")
+
+        request_id = str(payload.get("request_id", "unknown")).strip()
+        text = str(payload.get("text", "")).strip()
+        channel = str(payload.get("channel", "other")).strip().lower()
+        mode = str(payload.get("mode", "auto")).strip().lower()
+        provider_override = str(payload.get("provider") or "").strip().lower()
+
+        # Validate required fields
+        if not text:
+            return failed_response(request_id, "missing_text", "missing text field")
+
+        if mode not in VALID_MODES:
+            return failed_response(
+                request_id,
+                "invalid_mode",
+                f"unsupported mode: {mode}. valid: {sorted(VALID_MODES)}",
+            )
+
+        if provider_override and provider_override not in SUPPORTED_PROVIDERS:
+            return failed_response(
+                request_id,
+                "unsupported_provider",
+                f"unsupported provider: {provider_override}",
+            )
+
+        # Normalize channel
+        if channel not in VALID_CHANNELS:
+            channel = "other"
 
-    # --- Extract reply_text ---
-    reply_text = ai_output
-    if mode == "auto" and channel != "async-task":
-        parsed_output = decision.pop("_parsed", None)
-        if parsed_output and "reply_text" in parsed_output:
-            reply_text = str(parsed_output["reply_text"])
-
-    # --- Handle async draft creation ---
-    task_id = decision.get("task_id")
-    if decision["kind"] == "async_draft_created" and task_id is None:
-        if async_tasks_enabled():
+        conversation_id = request_conversation_id(payload)
+        conv_path = self.conversation_file(conversation_id)
+
+        # Turns of one conversation run one at a time, in arrival order.
+        try:
+            with timings.stage("lock"):
+                held = self.conversation_locks.acquire(conv_path.stem)
+        except ConversationBusyError as exc:
+            return failed_response(request_id, "conversation_busy", str(exc))
+        with held:
+            return self._handle_turn(
+                payload, request_id, text, channel, mode, provider_override,
+                conversation_id, conv_path, on_partial, timings, cancellation,
+            )
+
+    def _handle_turn(
+        self,
+        payload: Dict[str, Any],
+        request_id: str,
+        text: str,
+        channel: str,
+        mode: str,
+        provider_override: str,
+        conversation_id: str,
+        conv_path: pathlib.Path,
+        on_partial: Optional[PartialCallback],
+        timings: StageTimings,
+        cancellation: Optional[Cancellation] = None,
+    ) -> Dict[str, Any]:
+        """Rest of `_handle` for a validated request, with the conversation lock held."""
+        # --- async_only bypasses AI execution entirely — policy-driven, no provider needed ---
+        if mode == "async_only":
+            if not self.async_tasks_enabled:
+                return failed_response(
+                    request_id,
+                    "async_tasks_disabled",
+                    "mode=async_only requested but async-tasks feature is not enabled in SOLAR_SYSTEM_FEATURES",
+                )
+            # Create draft directly from user text — no AI call required
+            reply_text = f"Creando tarea asíncrona: {text[:80].strip()}"
             try:
-                # Use reply_text as description; derive title from first 80 chars of user text
                 title = text[:80].strip()
-                task_id = create_async_draft(title, reply_text or text)
-                decision["task_id"] = task_id
+                with timings.stage("async_draft"):
+                    task_id = self.create_async_draft(title, text)
             except Exception as exc:
-                # Draft creation failed — degrade to direct_reply with warning
-                reply_text = (
-                    f"{reply_text}\n\n[Warning: async draft creation failed: {exc}]"
+                return failed_response(request_id, "async_draft_failed", str(exc))
+            with timings.stage("persist"):
+                self.persist_turn(conv_path, text, reply_text)
+            return {
+                "status": "success",
+                "request_id": request_id,
+                "provider_used": None,
+                "reply_text": reply_text,
+                "decision": {
+                    "kind": "async_draft_created",
+                    "task_id": task_id,
+                    "priority_suggested": "normal",
+                },
+                "error_code": None,
+                "error": None,
+            }
+
+        with timings.stage("context"):
+            summary, recent = self.context(conv_path)
+        with timings.stage("prompt"):
+            full_prompt = build_prompt(
+                self.system_prompt(), recent, text, conversation_id, mode, channel, summary
+            )
+
+        # --- Execute AI (or reuse a cached output) ---
+        extras: Dict[str, Any] = {}
+        metadata = payload.get("metadata") if isinstance(payload.get("metadata"), dict) else {}
+        cache_id: Optional[str] = None
+        cached: Optional[Dict[str, Any]] = None
+        if self.cache.enabled:
+            if metadata.get("cache", True) is False:
+                extras["cache"] = {"status": "bypass"}
+            else:
+                with timings.stage("cache"):
+                    cache_id = cache_key(
+                        full_prompt, mode, channel, provider_override or ",".join(self.provider_priority)
+                    )
+                    cached = self.cache.get(cache_id)
+
+        if cached is not None:
+            ai_output, provider_used = cached["output"], cached["provider_used"]
+            extras["cache"] = {"status": "hit", "age_sec": cached["age_sec"]}
+        else:
+            try:
+                emit_partial = _tag_partials(on_partial, request_id)
+                if mode == "auto" and channel != "async-task":
+                    emit_partial = _announce_decision(emit_partial, request_id)
+                with timings.stage("provider"):
+                    ai_output, provider_used, run_extras = self.execute(
+                        full_prompt, channel, provider_override, emit_partial, timings, cancellation
+                    )
+            except RouterError as exc:
+                return failed_response(
+                    request_id, exc.error_code, str(exc), provider_used=exc.provider_used
                 )
+            extras.update(run_extras)
+            if cache_id is not None and not isinstance(ai_output, SpilledOutput):
+                extras["cache"] = {"status": "miss"}
+                try:
+                    with timings.stage("cache"):
+                        self.cache.put(cache_id, ai_output, provider_used)
+                except OSError as exc:
+                    print(f"[solar-router] cache write failed: {exc}", file=sys.stderr)
+
+        # --- DecisionEngine ---
+        try:
+            # For mode=auto with non-async-task channels, pass ai_output for semantic decision
+            ai_output_for_decision = (
+                ai_output
+                if mode == "auto" and channel != "async-task"
+                else None
+            )
+            with timings.stage("decision"):
+                decision = decision_engine(mode, channel, ai_output_for_decision, request_id, text)
+        except ValueError as exc:
+            return failed_response(
+                request_id,
+                "decision_engine_failed",
+                str(exc),
+                provider_used=provider_used,
+                reply_text=ai_output,
+            )
+
+        # --- Extract reply_text ---
+        reply_text = ai_output
+        parsed_output = None
+        if mode == "auto" and channel != "async-task":
+            parsed_output = decision.pop("_parsed", None)
+            if parsed_output and "reply_text" in parsed_output:
+                reply_text = str(parsed_output["reply_text"])
+        draft_description = reply_text
+        if isinstance(ai_output, SpilledOutput):
+            # Large output stays on disk: reply_text (and history) get a preview-sized head only;
+            # an async draft still gets the full reply parsed from the spilled file.
+            extras["reply_ref"] = {"path": ai_output.path, "bytes": ai_output.size}
+            reply_text = (
+                f"{reply_text[:len(ai_output)]}\n\n[output truncated; full output "
+                f"({ai_output.size} bytes): {ai_output.path}]"
+            )
+            if parsed_output is None or parsed_output.get("_degraded"):
+                draft_description = reply_text
+
+        # --- Handle async draft creation ---
+        task_id = decision.get("task_id")
+        if decision["kind"] == "async_draft_created" and task_id is None:
+            if self.async_tasks_enabled:
+                try:
+                    # Use reply_text as description; derive title from first 80 chars of user text
+                    title = text[:80].strip()
+                    with timings.stage("async_draft"):
+                        task_id = self.create_async_draft(title, draft_description or text)
+                    decision["task_id"] = task_id
+                except Exception as exc:
+                    # Draft creation failed — degrade to direct_reply with warning
+                    reply_text = (
+                        f"{reply_text}\n\n[Warning: async draft creation failed: {exc}]"
+                    )
+                    decision["kind"] = "direct_reply"
+                    decision["task_id"] = None
+            else:
+                # async-tasks not enabled, degrade gracefully
                 decision["kind"] = "direct_reply"
                 decision["task_id"] = None
+
+        # --- Persist conversation ---
+        with timings.stage("persist"):
+            self.persist_turn(conv_path, text, reply_text)
+
+        response: Dict[str, Any] = {
+            "status": "success",
+            "request_id": request_id,
+            "provider_used": provider_used,
+            "reply_text": reply_text,
+            "decision": {
+                "kind": decision["kind"],
+                "task_id": decision.get("task_id"),
+                "priority_suggested": decision.get("priority_suggested"),
+            },
+            "error_code": None,
+            "error": None,
+        }
+        response.update(extras)
+        return response
+
+    # -- batch ----------------------------------------------------------------
+
+    def handle_batch(
+        self,
+        lines: Iterable[str],
+        on_response: Callable[[Dict[str, Any]], None],
+        workers: Optional[int] = None,
+    ) -> Dict[str, int]:
+        """
+        Handle JSONL RouterRequests on `workers` threads and pass each response
+        to `on_response` in completion order (calls are serialized). Requests of
+        one conversation run one at a time in input order, so persisted turns
+        keep their order. A missing request_id becomes "line-<n>".
+        Returns {"total", "succeeded", "failed"}.
+        """
+        workers = max(workers or batch_workers(), 1)
+        lock = threading.Condition()
+        # Bounds how far the reader runs ahead of the workers.
+        window = threading.BoundedSemaphore(workers * 4)
+        # Conversations with a request in flight -> their queued requests.
+        waiting: Dict[str, Deque[Dict[str, Any]]] = {}
+        counts = {"total": 0, "succeeded": 0, "failed": 0}
+        outstanding = 0
+
+        def report(response: Dict[str, Any]) -> None:
+            # Caller holds `lock`.
+            counts["total"] += 1
+            counts["succeeded" if response.get("status") == "success" else "failed"] += 1
+            on_response(response)
+
+        def run(conversation_id: str, payload: Dict[str, Any]) -> None:
+            nonlocal outstanding
+            try:
+                response = self.handle(payload)
+            except Exception as exc:
+                response = failed_response(str(payload.get("request_id")), "router_crashed", str(exc))
+            window.release()
+            with lock:
+                try:
+                    report(response)
+                finally:
+                    queued = waiting[conversation_id]
+                    if queued:
+                        pool.submit(run, conversation_id, queued.popleft())
+                    else:
+                        del waiting[conversation_id]
+                    outstanding -= 1
+                    lock.notify_all()
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="solar-batch") as pool:
+            for line_no, line in enumerate(lines, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    payload = json.loads(line)
+                except json.JSONDecodeError:
+                    payload = None
+                if not isinstance(payload, dict):
+                    with lock:
+                        report(failed_response(
+                            f"line-{line_no}", "invalid_json", f"line {line_no}: not a JSON object"
+                        ))
+                    continue
+                payload.setdefault("request_id", f"line-{line_no}")
+                conversation_id = request_conversation_id(payload)
+                window.acquire()
+                with lock:
+                    outstanding += 1
+                    if conversation_id in waiting:
+                        waiting[conversation_id].append(payload)
+                        continue
+                    waiting[conversation_id] = deque()
+                    pool.submit(run, conversation_id, payload)
+            with lock:
+                lock.wait_for(lambda: outstanding == 0)
+        return counts
+
+
+# ---------------------------------------------------------------------------
+# Main (stdin/stdout wrapper)
+# ---------------------------------------------------------------------------
+
+def emit(response: Dict[str, Any]) -> None:
+    print(json.dumps(response, ensure_ascii=False))
+
+
+def emit_flush(frame: Dict[str, Any]) -> None:
+    print(json.dumps(frame, ensure_ascii=False), flush=True)
+
+
+def _arg_value(args: List[str], flag: str) -> Optional[str]:
+    """Value following `flag` in argv, or None when absent or followed by another flag."""
+    if flag not in args:
+        return None
+    index = args.index(flag) + 1
+    if index < len(args) and not args[index].startswith("--"):
+        return args[index]
+    return None
+
+
+def main() -> None:
+    if len(sys.argv) > 1 and sys.argv[1] == "compact":
+        # Maintenance: python3 run_router.py compact [conversation_id ...]
+        print(json.dumps(RouterService().compact(sys.argv[2:]), indent=2))
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "health":
+        # Scoreboard: python3 run_router.py health [reset [provider ...]]
+        health = RouterService().health
+        if sys.argv[2:3] == ["reset"]:
+            health.reset(sys.argv[3:] or None)
+        print(json.dumps(health.scoreboard(), indent=2))
+        return
+
+    args = sys.argv[1:]
+    if "--batch" in args:
+        # python3 run_router.py --batch [file.jsonl] [--workers N]: JSONL in, JSONL out
+        source = _arg_value(args, "--batch")
+        workers = _arg_value(args, "--workers")
+        if source and source != "-":
+            lines = open(source, encoding="utf-8")
         else:
-            # async-tasks not enabled, degrade gracefully
-            decision["kind"] = "direct_reply"
-            decision["task_id"] = None
+            lines = contextlib.nullcontext(sys.stdin)
+        service = RouterService(group_commit=True)
+        try:
+            with lines as fh:
+                counts = service.handle_batch(
+                    fh, emit_flush, workers=int(workers) if workers else None
+                )
+        finally:
+            service.close()
+        print(f"[solar-router] batch: {json.dumps(counts)}", file=sys.stderr)
+        if counts["failed"]:
+            sys.exit(1)
+        return
 
-    # --- Persist conversation ---
-    append_message(conv_path, "user", text)
-    append_message(conv_path, "assistant", reply_text)
+    stream = "--stream" in args
+    raw = sys.stdin.read().strip()
+    if not raw:
+        emit(failed_response("unknown", "missing_input", "missing stdin payload"))
+        sys.exit(1)
 
-    # --- Emit response ---
-    emit({
-        "status": "success",
-        "request_id": request_id,
-        "provider_used": provider_used,
-        "reply_text": reply_text,
-        "decision": {
-            "kind": decision["kind"],
-            "task_id": decision.get("task_id"),
-            "priority_suggested": decision.get("priority_suggested"),
-        },
-        "error_code": None,
-        "error": None,
-    })
+    try:
+        payload = json.loads(raw)
+    except json.JSONDecodeError as exc:
+        emit(failed_response("unknown", "invalid_json", f"invalid JSON input: {exc}"))
+        sys.exit(1)
+
+    # SIGTERM cancels the request: the provider's process group is killed and
+    # a `cancelled` response is still written (bridges cancel spawned routers this way).
+    cancellation = Cancellation()
+    signal.signal(signal.SIGTERM, lambda signum, frame: cancellation.cancel())
+
+    # --stream: JSONL output, partial frames first, final response last
+    response = RouterService().handle(
+        payload, on_partial=emit_flush if stream else None, cancellation=cancellation
+    )
+    emit(response)
+    if response.get("status") != "success":
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+singleflight — coalesce identical in-flight router requests.
+
+Retries (Telegram, n8n retry nodes, double clicks) can deliver the same
+logical request while the first copy is still generating. SingleFlight runs
+one call per key; later callers with any matching key wait for that call and
+share its result instead of starting another provider process. Keys only live
+while the call is in flight: finished results are not reused (that is the
+response cache's job).
+
+Keys:
+    SOLAR_ROUTER_COALESCE   share in-flight generations between duplicates (default: true)
+"""
+import os
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional
+
+
+def coalesce_enabled() -> bool:
+    return (os.getenv("SOLAR_ROUTER_COALESCE") or "true").strip().lower() not in {"0", "false", "no", "off"}
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """One execution per key at a time; duplicates wait and share the result."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._stats = {"calls": 0, "coalesced": 0}
+
+    def do(self, keys: Iterable[str], fn: Callable[[], Any]) -> tuple[Any, bool]:
+        """
+        Run `fn` unless a call with any of `keys` is in flight; then wait for it.
+        Returns (result, shared). The leader's exception is raised in every caller.
+        """
+        keys = [key for key in keys if key]
+        with self._lock:
+            call = next((self._calls[key] for key in keys if key in self._calls), None)
+            leader = call is None
+            if leader:
+                call = _Call()
+                for key in keys:
+                    self._calls[key] = call
+                self._stats["calls"] += 1
+            else:
+                self._stats["coalesced"] += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                for key in keys:
+                    if self._calls.get(key) is call:
+                        del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self) -> Dict[str, int]:
+        """`calls` executed, `coalesced` duplicates that shared one (= provider calls saved), `in_flight`."""
+        with self._lock:
+            return {**self._stats, "in_flight": len({id(call) for call in self._calls.values()})}
@@ -8,23 +8,28 @@ Responsibilities:
 - n8n: delegate to WS bridge with channel=n8n/mode=auto,
   expose router v3 JSON directly (no legacy double-wrapper).
 - No provider selection, no fallback, no async policy here.
+
+Runs on one asyncio event loop (stdlib HTTP/1.1 server): no thread per
+connection or per update. Telegram updates are ACKed at once and processed by
+SOLAR_HTTP_TELEGRAM_WORKERS workers from a queue of at most
+SOLAR_HTTP_TELEGRAM_QUEUE_SIZE updates; when it is full Telegram gets a 503
+and redelivers later. Requests reach the WS bridge through a persistent
+connection pool (ws_client_pool.py). On SIGTERM/SIGINT the bridge stops
+accepting, then drains queued updates and in-flight requests for up to
+SOLAR_HTTP_DRAIN_TIMEOUT_SEC.
 """
 import asyncio
 import json
 import os
-import threading
+import signal
 import urllib.parse
 import urllib.request
 from http import HTTPStatus
-from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
-from time import time
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Set, Tuple
 from uuid import uuid4
 
-try:
-    from websockets.client import connect
-except Exception as exc:  # pragma: no cover
-    raise SystemExit("Missing dependency: websockets") from exc
+from update_dedup import UpdateDedup, dedup_max_entries, dedup_ttl_sec
+from ws_client_pool import PoolOverloaded, WSClientPool
 
 
 SOLAR_HTTP_HOST = os.getenv("SOLAR_HTTP_HOST", "127.0.0.1")
@@ -40,23 +45,25 @@ TELEGRAM_PARSE_MODE = os.getenv("TELEGRAM_PARSE_MODE", "Markdown")
 TELEGRAM_DISABLE_PREVIEW = os.getenv("TELEGRAM_DISABLE_PREVIEW", "true")
 BRIDGE_NAME = "solar-transport-gateway"
 BRIDGE_ROUTE_PATTERN = f"{SOLAR_HTTP_WEBHOOK_BASE}/<channel>"
-TELEGRAM_DEDUP_TTL_SECONDS = int(os.getenv("SOLAR_TELEGRAM_DEDUP_TTL_SECONDS", "43200"))
-_processed_updates: Dict[str, float] = {}
-_inflight_updates: set[str] = set()
-_updates_lock = threading.Lock()
+TELEGRAM_WORKERS = max(int(os.getenv("SOLAR_HTTP_TELEGRAM_WORKERS") or "8"), 1)
+TELEGRAM_QUEUE_SIZE = max(int(os.getenv("SOLAR_HTTP_TELEGRAM_QUEUE_SIZE") or "256"), 1)
+DRAIN_TIMEOUT_SEC = float(os.getenv("SOLAR_HTTP_DRAIN_TIMEOUT_SEC") or "30")
+MAX_BODY_BYTES = int(os.getenv("SOLAR_HTTP_MAX_BODY_BYTES") or str(1024 * 1024))
+# Idle keep-alive connections and slow clients are dropped after this long.
+KEEPALIVE_TIMEOUT_SEC = 75
+telegram_dedup = UpdateDedup(dedup_ttl_sec(), dedup_max_entries())
 
 
 # ---------------------------------------------------------------------------
 # WS bridge communication
 # ---------------------------------------------------------------------------
 
+ws_pool = WSClientPool(f"ws://{SOLAR_WS_HOST}:{SOLAR_WS_PORT}{SOLAR_WS_PATH}")
+
+
 async def request_solar(payload: Dict[str, Any]) -> Dict[str, Any]:
-    ws_url = f"ws://{SOLAR_WS_HOST}:{SOLAR_WS_PORT}{SOLAR_WS_PATH}"
-    # Keepalive: ping every 60s, wait up to 180s for pong (router timeout ~310s)
-    async with connect(ws_url, ping_interval=60, ping_timeout=180) as ws:
-        await ws.send(json.dumps(payload))
-        raw = await ws.recv()
-        return json.loads(raw)
+    """Send one request over the shared WS bridge connections and wait for its response."""
+    return await ws_pool.request(payload)
 
 
 # ---------------------------------------------------------------------------
@@ -106,26 +113,11 @@ def telegram_update_key(payload: Dict[str, Any]) -> str:
 
 
 def reserve_telegram_update(key: str) -> bool:
-    now = time()
-    with _updates_lock:
-        if TELEGRAM_DEDUP_TTL_SECONDS > 0:
-            expired = [
-                k for k, ts in _processed_updates.items()
-                if now - ts > TELEGRAM_DEDUP_TTL_SECONDS
-            ]
-            for k in expired:
-                _processed_updates.pop(k, None)
-        if key in _processed_updates or key in _inflight_updates:
-            return False
-        _inflight_updates.add(key)
-        return True
+    return telegram_dedup.reserve(key)
 
 
 def finish_telegram_update(key: str, success: bool) -> None:
-    with _updates_lock:
-        _inflight_updates.discard(key)
-        if success:
-            _processed_updates[key] = time()
+    telegram_dedup.finish(key, success)
 
 
 # ---------------------------------------------------------------------------
@@ -159,19 +151,153 @@ def parse_n8n_request(payload: Dict[str, Any]) -> Optional[Dict[str, str]]:
 
 
 # ---------------------------------------------------------------------------
-# Webhook handler
+# HTTP server
 # ---------------------------------------------------------------------------
 
-class WebhookHandler(BaseHTTPRequestHandler):
-    def write_json(self, status: HTTPStatus, payload: Dict[str, Any]) -> None:
-        body = json.dumps(payload).encode("utf-8")
+class BadRequest(ValueError):
+    """Malformed HTTP request; answered with `status`, then the connection is closed."""
+
+    def __init__(self, status: HTTPStatus, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+async def read_request(
+    reader: asyncio.StreamReader,
+) -> Optional[Tuple[str, str, str, Dict[str, str], bytes]]:
+    """Next request on the connection as (method, path, version, headers, body); None at EOF."""
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    parts = request_line.decode("latin-1").split()
+    if len(parts) != 3:
+        raise BadRequest(HTTPStatus.BAD_REQUEST, "Malformed request line")
+    method, path, version = parts
+
+    headers: Dict[str, str] = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, sep, value = line.decode("latin-1").partition(":")
+        if not sep:
+            raise BadRequest(HTTPStatus.BAD_REQUEST, "Malformed header line")
+        headers[name.strip().lower()] = value.strip()
+        if len(headers) > 100:
+            raise BadRequest(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Too many headers")
+
+    if "transfer-encoding" in headers:
+        raise BadRequest(HTTPStatus.NOT_IMPLEMENTED, "Transfer-Encoding is not supported; send Content-Length")
+    try:
+        length = int(headers.get("content-length", "0"))
+    except ValueError:
+        raise BadRequest(HTTPStatus.BAD_REQUEST, "Invalid Content-Length") from None
+    if length < 0:
+        raise BadRequest(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise BadRequest(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"Body larger than {MAX_BODY_BYTES} bytes")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), path, version, headers, body
+
+
+class WebhookServer:
+    """Webhook routes plus the bounded Telegram work queue, all on one event loop."""
+
+    def __init__(self) -> None:
+        self.telegram_queue: "asyncio.Queue[Tuple[str, Dict[str, Any], str]]" = asyncio.Queue(TELEGRAM_QUEUE_SIZE)
+        self.telegram_rejected = 0
+        self.draining = False
+        self.active_requests = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._workers: Set["asyncio.Task[None]"] = set()
+
+    # -- lifecycle ----------------------------------------------------------
+
+    def start_workers(self) -> None:
+        for _ in range(TELEGRAM_WORKERS):
+            self._workers.add(asyncio.ensure_future(self.telegram_worker()))
+
+    async def drain(self, timeout_sec: float) -> None:
+        """Refuse new work, then wait for queued updates and in-flight requests."""
+        self.draining = True
+        try:
+            await asyncio.wait_for(self._drained(), timeout_sec)
+        except asyncio.TimeoutError:
+            print(
+                f"[http-bridge] drain timed out after {timeout_sec:g}s: "
+                f"{self.telegram_queue.qsize()} queued updates, {self.active_requests} open requests dropped",
+                flush=True,
+            )
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+
+    async def _drained(self) -> None:
+        while True:
+            await self._idle.wait()
+            await self.telegram_queue.join()
+            if self._idle.is_set():
+                return
+
+    # -- connections --------------------------------------------------------
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(read_request(reader), KEEPALIVE_TIMEOUT_SEC)
+                except BadRequest as exc:
+                    await self.write_json(
+                        writer,
+                        exc.status,
+                        {"status": "failed", "bridge": BRIDGE_NAME, "error": str(exc)},
+                        keep_alive=False,
+                    )
+                    return
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+                    # Idle/slow client, truncated body or an over-long line: just close.
+                    return
+                if request is None:
+                    return
+
+                method, path, version, headers, body = request
+                self.active_requests += 1
+                self._idle.clear()
+                try:
+                    status, payload = await self.dispatch(method, path, body)
+                    keep_alive = (
+                        version == "HTTP/1.1"
+                        and headers.get("connection", "").lower() != "close"
+                        and not self.draining
+                    )
+                    await self.write_json(writer, status, payload, keep_alive)
+                finally:
+                    self.active_requests -= 1
+                    if not self.active_requests:
+                        self._idle.set()
+                if not keep_alive:
+                    return
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def write_json(
+        writer: asyncio.StreamWriter,
+        status: HTTPStatus,
+        payload: Optional[Dict[str, Any]],
+        keep_alive: bool,
+    ) -> None:
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        head = [f"HTTP/1.1 {status.value} {status.phrase}"]
+        if payload is not None:
+            head.append("Content-Type: application/json")
+        head.append(f"Content-Length: {len(body)}")
+        head.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
         try:
-            self.send_response(status)
-            self.send_header("Content-Type", "application/json")
-            self.send_header("Content-Length", str(len(body)))
-            self.end_headers()
-            self.wfile.write(body)
-        except (BrokenPipeError, ConnectionResetError):
+            await writer.drain()
+        except ConnectionError:
             return
 
     @staticmethod
@@ -185,164 +311,217 @@ class WebhookHandler(BaseHTTPRequestHandler):
             return None
         return channel
 
+    # -- routes -------------------------------------------------------------
+
+    async def dispatch(self, method: str, path: str, body: bytes) -> Tuple[HTTPStatus, Optional[Dict[str, Any]]]:
+        if method == "GET":
+            if path == "/health":
+                return HTTPStatus.OK, {
+                    "status": "ok",
+                    "bridge": BRIDGE_NAME,
+                    "route": BRIDGE_ROUTE_PATTERN,
+                    "telegram_queue": {
+                        "depth": self.telegram_queue.qsize(),
+                        "max": TELEGRAM_QUEUE_SIZE,
+                        "workers": TELEGRAM_WORKERS,
+                        "rejected": self.telegram_rejected,
+                    },
+                    "telegram_dedup": telegram_dedup.stats(),
+                    "ws_pool": ws_pool.stats(),
+                    "draining": self.draining,
+                }
+            return HTTPStatus.NOT_FOUND, None
+        if method != "POST":
+            return HTTPStatus.NOT_IMPLEMENTED, {"status": "failed", "error": f"Unsupported method ({method})"}
+
+        channel = self.channel_from_path(path)
+        if channel is None:
+            return HTTPStatus.NOT_FOUND, {"status": "failed", "error": "Unknown route"}
+        route = path.split("?", 1)[0]
+        if self.draining:
+            return HTTPStatus.SERVICE_UNAVAILABLE, {
+                "status": "failed",
+                "bridge": BRIDGE_NAME,
+                "route": route,
+                "error": "bridge shutting down; retry later",
+            }
+
+        try:
+            update = json.loads(body.decode("utf-8"))
+            if channel == "telegram":
+                return self.accept_telegram(update, route, channel)
+            elif channel == "n8n":
+                return await self.handle_n8n(update, route)
+            else:
+                raise ValueError(f"Unsupported channel: {channel}")
+        except ConnectionError as exc:
+            # WS bridge unreachable or the connection dropped: not the caller's fault.
+            return HTTPStatus.BAD_GATEWAY, {
+                "status": "failed",
+                "bridge": BRIDGE_NAME,
+                "route": route,
+                "error_code": "bridge_unavailable",
+                "error": str(exc),
+            }
+        except Exception as exc:
+            return HTTPStatus.BAD_REQUEST, {
+                "status": "failed",
+                "bridge": BRIDGE_NAME,
+                "route": route,
+                "error": str(exc),
+            }
+
+    def accept_telegram(
+        self,
+        update: Dict[str, Any],
+        route: str,
+        channel: str,
+    ) -> Tuple[HTTPStatus, Dict[str, Any]]:
+        parsed = parse_telegram_update(update)
+        if parsed is None:
+            raise ValueError("Unsupported Telegram payload")
+
+        dedup_key = telegram_update_key(update)
+        if not reserve_telegram_update(dedup_key):
+            return HTTPStatus.OK, {
+                "status": "ok",
+                "ok": True,
+                "duplicate": True,
+                "bridge": BRIDGE_NAME,
+                "route": route,
+                "channel": channel,
+            }
+
+        request_payload = {
+            "type": "request",
+            "request_id": f"tg_{uuid4().hex[:12]}",
+            "session_id": f"telegram:{parsed['chat_id']}",
+            "user_id": parsed["user_id"],
+            "text": parsed["text"],
+            "channel": "telegram",
+            "mode": "auto",
+        }
+        try:
+            self.telegram_queue.put_nowait((dedup_key, request_payload, parsed["chat_id"]))
+        except asyncio.QueueFull:
+            # Non-2xx makes Telegram redeliver the update later.
+            finish_telegram_update(dedup_key, False)
+            self.telegram_rejected += 1
+            return HTTPStatus.SERVICE_UNAVAILABLE, {
+                "status": "failed",
+                "ok": False,
+                "bridge": BRIDGE_NAME,
+                "route": route,
+                "channel": channel,
+                "error_code": "overloaded",
+                "error": f"telegram queue full ({TELEGRAM_QUEUE_SIZE} updates); retry later",
+            }
+        # ACK immediately to Telegram (must respond within 5s)
+        return HTTPStatus.OK, {
+            "status": "ok",
+            "ok": True,
+            "accepted": True,
+            "bridge": BRIDGE_NAME,
+            "route": route,
+            "channel": channel,
+            "request_id": request_payload["request_id"],
+        }
+
+    async def handle_n8n(self, update: Dict[str, Any], route: str) -> Tuple[HTTPStatus, Dict[str, Any]]:
+        parsed_n8n = parse_n8n_request(update)
+        if parsed_n8n is None:
+            raise ValueError("Unsupported n8n payload")
+
+        request_payload = {
+            "type": "request",
+            "request_id": parsed_n8n["request_id"],
+            "session_id": parsed_n8n["session_id"],
+            "user_id": parsed_n8n["user_id"],
+            "text": parsed_n8n["text"],
+            "channel": "n8n",
+            "mode": "auto",
+        }
+        try:
+            response = await request_solar(request_payload)
+        except PoolOverloaded as exc:
+            return HTTPStatus.SERVICE_UNAVAILABLE, {
+                "status": "failed",
+                "bridge": BRIDGE_NAME,
+                "route": route,
+                "request_id": request_payload["request_id"],
+                "error_code": "overloaded",
+                "error": str(exc),
+            }
+
+        # n8n: expose router v3 JSON directly, minimal bridge metadata only
+        return HTTPStatus.OK, {
+            "bridge": BRIDGE_NAME,
+            "route": route,
+            **response,
+        }
+
+    # -- telegram workers ---------------------------------------------------
+
+    async def telegram_worker(self) -> None:
+        while True:
+            dedup_key, request_payload, chat_id = await self.telegram_queue.get()
+            try:
+                await self.process_telegram(dedup_key, request_payload, chat_id)
+            finally:
+                self.telegram_queue.task_done()
+
     @staticmethod
-    def process_telegram_async(
+    async def process_telegram(
         dedup_key: str,
         request_payload: Dict[str, Any],
         chat_id: str,
     ) -> None:
         success = False
         try:
-            response = asyncio.run(request_solar(request_payload))
+            response = await request_solar(request_payload)
             decision_kind = (response.get("decision") or {}).get("kind", "direct_reply")
             reply_text = response.get("reply_text", "No response from solar.")
 
             if decision_kind == "direct_reply":
-                send_telegram(chat_id, reply_text)
+                await asyncio.to_thread(send_telegram, chat_id, reply_text)
             else:
                 # async_draft_proposal / async_draft_created / async_activation_needed
                 # Send control message to user
-                send_telegram(chat_id, reply_text)
+                await asyncio.to_thread(send_telegram, chat_id, reply_text)
             success = True
         except Exception as exc:
-            print(f"[http-bridge] telegram async processing failed ({dedup_key}): {exc}")
+            print(f"[http-bridge] telegram async processing failed ({dedup_key}): {exc}", flush=True)
         finally:
             finish_telegram_update(dedup_key, success)
 
-    def do_GET(self) -> None:
-        if self.path == "/health":
-            self.send_response(HTTPStatus.OK)
-            self.send_header("Content-Type", "application/json")
-            self.end_headers()
-            body = json.dumps(
-                {
-                    "status": "ok",
-                    "bridge": BRIDGE_NAME,
-                    "route": BRIDGE_ROUTE_PATTERN,
-                }
-            ).encode("utf-8")
-            self.wfile.write(body)
-            return
-        self.send_response(HTTPStatus.NOT_FOUND)
-        self.end_headers()
-
-    def do_POST(self) -> None:
-        channel = self.channel_from_path(self.path)
-        if channel is None:
-            self.write_json(
-                HTTPStatus.NOT_FOUND,
-                {"status": "failed", "error": "Unknown route"},
-            )
-            return
-
-        try:
-            length = int(self.headers.get("Content-Length", "0"))
-            raw = self.rfile.read(length)
-            update = json.loads(raw.decode("utf-8"))
-
-            if channel == "telegram":
-                parsed = parse_telegram_update(update)
-                if parsed is None:
-                    raise ValueError("Unsupported Telegram payload")
-
-                dedup_key = telegram_update_key(update)
-                if not reserve_telegram_update(dedup_key):
-                    self.write_json(
-                        HTTPStatus.OK,
-                        {
-                            "status": "ok",
-                            "ok": True,
-                            "duplicate": True,
-                            "bridge": BRIDGE_NAME,
-                            "route": self.path.split("?", 1)[0],
-                            "channel": channel,
-                        },
-                    )
-                    return
-
-                request_payload = {
-                    "type": "request",
-                    "request_id": f"tg_{uuid4().hex[:12]}",
-                    "session_id": f"telegram:{parsed['chat_id']}",
-                    "user_id": parsed["user_id"],
-                    "text": parsed["text"],
-                    "channel": "telegram",
-                    "mode": "auto",
-                }
-                # ACK immediately to Telegram (must respond within 5s)
-                self.write_json(
-                    HTTPStatus.OK,
-                    {
-                        "status": "ok",
-                        "ok": True,
-                        "accepted": True,
-                        "bridge": BRIDGE_NAME,
-                        "route": self.path.split("?", 1)[0],
-                        "channel": channel,
-                        "request_id": request_payload["request_id"],
-                    },
-                )
-                threading.Thread(
-                    target=self.process_telegram_async,
-                    args=(dedup_key, request_payload, parsed["chat_id"]),
-                    daemon=True,
-                ).start()
-                return
 
-            elif channel == "n8n":
-                parsed_n8n = parse_n8n_request(update)
-                if parsed_n8n is None:
-                    raise ValueError("Unsupported n8n payload")
-
-                request_payload = {
-                    "type": "request",
-                    "request_id": parsed_n8n["request_id"],
-                    "session_id": parsed_n8n["session_id"],
-                    "user_id": parsed_n8n["user_id"],
-                    "text": parsed_n8n["text"],
-                    "channel": "n8n",
-                    "mode": "auto",
-                }
-                response = asyncio.run(request_solar(request_payload))
-
-                # n8n: expose router v3 JSON directly, minimal bridge metadata only
-                self.write_json(
-                    HTTPStatus.OK,
-                    {
-                        "bridge": BRIDGE_NAME,
-                        "route": self.path.split("?", 1)[0],
-                        **response,
-                    },
-                )
-                return
-
-            else:
-                raise ValueError(f"Unsupported channel: {channel}")
+async def serve() -> None:
+    await ws_pool.open()
+    app = WebhookServer()
+    app.start_workers()
+    server = await asyncio.start_server(app.handle_connection, SOLAR_HTTP_HOST, SOLAR_HTTP_PORT)
+    print(
+        f"solar-webhook listening on http://{SOLAR_HTTP_HOST}:{SOLAR_HTTP_PORT}"
+        f"{SOLAR_HTTP_WEBHOOK_BASE}/<channel>",
+        flush=True,
+    )
 
-        except Exception as exc:  # pragma: no cover
-            self.write_json(
-                HTTPStatus.BAD_REQUEST,
-                {
-                    "status": "failed",
-                    "bridge": BRIDGE_NAME,
-                    "route": self.path.split("?", 1)[0],
-                    "error": str(exc),
-                },
-            )
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+    await stop.wait()
 
-    def log_message(self, format: str, *args: Any) -> None:
-        return
+    print("[http-bridge] shutting down: draining telegram queue and open requests", flush=True)
+    server.close()
+    await app.drain(DRAIN_TIMEOUT_SEC)
+    await ws_pool.close()
 
 
 def main() -> None:
     if not TELEGRAM_BOT_TOKEN:
         raise SystemExit("Missing TELEGRAM_BOT_TOKEN in environment.")
-    server = ThreadingHTTPServer((SOLAR_HTTP_HOST, SOLAR_HTTP_PORT), WebhookHandler)
-    print(
-        f"solar-webhook listening on http://{SOLAR_HTTP_HOST}:{SOLAR_HTTP_PORT}"
-        f"{SOLAR_HTTP_WEBHOOK_BASE}/<channel>"
-    )
-    server.serve_forever()
+    asyncio.run(serve())
 
 
 if __name__ == "__main__":
@@ -4,16 +4,42 @@ solar-transport-gateway WebSocket bridge v3.
 
 Pure delegate: forwards requests to solar-router and returns the structured
 router v3 response. No provider selection, no fallback, no async policy here.
+
+Router calls run on a bounded worker pool, never on the event loop, so
+keepalives, handshakes and other connections stay responsive while a provider
+works. Requests beyond SOLAR_WS_MAX_CONCURRENCY running plus
+SOLAR_WS_MAX_PENDING waiting are answered at once with error_code `overloaded`.
+
+One connection runs up to SOLAR_WS_CONNECTION_MAX_INFLIGHT requests at a
+time and queues as many again; beyond that a request is answered at once with
+error_code `overloaded`. Frames are always read, so a
+`{"type": "cancel", "request_id": ...}` frame reaches a running or queued
+request, kills its provider call and answers it with error_code `cancelled`.
+Responses come back in completion order, matched by request_id.
+
+Turns of one conversation wait for each other on the event loop, across all
+connections, before taking a router worker: a burst from one chat holds one
+worker at a time instead of filling the pool with turns blocked on the
+router's conversation lock. Duplicates of a request already in the bridge
+(same request_id, or same conversation and text; see run_router.coalesce_keys)
+are matched before that wait and share the first copy's response, marked
+`"coalesced": true`, as the router's SingleFlight would.
 """
 import asyncio
+import contextlib
 import json
 import os
 import pathlib
+import signal
 import subprocess
+import sys
+import threading
 import traceback
-from typing import Any, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
 
 try:
+    from websockets.exceptions import ConnectionClosed
     from websockets.server import serve
 except Exception as exc:  # pragma: no cover
     raise SystemExit(
@@ -34,6 +60,25 @@ AI_ROUTER_TIMEOUT_SEC = int(
 # Router script path: repo root is 4 levels up from this script
 _REPO_ROOT = pathlib.Path(__file__).resolve().parents[4]
 _ROUTER_SCRIPT = _REPO_ROOT / "core/skills/solar-router/scripts/run_router.py"
+if str(_ROUTER_SCRIPT.parent) not in sys.path:
+    sys.path.insert(0, str(_ROUTER_SCRIPT.parent))
+
+from provider_runner import Cancellation  # noqa: E402
+from run_router import coalesce_keys, request_conversation_id, sanitize_id  # noqa: E402
+from singleflight import coalesce_enabled  # noqa: E402
+
+# In-process router (default): one warm RouterService for the bridge lifetime.
+# Set SOLAR_ROUTER_IN_PROCESS=false to spawn run_router.py per request instead.
+ROUTER_IN_PROCESS = os.getenv("SOLAR_ROUTER_IN_PROCESS", "true").strip().lower() not in {
+    "0", "false", "no", "off",
+}
+_router_service: Optional[Any] = None
+
+# Router calls running at once, and admitted calls waiting for a worker.
+MAX_CONCURRENCY = max(int(os.getenv("SOLAR_WS_MAX_CONCURRENCY") or "8"), 1)
+MAX_PENDING = max(int(os.getenv("SOLAR_WS_MAX_PENDING") or "32"), 0)
+# Requests one connection may run at once; as many again may queue before `overloaded`.
+CONNECTION_MAX_INFLIGHT = max(int(os.getenv("SOLAR_WS_CONNECTION_MAX_INFLIGHT") or "8"), 1)
 
 REQUIRED_FIELDS = {"type", "request_id", "session_id", "user_id", "text"}
 
@@ -45,11 +90,208 @@ def validate_request(payload: Dict[str, Any]) -> bool:
     )
 
 
-def call_router(payload: Dict[str, Any]) -> Dict[str, Any]:
+def get_router_service() -> Any:
+    """Import solar-router once and keep a single warm RouterService."""
+    global _router_service
+    if _router_service is None:
+        import run_router
+
+        # Long-lived: group-commit conversation writes across concurrent requests.
+        _router_service = run_router.RouterService(group_commit=True)
+    return _router_service
+
+
+def record_coalesced(payload: Dict[str, Any], response: Dict[str, Any]) -> None:
+    """Count a duplicate coalesced in the bridge in the router's metrics, as RouterService.handle would."""
+    if not ROUTER_IN_PROCESS:
+        return
+    metrics = get_router_service().metrics
+    if not metrics.enabled:
+        return
+    try:
+        metrics.record({
+            "request_id": response.get("request_id"),
+            "channel": str(payload.get("channel") or "other"),
+            "mode": str(payload.get("mode") or "auto"),
+            "status": response.get("status"),
+            "provider_used": response.get("provider_used"),
+            "error_code": response.get("error_code"),
+            "cache": (response.get("cache") or {}).get("status"),
+            "coalesced": True,
+            "timings": {},
+        })
+    except OSError as exc:
+        print(f"[ws-bridge] metrics write failed: {exc}", flush=True)
+
+
+class BridgeOverloaded(RuntimeError):
+    """Every worker is busy and the pending queue is full."""
+
+
+class RouterPool:
+    """
+    Runs blocking router calls on `max_concurrency` worker threads with at
+    most `max_pending` more waiting. Admission is counted on the event loop;
+    a slot is freed when the call finishes (or is cancelled before starting),
+    not when its awaiting coroutine goes away.
+    """
+
+    def __init__(self, max_concurrency: int, max_pending: int) -> None:
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.admitted = 0
+        self.rejected = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "running": min(self.admitted, self.max_concurrency),
+            "pending": max(self.admitted - self.max_concurrency, 0),
+            "rejected": self.rejected,
+        }
+
+    async def run(self, fn: Callable[..., Dict[str, Any]], *args: Any) -> Dict[str, Any]:
+        if self.admitted >= self.max_concurrency + self.max_pending:
+            self.rejected += 1
+            raise BridgeOverloaded(
+                f"bridge overloaded: {self.max_concurrency} router calls running and "
+                f"{self.max_pending} waiting; retry later"
+            )
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_concurrency, thread_name_prefix="ws-router"
+            )
+        loop = asyncio.get_running_loop()
+        self.admitted += 1
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(lambda _: _call_soon(loop, self._release))
+        return await asyncio.wrap_future(future)
+
+    def _release(self) -> None:
+        self.admitted -= 1
+
+
+class BridgeFlight:
+    """
+    Event-loop counterpart of the router's SingleFlight, consulted before the
+    conversation turn: turns of one conversation never overlap in the router,
+    so its SingleFlight alone would never see the duplicate in flight.
+    """
+
+    def __init__(self, enabled: bool) -> None:
+        self.enabled = enabled
+        self._calls: Dict[str, "asyncio.Future[Dict[str, Any]]"] = {}
+
+    async def do(
+        self,
+        payload: Dict[str, Any],
+        fn: Callable[[], Awaitable[Dict[str, Any]]],
+    ) -> Tuple[Dict[str, Any], bool]:
+        """Run `fn` unless a duplicate of `payload` is in flight; then share its response."""
+        keys = coalesce_keys(payload) if self.enabled else []
+        call = next((self._calls[key] for key in keys if key in self._calls), None)
+        if call is not None:
+            return dict(await asyncio.shield(call)), True
+        call = asyncio.get_running_loop().create_future()
+        for key in keys:
+            self._calls[key] = call
+        try:
+            response = await fn()
+            call.set_result(response)
+            return response, False
+        except BaseException as exc:
+            call.set_exception(exc)
+            call.exception()  # retrieved: a leader without duplicates must not log it
+            raise
+        finally:
+            for key in keys:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+
+
+class ConversationTurns:
+    """
+    One FIFO asyncio.Lock per conversation (the router's lock key), dropped
+    once no turn holds or waits for it. Only used from the event loop.
+    """
+
+    def __init__(self) -> None:
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._users: Dict[str, int] = {}
+
+    @contextlib.asynccontextmanager
+    async def turn(self, payload: Dict[str, Any], cancellation: Cancellation):
+        """Yield True once it is this request's turn, False if it was cancelled while waiting."""
+        key = sanitize_id(request_conversation_id(payload))
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._users[key] = self._users.get(key, 0) + 1
+        try:
+            granted = await wait_unless_cancelled(lock.acquire(), cancellation)
+            try:
+                yield granted
+            finally:
+                if granted:
+                    lock.release()
+        finally:
+            self._users[key] -= 1
+            if not self._users[key]:
+                del self._users[key]
+                del self._locks[key]
+
+
+async def wait_unless_cancelled(waiter: Awaitable[Any], cancellation: Cancellation) -> bool:
+    """Await `waiter`; False (with `waiter` cancelled) when the request is cancelled first."""
+    future = asyncio.ensure_future(waiter)
+    # cancel() runs on this loop (cancel frames), so it may cancel the wait directly.
+    with cancellation.on_cancel(future.cancel):
+        try:
+            await future
+        except asyncio.CancelledError:
+            if not cancellation.cancelled:
+                raise
+    return not future.cancelled()
+
+
+def _call_soon(loop: asyncio.AbstractEventLoop, callback: Callable[[], None]) -> None:
+    with contextlib.suppress(RuntimeError):  # loop already closed at shutdown
+        loop.call_soon_threadsafe(callback)
+
+
+router_pool = RouterPool(MAX_CONCURRENCY, MAX_PENDING)
+request_flight = BridgeFlight(coalesce_enabled())
+conversation_turns = ConversationTurns()
+
+
+def failed_response(request_id: str, error_code: str, error: str) -> Dict[str, Any]:
+    return {
+        "type": "response",
+        "request_id": request_id,
+        "status": "failed",
+        "provider_used": None,
+        "reply_text": error,
+        "decision": {"kind": "direct_reply", "task_id": None, "priority_suggested": None},
+        "error_code": error_code,
+        "error": error,
+    }
+
+
+def call_router(
+    payload: Dict[str, Any],
+    on_partial: Optional[Callable[[Dict[str, Any]], None]] = None,
+    cancellation: Optional[Cancellation] = None,
+) -> Dict[str, Any]:
     """
     Forward the full request payload to solar-router v3.
-    Returns the parsed router v3 JSON response dict.
+    Returns the router v3 response dict (in-process or parsed from subprocess stdout).
+    `on_partial` receives router partial frames (in-process mode only).
+    Cancelling `cancellation` kills the provider (in-process) or sends SIGTERM
+    to the spawned router, which then answers `cancelled` itself. Both paths
+    are bounded by AI_ROUTER_TIMEOUT_SEC; in-process, expiry cancels the
+    request and answers `router_timeout`.
     """
+    if cancellation is not None and cancellation.cancelled:
+        # Cancelled while waiting for a worker: never reaches the router.
+        return failed_response(payload.get("request_id", "n/a"), "cancelled", "request cancelled")
     router_payload = {
         "request_id": payload.get("request_id", "n/a"),
         "session_id": payload.get("session_id", "n/a"),
@@ -63,14 +305,63 @@ def call_router(payload: Dict[str, Any]) -> Dict[str, Any]:
     if payload.get("provider"):
         router_payload["provider"] = payload["provider"]
 
-    proc = subprocess.run(
+    if ROUTER_IN_PROCESS:
+        # Same overall bound as the subprocess call: cancel the request (kills the provider) when it expires.
+        cancellation = cancellation or Cancellation()
+        timed_out = threading.Event()
+
+        def expire() -> None:
+            timed_out.set()
+            cancellation.cancel()
+
+        timer = threading.Timer(AI_ROUTER_TIMEOUT_SEC, expire)
+        timer.daemon = True
+        timer.start()
+        try:
+            response = get_router_service().handle(
+                router_payload, on_partial=on_partial, cancellation=cancellation
+            )
+        except Exception as exc:
+            traceback.print_exc()
+            return {
+                "status": "failed",
+                "request_id": payload.get("request_id", "n/a"),
+                "provider_used": None,
+                "reply_text": str(exc) or "router crashed",
+                "decision": {"kind": "direct_reply", "task_id": None, "priority_suggested": None},
+                "error_code": "router_crashed",
+                "error": str(exc),
+            }
+        finally:
+            timer.cancel()
+        if timed_out.is_set() and response.get("error_code") == "cancelled":
+            response = {
+                **response,
+                "error_code": "router_timeout",
+                "error": f"router call timed out after {AI_ROUTER_TIMEOUT_SEC}s",
+            }
+        return response
+
+    proc = subprocess.Popen(
         [AI_ROUTER_PYTHON, str(_ROUTER_SCRIPT)],
-        input=json.dumps(router_payload),
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
         text=True,
-        capture_output=True,
-        timeout=AI_ROUTER_TIMEOUT_SEC,
     )
-    stdout = proc.stdout.strip()
+    on_cancel = (
+        cancellation.on_cancel(lambda: proc.send_signal(signal.SIGTERM))
+        if cancellation is not None
+        else contextlib.nullcontext()
+    )
+    with on_cancel:
+        try:
+            stdout, stderr = proc.communicate(json.dumps(router_payload), timeout=AI_ROUTER_TIMEOUT_SEC)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.communicate()
+            raise
+    stdout = stdout.strip()
 
     # Always try to parse stdout as router v3 JSON first — even on non-zero exit.
     # Router emits structured JSON errors (with real error_code) and then exits 1.
@@ -81,7 +372,9 @@ def call_router(payload: Dict[str, Any]) -> Dict[str, Any]:
             pass
 
     # Fallback: no parseable JSON at all (crash, binary not found, etc.)
-    error_msg = proc.stderr.strip() or stdout or "router failed with no output"
+    if cancellation is not None and cancellation.cancelled:
+        return failed_response(payload.get("request_id", "n/a"), "cancelled", "request cancelled")
+    error_msg = stderr.strip() or stdout or "router failed with no output"
     return {
         "status": "failed",
         "request_id": payload.get("request_id", "n/a"),
@@ -93,6 +386,53 @@ def call_router(payload: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
+async def call_router_streaming(
+    payload: Dict[str, Any],
+    websocket,
+    cancellation: Optional[Cancellation] = None,
+) -> Dict[str, Any]:
+    """
+    Run the router off the event loop and forward its partial frames as
+    `type: "chunk"` messages (and early `type: "decision"` hints), in order,
+    before the caller sends the final response.
+    """
+    loop = asyncio.get_running_loop()
+    chunks: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue()
+
+    def on_partial(frame: Dict[str, Any]) -> None:
+        if frame.get("type") == "decision":
+            chunk = {
+                "type": "decision",
+                "request_id": payload.get("request_id", "n/a"),
+                "provider": frame.get("provider"),
+                "kind": frame.get("kind"),
+                "priority_suggested": frame.get("priority_suggested"),
+            }
+        else:
+            chunk = {
+                "type": "chunk",
+                "request_id": payload.get("request_id", "n/a"),
+                "provider": frame.get("provider"),
+                "text": frame.get("text", ""),
+                "reset": bool(frame.get("reset")),
+            }
+        loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+
+    async def forward() -> None:
+        while True:
+            chunk = await chunks.get()
+            if chunk is None:
+                return
+            await websocket.send(json.dumps(chunk))
+
+    forwarder = asyncio.ensure_future(forward())
+    try:
+        return await router_pool.run(call_router, payload, on_partial, cancellation)
+    finally:
+        chunks.put_nowait(None)
+        await forwarder
+
+
 async def handle_connection(websocket) -> None:
     if websocket.path != PATH:
         await websocket.send(
@@ -108,38 +448,111 @@ async def handle_connection(websocket) -> None:
         )
         return
 
-    async for raw in websocket:
-        request_id = "n/a"
+    # Frames are read as they arrive, whatever is in flight, so cancel frames are
+    # never stuck behind busy slots; each request runs as its own task and takes
+    # its slot there.
+    slots = asyncio.Semaphore(CONNECTION_MAX_INFLIGHT)
+    inflight: Dict[str, List[Cancellation]] = {}  # running and queued requests
+    tasks: Set["asyncio.Task[None]"] = set()
+
+    async def serve_request(payload: Dict[str, Any], request_id: Any) -> None:
+        cancellation = Cancellation()
+        key = str(request_id)
+        inflight.setdefault(key, []).append(cancellation)
+
+        async def take_turn() -> Dict[str, Any]:
+            # Conversation turn first, then a connection slot: a turn waiting for
+            # an earlier one of its conversation occupies neither slot nor worker.
+            async with conversation_turns.turn(payload, cancellation) as granted:
+                if not (granted and await wait_unless_cancelled(slots.acquire(), cancellation)):
+                    return failed_response(request_id, "cancelled", "request cancelled while queued")
+                try:
+                    return await route_request(payload, request_id, websocket, cancellation)
+                finally:
+                    slots.release()
+
         try:
-            payload = json.loads(raw)
-            request_id = payload.get("request_id", "n/a")
+            response, coalesced = await request_flight.do(payload, take_turn)
+            if coalesced:
+                response.update(request_id=request_id, coalesced=True)
+                # Off the loop: the Prometheus sink takes a file lock.
+                await asyncio.get_running_loop().run_in_executor(None, record_coalesced, payload, response)
+        finally:
+            inflight[key].remove(cancellation)
+            if not inflight[key]:
+                del inflight[key]
+        with contextlib.suppress(ConnectionClosed):
+            await websocket.send(json.dumps(response))
 
-            if not validate_request(payload):
-                raise ValueError("Invalid request payload: missing required fields or type != request")
+    try:
+        async for raw in websocket:
+            request_id = "n/a"
+            try:
+                payload = json.loads(raw)
+                request_id = payload.get("request_id", "n/a")
 
-            router_response = call_router(payload)
+                if payload.get("type") == "cancel":
+                    targets = list(inflight.get(str(request_id), ()))
+                    if not targets:
+                        print(f"[ws-bridge] cancel for unknown request ({request_id}) ignored", flush=True)
+                    for cancellation in targets:
+                        cancellation.cancel()
+                    continue
 
-            # Envelope: minimal transport metadata + full router v3 response
-            response = {
-                "type": "response",
-                "request_id": request_id,
-                **router_response,
-            }
-        except Exception as exc:
-            print(f"[ws-bridge] request failed ({request_id}): {exc}", flush=True)
-            traceback.print_exc()
-            response = {
-                "type": "response",
-                "request_id": request_id,
-                "status": "failed",
-                "provider_used": None,
-                "reply_text": str(exc) or "bridge error",
-                "decision": {"kind": "direct_reply", "task_id": None, "priority_suggested": None},
-                "error_code": "bridge_error",
-                "error": str(exc),
-            }
+                if not validate_request(payload):
+                    raise ValueError("Invalid request payload: missing required fields or type != request")
+            except Exception as exc:
+                print(f"[ws-bridge] request failed ({request_id}): {exc}", flush=True)
+                response = failed_response(request_id, "bridge_error", str(exc) or "bridge error")
+                response["error"] = str(exc)
+                await websocket.send(json.dumps(response))
+                continue
+
+            if len(tasks) >= 2 * CONNECTION_MAX_INFLIGHT:
+                error = (
+                    f"connection has {CONNECTION_MAX_INFLIGHT} requests in flight and "
+                    f"{len(tasks) - CONNECTION_MAX_INFLIGHT} queued; retry later"
+                )
+                print(f"[ws-bridge] rejected ({request_id}): {error}", flush=True)
+                await websocket.send(json.dumps(failed_response(request_id, "overloaded", error)))
+                continue
+            task = asyncio.ensure_future(serve_request(payload, request_id))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    finally:
+        # A closed connection does not cancel its requests: turns still complete and persist.
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def route_request(
+    payload: Dict[str, Any],
+    request_id: Any,
+    websocket,
+    cancellation: Cancellation,
+) -> Dict[str, Any]:
+    """Run one validated request through the router pool and build its response frame."""
+    try:
+        if payload.get("stream") and ROUTER_IN_PROCESS:
+            router_response = await call_router_streaming(payload, websocket, cancellation)
+        else:
+            router_response = await router_pool.run(call_router, payload, None, cancellation)
 
-        await websocket.send(json.dumps(response))
+        # Envelope: minimal transport metadata + full router v3 response
+        return {
+            "type": "response",
+            "request_id": request_id,
+            **router_response,
+        }
+    except BridgeOverloaded as exc:
+        print(f"[ws-bridge] rejected ({request_id}): {exc}", flush=True)
+        return failed_response(request_id, "overloaded", str(exc))
+    except Exception as exc:
+        print(f"[ws-bridge] request failed ({request_id}): {exc}", flush=True)
+        traceback.print_exc()
+        response = failed_response(request_id, "bridge_error", str(exc) or "bridge error")
+        response["error"] = str(exc)
+        return response
 
 
 async def main() -> None:
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+update_dedup — bounded, TTL-expiring dedup of inbound webhook updates.
+
+Processed keys live in an OrderedDict ordered by last use: a duplicate moves
+its key to the tail and restarts its TTL, so the head is always both the
+oldest and the least recently used entry. Expiry pops from the head and LRU
+eviction past MAX_ENTRIES does too, both amortized O(1). Each call expires at
+most EXPIRE_BATCH entries, which keeps lock hold time constant however many
+updates have been seen; entries past their TTL that are still queued count as
+absent.
+
+Keys:
+    SOLAR_TELEGRAM_DEDUP_TTL_SECONDS   how long a processed update is remembered; 0 = until evicted (default: 43200)
+    SOLAR_TELEGRAM_DEDUP_MAX_ENTRIES   processed updates kept; the least recently seen are evicted (default: 50000)
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Set
+
+
+EXPIRE_BATCH = 64
+
+
+def dedup_ttl_sec() -> int:
+    return int(os.getenv("SOLAR_TELEGRAM_DEDUP_TTL_SECONDS", "43200"))
+
+
+def dedup_max_entries() -> int:
+    return max(int(os.getenv("SOLAR_TELEGRAM_DEDUP_MAX_ENTRIES") or "50000"), 1)
+
+
+class UpdateDedup:
+    """In-flight and recently processed update keys; reserve() before work, finish() after."""
+
+    def __init__(self, ttl_sec: int, max_entries: int) -> None:
+        self.ttl_sec = ttl_sec
+        self.max_entries = max_entries
+        self._processed: "OrderedDict[str, float]" = OrderedDict()
+        self._inflight: Set[str] = set()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "expired": 0, "evictions": 0}
+
+    def reserve(self, key: str) -> bool:
+        """False when `key` is in flight or was processed within the TTL (a duplicate)."""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            if key in self._inflight or self._touch(key, now):
+                self._counters["hits"] += 1
+                return False
+            self._inflight.add(key)
+            return True
+
+    def finish(self, key: str, success: bool) -> None:
+        """Release a reservation; successful updates are remembered for the TTL."""
+        with self._lock:
+            self._inflight.discard(key)
+            if success:
+                self._processed[key] = time.monotonic()
+                self._processed.move_to_end(key)
+                while len(self._processed) > self.max_entries:
+                    self._processed.popitem(last=False)
+                    self._counters["evictions"] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._processed),
+                "in_flight": len(self._inflight),
+                "max_entries": self.max_entries,
+                **self._counters,
+            }
+
+    # -- internals ----------------------------------------------------------
+
+    def _expired(self, seen_at: float, now: float) -> bool:
+        return self.ttl_sec > 0 and now - seen_at > self.ttl_sec
+
+    def _touch(self, key: str, now: float) -> bool:
+        # Caller holds self._lock.
+        seen_at = self._processed.get(key)
+        if seen_at is None:
+            return False
+        if self._expired(seen_at, now):
+            del self._processed[key]
+            self._counters["expired"] += 1
+            return False
+        self._processed[key] = now
+        self._processed.move_to_end(key)
+        return True
+
+    def _expire(self, now: float) -> None:
+        # Caller holds self._lock. The head is the oldest entry, so stop at the first live one.
+        for _ in range(EXPIRE_BATCH):
+            if not self._processed:
+                return
+            key, seen_at = next(iter(self._processed.items()))
+            if not self._expired(seen_at, now):
+                return
+            del self._processed[key]
+            self._counters["expired"] += 1
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+ws_client_pool — persistent, multiplexed WS bridge connections for the HTTP bridge.
+
+Connecting (TCP + WebSocket handshake) and creating an event loop for every
+webhook call costs more than the request framing itself. WSClientPool keeps
+POOL_SIZE connections to the WS bridge open on the caller's event loop. Each request
+goes out on the least busy connection and its response is matched by
+request_id (the WS bridge answers in completion order). Keepalive pings close
+dead connections; a closed connection fails its in-flight requests and is
+reopened with exponential backoff.
+
+Backpressure: a connection carries at most MAX_INFLIGHT requests, up to
+MAX_PENDING more wait for a free slot, and anything beyond that is rejected
+at once with PoolOverloaded.
+
+Keys:
+    SOLAR_HTTP_WS_POOL_SIZE            connections kept open (default: 2)
+    SOLAR_HTTP_WS_MAX_INFLIGHT         requests in flight per connection (default: 8)
+    SOLAR_HTTP_WS_MAX_PENDING          requests waiting for a free slot (default: 64)
+    SOLAR_HTTP_WS_PING_INTERVAL_SEC    keepalive ping interval and pong timeout (default: 20)
+    SOLAR_HTTP_WS_RECONNECT_MAX_SEC    reconnect backoff cap (default: 30)
+    SOLAR_HTTP_WS_CONNECT_WAIT_SEC     how long a request waits while no connection is open (default: 10)
+"""
+import asyncio
+import contextlib
+import json
+import os
+import random
+from typing import Any, Dict, List, Optional, Set
+from uuid import uuid4
+
+try:
+    from websockets.client import connect
+    from websockets.exceptions import ConnectionClosed
+except Exception as exc:  # pragma: no cover
+    raise SystemExit("Missing dependency: websockets") from exc
+
+
+RECONNECT_MIN_SEC = 0.5
+
+
+def pool_size() -> int:
+    return max(int(os.getenv("SOLAR_HTTP_WS_POOL_SIZE") or "2"), 1)
+
+
+def max_inflight() -> int:
+    return max(int(os.getenv("SOLAR_HTTP_WS_MAX_INFLIGHT") or "8"), 1)
+
+
+def max_pending() -> int:
+    return max(int(os.getenv("SOLAR_HTTP_WS_MAX_PENDING") or "64"), 0)
+
+
+def ping_interval_sec() -> float:
+    return float(os.getenv("SOLAR_HTTP_WS_PING_INTERVAL_SEC") or "20")
+
+
+def reconnect_max_sec() -> float:
+    return float(os.getenv("SOLAR_HTTP_WS_RECONNECT_MAX_SEC") or "30")
+
+
+def connect_wait_sec() -> float:
+    return float(os.getenv("SOLAR_HTTP_WS_CONNECT_WAIT_SEC") or "10")
+
+
+class PoolOverloaded(RuntimeError):
+    """Every connection slot is busy and the pending queue is full."""
+
+
+class _Connection:
+    """One WS bridge connection and the requests waiting for its responses."""
+
+    def __init__(self, index: int) -> None:
+        self.index = index
+        self.ws: Any = None
+        self.waiters: Dict[str, "asyncio.Future[Dict[str, Any]]"] = {}
+        self.connects = 0
+        self.last_error: Optional[str] = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "open": self.ws is not None,
+            "in_flight": len(self.waiters),
+            "connects": self.connects,
+            "last_error": self.last_error,
+        }
+
+
+class WSClientPool:
+    """Long-lived WS bridge connections shared by all webhook requests."""
+
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self.size = pool_size()
+        self.max_inflight = max_inflight()
+        self.max_pending = max_pending()
+        self.ping_interval_sec = ping_interval_sec()
+        self.reconnect_max_sec = reconnect_max_sec()
+        self.connect_wait_sec = connect_wait_sec()
+        self._connections = [_Connection(index) for index in range(self.size)]
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._changed: Optional[asyncio.Condition] = None
+        self._tasks: Set["asyncio.Task[None]"] = set()
+        self._waiting = 0
+        self._counters = {"requests": 0, "rejected": 0, "failed": 0}
+
+    # -- lifecycle ----------------------------------------------------------
+
+    async def open(self) -> None:
+        """Start maintaining the connections on the running loop (the only loop that may call request())."""
+        self._loop = asyncio.get_running_loop()
+        self._changed = asyncio.Condition()
+        for conn in self._connections:
+            task = self._loop.create_task(self._maintain(conn))
+            self._tasks.add(task)
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    # -- requests -----------------------------------------------------------
+
+    async def request(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Send `payload` on a pooled connection and return the bridge response.
+        Must run on the loop that opened the pool. Raises PoolOverloaded when no slot is free
+        and the pending queue is full, ConnectionError when the bridge is
+        unreachable or the connection drops before the response.
+        """
+        payload.setdefault("request_id", f"http_{uuid4().hex[:12]}")
+        key = str(payload["request_id"])
+        loop = asyncio.get_running_loop()
+        assert self._changed is not None, "pool not opened"
+        self._counters["requests"] += 1
+        async with self._changed:
+            conn = self._pick(key)
+            if conn is None:
+                if self._waiting >= self.max_pending:
+                    self._counters["rejected"] += 1
+                    raise PoolOverloaded(
+                        f"ws client pool overloaded: {self.size * self.max_inflight} requests "
+                        f"in flight and {self._waiting} waiting; retry later"
+                    )
+                self._waiting += 1
+                try:
+                    conn = await self._wait_for_slot(key)
+                except ConnectionError:
+                    self._counters["failed"] += 1
+                    raise
+                finally:
+                    self._waiting -= 1
+            ws = conn.ws
+            response: "asyncio.Future[Dict[str, Any]]" = loop.create_future()
+            conn.waiters[key] = response
+        try:
+            try:
+                await ws.send(json.dumps(payload))
+            except ConnectionClosed as exc:
+                raise ConnectionError(f"WS bridge connection lost: {exc}") from exc
+            return await response
+        except BaseException:
+            self._counters["failed"] += 1
+            raise
+        finally:
+            if conn.waiters.get(key) is response:
+                del conn.waiters[key]
+            async with self._changed:
+                self._changed.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        connections: List[Dict[str, Any]] = [conn.stats() for conn in self._connections]
+        return {
+            "url": self.url,
+            "connections_open": sum(1 for item in connections if item["open"]),
+            "in_flight": sum(item["in_flight"] for item in connections),
+            "waiting": self._waiting,
+            "max_inflight": self.size * self.max_inflight,
+            "max_pending": self.max_pending,
+            **self._counters,
+            "connections": connections,
+        }
+
+    # -- internals ----------------------------------------------------------
+
+    def _pick(self, key: str) -> Optional[_Connection]:
+        """Least busy open connection with a free slot that is not already carrying `key`."""
+        candidates = [
+            conn for conn in self._connections
+            if conn.ws is not None and len(conn.waiters) < self.max_inflight and key not in conn.waiters
+        ]
+        return min(candidates, key=lambda conn: len(conn.waiters), default=None)
+
+    async def _wait_for_slot(self, key: str) -> _Connection:
+        # Caller holds self._changed.
+        unavailable_since: Optional[float] = None
+        while True:
+            conn = self._pick(key)
+            if conn is not None:
+                return conn
+            timeout = None
+            if all(other.ws is None for other in self._connections):
+                now = self._loop.time()
+                unavailable_since = unavailable_since or now
+                timeout = self.connect_wait_sec - (now - unavailable_since)
+                if timeout <= 0:
+                    errors = {other.last_error for other in self._connections if other.last_error}
+                    raise ConnectionError(
+                        f"WS bridge unavailable at {self.url}: {'; '.join(sorted(errors)) or 'not connected'}"
+                    )
+            else:
+                unavailable_since = None
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _maintain(self, conn: _Connection) -> None:
+        """Keep `conn` open: connect, read responses until it closes, back off, repeat."""
+        delay = RECONNECT_MIN_SEC
+        while True:
+            try:
+                ws = await connect(
+                    self.url,
+                    ping_interval=self.ping_interval_sec,
+                    ping_timeout=self.ping_interval_sec,
+                    open_timeout=self.connect_wait_sec,
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                conn.last_error = f"connect failed: {exc}"
+                # Jitter keeps the pool's connections from reconnecting in lockstep.
+                await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+                delay = min(delay * 2, self.reconnect_max_sec)
+                continue
+
+            delay = RECONNECT_MIN_SEC
+            conn.ws = ws
+            conn.connects += 1
+            conn.last_error = None
+            async with self._changed:
+                self._changed.notify_all()
+            try:
+                async for raw in ws:
+                    self._dispatch(conn, raw)
+            except ConnectionClosed as exc:
+                conn.last_error = f"connection closed: {exc}"
+            finally:
+                conn.ws = None
+                lost = ConnectionError(f"WS bridge connection lost: {conn.last_error or 'closed'}")
+                for waiter in conn.waiters.values():
+                    if not waiter.done():
+                        waiter.set_exception(lost)
+                with contextlib.suppress(Exception):
+                    await ws.close()
+            async with self._changed:
+                self._changed.notify_all()
+
+    @staticmethod
+    def _dispatch(conn: _Connection, raw: Any) -> None:
+        try:
+            frame = json.loads(raw)
+        except json.JSONDecodeError:
+            return
+        # Only final responses are matched; `chunk`/`decision` frames are not requested.
+        if not isinstance(frame, dict) or frame.get("type") != "response":
+            return
+        waiter = conn.waiters.get(str(frame.get("request_id")))
+        if waiter is not None and not waiter.done():
+            waiter.set_result(frame)